@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        import api.signals  # noqa: F401
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate
+        from .search import install_search_schema_on_migrate
+        from .slow_queries import install_slow_query_wrapper
+        from .timing import install as install_timing
+
+        post_migrate.connect(install_search_schema_on_migrate, sender=self)
+        install_timing()
+        connection_created.connect(install_slow_query_wrapper)
@@ -0,0 +1,153 @@
+"""Per-process prefix index for title autocomplete.
+
+Titles and slugs of every service and course are normalized (accents folded,
+case-folded, punctuation collapsed to single spaces) and stored as a sorted
+list of keys: the whole title, the title from each later word onwards, and
+the slug. A lookup is a ``bisect`` to the first key starting with the query
+followed by a scan while keys still match, so typing "autom" finds
+"Curso de Automatización" without touching the database.
+
+The index is rebuilt lazily when the response-cache generation of either
+model moves (see ``api.signals``), so publishing, editing or deleting a row
+is picked up on the next lookup in every process (the generations live in
+the shared cache). An index older than ``AUTOCOMPLETE_INDEX_TTL_SECONDS`` is
+rebuilt as well, which bounds staleness if a bump is ever lost. The rows
+behind a generation are loaded through the ``autocomplete`` tiered cache, so
+after a change one worker queries the database and the others read its
+result.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from .cache import get_cache
+from .response_cache import get_generations
+from .text import normalize
+
+# Lower weights sort first.
+WEIGHT_TITLE_PREFIX = 0
+WEIGHT_WORD_PREFIX = 1
+WEIGHT_SLUG_PREFIX = 2
+
+
+@dataclass(frozen=True)
+class Suggestion:
+    kind: str
+    id: int
+    slug: str
+    title: str
+    draft: bool
+
+
+def _keys(suggestion):
+    title = normalize(suggestion.title)
+    if title:
+        yield title, WEIGHT_TITLE_PREFIX
+        words = title.split(" ")
+        for position in range(1, len(words)):
+            yield " ".join(words[position:]), WEIGHT_WORD_PREFIX
+    slug = normalize(suggestion.slug)
+    if slug and slug != title:
+        yield slug, WEIGHT_SLUG_PREFIX
+
+
+class PrefixIndex:
+    def __init__(self, suggestions):
+        self.suggestions = list(suggestions)
+        rows = sorted(
+            (key, weight, position)
+            for position, suggestion in enumerate(self.suggestions)
+            for key, weight in _keys(suggestion)
+        )
+        self._keys = [row[0] for row in rows]
+        self._refs = [(row[1], row[2]) for row in rows]
+
+    def __len__(self):
+        return len(self.suggestions)
+
+    def lookup(self, query, *, kinds=None, include_drafts=False, limit=8):
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        best = {}
+        index = bisect_left(self._keys, prefix)
+        while index < len(self._keys) and self._keys[index].startswith(prefix):
+            weight, position = self._refs[index]
+            index += 1
+            suggestion = self.suggestions[position]
+            if suggestion.draft and not include_drafts:
+                continue
+            if kinds and suggestion.kind not in kinds:
+                continue
+            if weight < best.get(position, weight + 1):
+                best[position] = weight
+        ranked = sorted(
+            best.items(),
+            key=lambda item: (item[1], len(self.suggestions[item[0]].title), normalize(self.suggestions[item[0]].title)),
+        )
+        return [self.suggestions[position] for position, _weight in ranked[:limit]]
+
+
+def _load_suggestions():
+    from courses.models import Course
+    from services.models import Service
+
+    for kind, model in (("service", Service), ("course", Course)):
+        for pk, slug, title, draft in model.objects.values_list("pk", "slug", "title", "draft"):
+            yield Suggestion(kind, pk, slug, title, bool(draft))
+
+
+def _cached_suggestions(generations):
+    key = "suggestions:" + ".".join(str(value) for value in generations)
+    return get_cache("autocomplete").get_or_set(
+        key, lambda: list(_load_suggestions()), ttl=settings.AUTOCOMPLETE_INDEX_TTL_SECONDS,
+    )
+
+
+def _labels():
+    from courses.models import Course
+    from services.models import Service
+
+    return [Service._meta.label_lower, Course._meta.label_lower]
+
+
+_index = None
+_index_generations = None
+_index_expires_at = 0.0
+_index_lock = threading.Lock()
+
+
+def _is_current(generations):
+    return _index is not None and _index_generations == generations and time.monotonic() < _index_expires_at
+
+
+def get_autocomplete_index():
+    """Return the current index, rebuilding it if a source model changed or it expired."""
+    global _index, _index_generations, _index_expires_at
+    generations = tuple(get_generations(_labels()))
+    if _is_current(generations):
+        return _index
+    with _index_lock:
+        if not _is_current(generations):
+            _index = PrefixIndex(_cached_suggestions(generations))
+            _index_generations = generations
+            _index_expires_at = time.monotonic() + settings.AUTOCOMPLETE_INDEX_TTL_SECONDS
+        return _index
+
+
+def reset_autocomplete_index():
+    global _index, _index_generations, _index_expires_at
+    with _index_lock:
+        _index = None
+        _index_generations = None
+        _index_expires_at = 0.0
+
+
+def autocomplete(query, *, kinds=None, include_drafts=False, limit=8):
+    return get_autocomplete_index().lookup(
+        query, kinds=kinds, include_drafts=include_drafts, limit=limit,
+    )
@@ -0,0 +1,530 @@
+"""API latency benchmark, driven by ``manage.py bench_api``.
+
+``seed`` fills the database with a deterministic dataset: ``scale`` courses
+and services, ``scale`` users spread over the courses as enrollments, one
+user per client, and a Terms PDF. ``run`` then drives the main endpoints
+with ``clients`` concurrent clients. Each client makes ``requests``
+iterations of every scenario:
+
+* in-process through the Django test client (``transport="client"``), which
+  measures the application alone; or
+* over HTTP against a local threaded WSGI server (``transport="server"``).
+  This adds a TCP connection, HTTP parsing and, as with ``runserver``, a
+  database connection per request.
+
+Every request sends ``X-Server-Timing: 1``. ``api.timing`` then counts its
+queries in the route histograms, which is where the query counts come from.
+Run it against a throwaway database (``isolated_database``). Inside
+``bench_environment``, auth throttles are off, every cache alias is a private
+LocMem cache and BillionMail is replaced by a local sink, so the enrollment
+emails are built and posted but go nowhere.
+"""
+
+import json
+import logging
+import math
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from datetime import time as clock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import django
+import requests
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+from django.db import connection, connections, transaction
+from django.test import Client, override_settings
+from django.urls import resolve
+from django.utils import timezone as django_timezone
+
+from .cache import clear_local_caches
+from .timing import reset_route_timing_stats, route_timing_stats
+
+logger = logging.getLogger(__name__)
+
+COURSES_URL = "/api/courses/courses/"
+SERVICES_URL = "/api/services/"
+SIGNIN_URL = "/api/users/signin/"
+TIMING_HEADERS = {"X-Server-Timing": "1"}
+# Only ever stored in the throwaway benchmark database
+PASSWORD = "bench-password"
+MAX_ENROLLMENTS_PER_COURSE = 20
+COURSE_PRICES = (None, 25, 90, 250)
+COMPARED_METRICS = ("p50_ms", "p95_ms", "p99_ms", "throughput_rps", "queries_per_request")
+
+
+@dataclass
+class Dataset:
+    scale: int
+    course_slugs: list
+    enroll_slug: str
+    usernames: list
+    tokens: list
+    terms: object
+
+    @property
+    def terms_url(self):
+        return f"/api/terms/{self.terms.pk}/download/"
+
+
+def _pdf(size):
+    """A PDF-looking file of ``size`` bytes. Its content is never parsed."""
+    head, tail = b"%PDF-1.4\n", b"\n%%EOF\n"
+    return head + b"%" * max(size - len(head) - len(tail), 0) + tail
+
+
+def seed(scale, *, clients=1, seed=0, pdf_kb=256):
+    """Create the benchmark dataset. The same arguments always give the same rows."""
+    from authentication.utils import issue_token
+    from courses.models import Course, Enrollment
+    from services.models import Service
+    from terms.models import Terms
+    from users.models import CustomUser
+
+    rng = random.Random(seed)
+    password = make_password(PASSWORD)  # hashed once: hashing is slow on purpose
+    verified = django_timezone.now()
+    # Unenrolling closes 24 hours before the start
+    start = django_timezone.localdate() + timedelta(days=30)
+
+    def user(username, **extra):
+        return CustomUser(
+            username=username, email=f"{username}@bench.invalid", password=password, name=username,
+            surname="Bench", email_verified_at=verified, **extra,
+        )
+
+    with transaction.atomic():
+        author = user("bench-admin", is_staff=True, is_superuser=True)
+        author.save()
+        members = CustomUser.objects.bulk_create([user(f"bench-member-{index}") for index in range(scale)])
+        client_users = CustomUser.objects.bulk_create([user(f"bench-client-{index}") for index in range(clients)])
+
+        courses = []
+        for index in range(scale):
+            start_date = start + timedelta(days=rng.randrange(60))
+            courses.append(Course(
+                title=f"Bench course {index}", slug=f"bench-course-{index}", subtitle="Benchmark course",
+                description="Generated **course** for the API benchmark.\n\n- one\n- two",
+                image=f"course_images/bench-course-{index}.png", price=rng.choice(COURSE_PRICES),
+                location="Online", start_date=start_date, end_date=start_date + timedelta(weeks=rng.randrange(1, 8)),
+                start_time=clock(10), end_time=clock(12), periodicity="weekly",
+                weekdays=sorted(rng.sample(range(5), 2)), max_attendants=rng.randrange(10, 60), draft=False,
+            ))
+        courses = Course.objects.bulk_create(courses)
+        # bulk_create: no image variants to build for images that do not exist
+        [enroll_course] = Course.objects.bulk_create([Course(
+            title="Bench enrollment course", slug="bench-enroll", subtitle="Benchmark course",
+            description="Course the enrollment scenario joins and leaves.", image="course_images/bench-enroll.png",
+            location="Online", start_date=start, end_date=start, start_time=clock(10), end_time=clock(12),
+            periodicity="once", max_attendants=clients + MAX_ENROLLMENTS_PER_COURSE, draft=False,
+        )])
+        enrollments = []
+        for course in [*courses, enroll_course]:
+            # Leave the enrollment course a seat per client
+            capacity = course.max_attendants - (clients if course is enroll_course else 0)
+            count = min(rng.randrange(MAX_ENROLLMENTS_PER_COURSE), capacity, len(members))
+            enrollments.extend(Enrollment(user=member, course=course) for member in rng.sample(members, count))
+        Enrollment.objects.bulk_create(enrollments)
+
+        Service.objects.bulk_create([
+            Service(
+                type=Service.SERVICE, title=f"Bench service {index}", slug=f"bench-service-{index}",
+                subtitle="Benchmark service", description="Generated **service** for the API benchmark.",
+                color="141413", icon="Bot", created_by=author,
+            )
+            for index in range(scale)
+        ])
+        terms = Terms.objects.create(
+            tag="terms", name="Bench terms", version="1.0", author=author,
+            pdf_content=ContentFile(_pdf(pdf_kb * 1024), name="bench-terms.pdf"),
+        )
+        tokens = [issue_token(client_user).key for client_user in client_users]
+
+    return Dataset(
+        scale=scale,
+        course_slugs=[course.slug for course in courses],
+        enroll_slug=enroll_course.slug,
+        usernames=[client_user.username for client_user in client_users],
+        tokens=tokens,
+        terms=terms,
+    )
+
+
+def cleanup(dataset):
+    """Remove what the dataset stored outside the database."""
+    dataset.terms.delete()
+
+
+# Scenarios yield (operation, method, path, data, token) for one iteration of
+# one client. They run in this order; signin may rotate the clients' tokens, so
+# it comes last.
+
+def _course_list(dataset, client, rng):
+    yield "courses.list", "GET", COURSES_URL, None, None
+
+
+def _course_detail(dataset, client, rng):
+    yield "courses.detail", "GET", f"{COURSES_URL}{rng.choice(dataset.course_slugs)}/", None, None
+
+
+def _service_list(dataset, client, rng):
+    yield "services.list", "GET", SERVICES_URL, None, None
+
+
+def _enroll(dataset, client, rng):
+    path = f"{COURSES_URL}{dataset.enroll_slug}/"
+    yield "courses.enroll", "POST", f"{path}enroll/", None, dataset.tokens[client]
+    yield "courses.unenroll", "POST", f"{path}unenroll/", None, dataset.tokens[client]
+
+
+def _terms_download(dataset, client, rng):
+    yield "terms.download", "GET", dataset.terms_url, None, None
+
+
+def _signin(dataset, client, rng):
+    yield "users.signin", "POST", SIGNIN_URL, {"emailOrUsername": dataset.usernames[client], "password": PASSWORD}, None
+
+
+SCENARIOS = {
+    "courses.list": _course_list,
+    "courses.detail": _course_detail,
+    "services.list": _service_list,
+    "courses.enroll": _enroll,
+    "terms.download": _terms_download,
+    "users.signin": _signin,
+}
+
+
+def _headers(token):
+    if token is None:
+        return TIMING_HEADERS
+    return {**TIMING_HEADERS, "Authorization": f"Token {token}"}
+
+
+class ClientTransport:
+    """Requests through the Django test client, in the calling thread."""
+
+    def __init__(self):
+        self.client = Client(raise_request_exception=False)
+
+    def request(self, method, path, data, token):
+        if method == "GET":
+            response = self.client.get(path, headers=_headers(token))
+        else:
+            response = self.client.generic(
+                method, path, b"" if data is None else json.dumps(data), content_type="application/json",
+                headers=_headers(token),
+            )
+        if response.streaming:
+            # The test client closes the response once its content is consumed
+            for _chunk in response.streaming_content:
+                pass
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class ServerTransport:
+    """Requests over HTTP, on a new connection each.
+
+    Keep-alive connections to the development server stall on delayed ACKs,
+    which would add about 40ms to every request.
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    def request(self, method, path, data, token):
+        response = self.session.request(
+            method, self.base_url + path, json=data, headers={**_headers(token), "Connection": "close"},
+            allow_redirects=False, timeout=60,
+        )
+        return response.status_code
+
+    def close(self):
+        self.session.close()
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def local_server():
+    """Serve the project's WSGI application on a free local port; yields its base URL."""
+    server = ThreadedWSGIServer(("127.0.0.1", 0), _QuietHandler, allow_reuse_address=False)
+    server.set_app(get_internal_wsgi_application())
+    thread = threading.Thread(target=server.serve_forever, name="bench-server", daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+class _MailSinkHandler(BaseHTTPRequestHandler):
+    """Accepts BillionMail ``/send`` calls and drops them."""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        body = b"{}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _private_caches():
+    return {
+        alias: {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": f"ordinaly-bench-{alias}",
+            "TIMEOUT": config.get("TIMEOUT", 300),
+        }
+        for alias, config in settings.CACHES.items()
+    }
+
+
+def _clear_process_caches():
+    from users.services.token_cache import get_token_cache
+
+    from .autocomplete import reset_autocomplete_index
+
+    clear_local_caches()
+    get_token_cache().clear()
+    reset_autocomplete_index()
+
+
+@contextmanager
+def bench_environment():
+    """Settings for a run: no auth throttles, the test client's host allowed, mail to a local sink.
+
+    Every cache alias (``shared`` included) is replaced by a private LocMem
+    cache and the per-process layers in front of them are emptied, so entries
+    built from another database are never served and the run's own writes
+    never reach the configured caches.
+    """
+    sink = ThreadingHTTPServer(("127.0.0.1", 0), _MailSinkHandler)
+    thread = threading.Thread(target=sink.serve_forever, name="bench-mail-sink", daemon=True)
+    thread.start()
+    _clear_process_caches()
+    try:
+        with override_settings(
+            AUTH_THROTTLE_ENABLED=False,
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+            BILLIONMAIL_BASE_URL=f"http://127.0.0.1:{sink.server_address[1]}",
+            CACHES=_private_caches(),
+        ):
+            try:
+                yield
+            finally:
+                for cache in caches.all():
+                    cache.clear()
+    finally:
+        _clear_process_caches()
+        sink.shutdown()
+        sink.server_close()
+        thread.join()
+
+
+@contextmanager
+def isolated_database():
+    """Swap the default database for a fresh one, created and migrated like the test runner's."""
+    saved = {key: dict(connection.settings_dict.get(key) or {}) for key in ("TEST", "OPTIONS")}
+    test_settings = connection.settings_dict.setdefault("TEST", {})
+    if connection.vendor == "sqlite":
+        if not test_settings.get("NAME"):
+            # The test runner would use an in-memory database, which threads cannot share
+            test_settings["NAME"] = os.path.join(tempfile.gettempdir(), "ordinaly-bench.sqlite3")
+        # Take the write lock when a transaction starts, so concurrent clients
+        # wait for it instead of failing with "database is locked"
+        connection.settings_dict.setdefault("OPTIONS", {}).setdefault("transaction_mode", "IMMEDIATE")
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        connection.settings_dict.update(saved)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of the sorted ``values``."""
+    if not values:
+        return None
+    return values[max(math.ceil(pct / 100 * len(values)), 1) - 1]
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def summarize(samples, wall, stats=None):
+    """Latency percentiles, throughput and error count for one operation's ``(status, seconds)`` samples."""
+    durations = sorted(elapsed for _status, elapsed in samples)
+    statuses = Counter(str(status) for status, _elapsed in samples)
+    summary = {
+        "requests": len(samples),
+        "errors": sum(1 for status, _elapsed in samples if not 200 <= status < 400),
+        "statuses": dict(sorted(statuses.items())),
+        "p50_ms": _ms(percentile(durations, 50)),
+        "p95_ms": _ms(percentile(durations, 95)),
+        "p99_ms": _ms(percentile(durations, 99)),
+        "mean_ms": _ms(sum(durations) / len(durations)) if durations else None,
+        "max_ms": _ms(durations[-1]) if durations else None,
+        "throughput_rps": round(len(samples) / wall, 2) if wall else None,
+        "queries_per_request": None,
+    }
+    if stats and stats["sampled"]:
+        summary["queries_per_request"] = round(stats["queries"] / stats["sampled"], 2)
+    return summary
+
+
+def _route(method, path):
+    return f"{method} {resolve(path).view_name}"
+
+
+def _run_scenario(name, dataset, make_transport, *, clients, iterations, warmup, seed):
+    steps = SCENARIOS[name]
+
+    # Warm lazy imports, compiled templates and caches outside the measurement
+    transport = make_transport()
+    rng = random.Random(f"{seed}:{name}:warmup")
+    try:
+        for _ in range(warmup):
+            for _operation, method, path, data, token in steps(dataset, 0, rng):
+                transport.request(method, path, data, token)
+    finally:
+        transport.close()
+    reset_route_timing_stats()
+
+    samples = {}
+    routes = {}
+    lock = threading.Lock()
+
+    def client_loop(client):
+        transport = make_transport()
+        rng = random.Random(f"{seed}:{name}:{client}")
+        recorded = []
+        try:
+            for _ in range(iterations):
+                for operation, method, path, data, token in steps(dataset, client, rng):
+                    started = time.perf_counter()
+                    try:
+                        status = transport.request(method, path, data, token)
+                    except Exception:
+                        logger.warning("Benchmark request %s %s failed", method, path, exc_info=True)
+                        status = 0
+                    recorded.append((operation, _route(method, path), status, time.perf_counter() - started))
+        finally:
+            transport.close()
+            if threading.current_thread() is not threading.main_thread():
+                connections.close_all()
+        with lock:
+            for operation, route, status, elapsed in recorded:
+                samples.setdefault(operation, []).append((status, elapsed))
+                routes[operation] = route
+
+    started = time.perf_counter()
+    if clients == 1:
+        client_loop(0)
+    else:
+        threads = [threading.Thread(target=client_loop, args=(client,), name=f"bench-client-{client}")
+                   for client in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    wall = time.perf_counter() - started
+
+    stats = route_timing_stats()
+    return {
+        operation: summarize(operation_samples, wall, stats.get(routes[operation]))
+        for operation, operation_samples in samples.items()
+    }
+
+
+@contextmanager
+def _transports(transport):
+    if transport == "client":
+        yield ClientTransport
+    elif transport == "server":
+        with local_server() as base_url:
+            yield lambda: ServerTransport(base_url)
+    else:
+        raise ValueError(f"unknown transport {transport!r}")
+
+
+def run(dataset, *, scenarios=None, clients=1, requests=50, warmup=5, transport="client", seed=0):
+    """Run the scenarios one after another and summarize each operation."""
+    selected = [name for name in SCENARIOS if scenarios is None or name in scenarios]
+    if len(dataset.tokens) < clients:
+        raise ValueError(f"the dataset was seeded for {len(dataset.tokens)} clients, not {clients}")
+
+    with _transports(transport) as make_transport:
+        results = {}
+        for name in selected:
+            results.update(_run_scenario(
+                name, dataset, make_transport, clients=clients, iterations=requests, warmup=warmup, seed=seed,
+            ))
+    return results
+
+
+def _git(*args):
+    try:
+        result = subprocess.run(
+            ["git", *args], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=10, check=True,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip()
+
+
+def environment():
+    """What a result depends on besides the code: commit, versions and database."""
+    commit = _git("rev-parse", "HEAD")
+    changes = _git("status", "--porcelain", "--untracked-files=no") if commit else None
+    return {
+        "commit": commit,
+        "dirty": bool(changes) if changes is not None else None,
+        "at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+    }
+
+
+def _change(before, after):
+    if before is None or after is None or before == 0:
+        return None
+    return round((after - before) / before * 100, 1)
+
+
+def compare(results, baseline):
+    """Per operation, the change of each compared metric against ``baseline``, in percent."""
+    return {
+        operation: {metric: _change(baseline[operation].get(metric), summary.get(metric)) for metric in COMPARED_METRICS}
+        for operation, summary in results.items()
+        if operation in baseline
+    }
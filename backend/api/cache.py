@@ -0,0 +1,336 @@
+"""Two-tier cache shared by the project.
+
+``TieredCache`` puts a small per-process LRU (L1) in front of a Django cache
+alias (L2, ``TIERED_CACHE_L2_ALIAS``) that every worker can see. Each
+namespace has a version stored in L2; bumping it orphans every key in the
+namespace at once. Workers keep the version in L1 for
+``TIERED_CACHE_VERSION_TTL_SECONDS``, so a hit costs no L2 round trip and a
+bump reaches other workers within that window.
+
+``get_or_set`` protects expensive computations against stampedes in two ways:
+
+* probabilistic early refresh: as an entry nears expiry, a request may
+  recompute it ahead of time. The odds grow with how long the value took to
+  compute, so hot keys are refreshed before they expire instead of all at once
+  afterwards;
+* singleflight: concurrent misses for the same key wait for one computation.
+  Threads coalesce on an in-process event; other workers coalesce on a short
+  lock held in L2 and then read the fresh value from there.
+"""
+
+import logging
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "tc"
+
+
+class LocalLRUCache:
+    """Bounded, thread-safe in-process LRU with a per-entry TTL."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TieredCache:
+    """L1 LRU + shared L2 cache for one namespace. Use ``get_cache`` to obtain one."""
+
+    def __init__(self, namespace, *, ttl=None, l1_size=None, l1_ttl=None, l2_alias=None):
+        self.namespace = namespace
+        self.ttl = ttl if ttl is not None else settings.TIERED_CACHE_DEFAULT_TTL_SECONDS
+        self.l1 = LocalLRUCache(
+            maxsize=l1_size if l1_size is not None else settings.TIERED_CACHE_L1_SIZE,
+            ttl=l1_ttl if l1_ttl is not None else settings.TIERED_CACHE_L1_TTL_SECONDS,
+        )
+        self.l2_alias = l2_alias or settings.TIERED_CACHE_L2_ALIAS
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "l1_hits": 0,
+            "l2_hits": 0,
+            "misses": 0,
+            "computes": 0,
+            "early_refreshes": 0,
+            "coalesced": 0,
+            "l2_errors": 0,
+        }
+
+    @property
+    def l2(self):
+        return caches[self.l2_alias]
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    # Versioning
+
+    def _version_key(self):
+        return f"{KEY_PREFIX}:{self.namespace}:version"
+
+    def version(self):
+        key = self._version_key()
+        value = self.l1.get(key)
+        if value is not None:
+            return value
+        try:
+            value = self.l2.get(key)
+            if value is None:
+                # Seed from the clock so a lost version never reuses old keys.
+                self.l2.add(key, time.time_ns(), timeout=None)
+                value = self.l2.get(key)
+        except Exception:
+            self._count("l2_errors")
+            logger.warning("Cache version lookup failed for %s", self.namespace, exc_info=True)
+            value = None
+        if value:
+            self.l1.set(key, value, ttl=settings.TIERED_CACHE_VERSION_TTL_SECONDS)
+        return value or 0
+
+    def bump_version(self):
+        """Invalidate every key in the namespace."""
+        key = self._version_key()
+        try:
+            self.l2.incr(key)
+        except ValueError:
+            self.l2.add(key, time.time_ns(), timeout=None)
+        self.l1.clear()
+
+    def make_key(self, key, version=None):
+        version = self.version() if version is None else version
+        return f"{KEY_PREFIX}:{self.namespace}:{version}:{key}"
+
+    # Raw entry access. Entries are dicts holding the value, the wall-clock
+    # expiry and how long the value took to compute (for early refresh).
+
+    def _read(self, full_key):
+        entry = self.l1.get(full_key)
+        if entry is not None:
+            self._count("l1_hits")
+            return entry
+        try:
+            entry = self.l2.get(full_key)
+        except Exception:
+            self._count("l2_errors")
+            logger.warning("L2 cache read failed for %s", self.namespace, exc_info=True)
+            entry = None
+        if entry is not None:
+            self._count("l2_hits")
+            self.l1.set(full_key, entry, ttl=max(entry["expires_at"] - time.time(), 0))
+            return entry
+        self._count("misses")
+        return None
+
+    def _write(self, full_key, value, ttl, delta=0.0):
+        entry = {"value": value, "expires_at": time.time() + ttl, "delta": delta}
+        self.l1.set(full_key, entry, ttl=ttl)
+        try:
+            self.l2.set(full_key, entry, timeout=ttl)
+        except Exception:
+            self._count("l2_errors")
+            logger.warning("L2 cache write failed for %s", self.namespace, exc_info=True)
+        return entry
+
+    # Public API
+
+    def get(self, key, default=None):
+        entry = self._read(self.make_key(key))
+        if entry is None or entry["expires_at"] <= time.time():
+            return default
+        return entry["value"]
+
+    def set(self, key, value, ttl=None):
+        self._write(self.make_key(key), value, self.ttl if ttl is None else ttl)
+
+    def delete(self, key):
+        full_key = self.make_key(key)
+        self.l1.delete(full_key)
+        try:
+            self.l2.delete(full_key)
+        except Exception:
+            self._count("l2_errors")
+            logger.warning("L2 cache delete failed for %s", self.namespace, exc_info=True)
+
+    def should_refresh_early(self, entry, now=None):
+        """XFetch: recompute before expiry with probability rising as it nears."""
+        now = time.time() if now is None else now
+        delta = entry.get("delta") or 0.0
+        if delta <= 0:
+            return now >= entry["expires_at"]
+        beta = settings.TIERED_CACHE_EARLY_REFRESH_BETA
+        return now - delta * beta * math.log(1.0 - random.random()) >= entry["expires_at"]
+
+    def get_or_set(self, key, compute, ttl=None):
+        """Return the cached value for ``key``, computing it at most once at a time."""
+        ttl = self.ttl if ttl is None else ttl
+        full_key = self.make_key(key)
+        entry = self._read(full_key)
+        now = time.time()
+        if entry is not None and entry["expires_at"] > now:
+            if not self.should_refresh_early(entry, now):
+                return entry["value"]
+            self._count("early_refreshes")
+            # Serve the still-valid value if someone else is already refreshing.
+            return self._singleflight(full_key, compute, ttl, stale=entry)
+        return self._singleflight(full_key, compute, ttl)
+
+    def _singleflight(self, full_key, compute, ttl, stale=None):
+        with self._flights_lock:
+            flight = self._flights.get(full_key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[full_key] = _Flight()
+
+        if not leader:
+            self._count("coalesced")
+            if stale is not None:
+                return stale["value"]
+            flight.event.wait(settings.TIERED_CACHE_LOCK_TIMEOUT_SECONDS)
+            if flight.error is not None:
+                raise flight.error
+            if flight.event.is_set():
+                return flight.value
+            return compute()
+
+        try:
+            flight.value = self._compute_with_shared_lock(full_key, compute, ttl, stale)
+            return flight.value
+        except Exception as exc:
+            flight.error = exc
+            raise
+        finally:
+            flight.event.set()
+            with self._flights_lock:
+                self._flights.pop(full_key, None)
+
+    def _compute_with_shared_lock(self, full_key, compute, ttl, stale):
+        lock_key = f"{full_key}:lock"
+        lock_timeout = settings.TIERED_CACHE_LOCK_TIMEOUT_SECONDS
+        try:
+            acquired = self.l2.add(lock_key, 1, timeout=math.ceil(lock_timeout))
+        except Exception:
+            self._count("l2_errors")
+            acquired = True
+
+        if not acquired:
+            # Another worker is computing this key.
+            self._count("coalesced")
+            if stale is not None:
+                return stale["value"]
+            deadline = time.monotonic() + lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(settings.TIERED_CACHE_LOCK_POLL_SECONDS)
+                try:
+                    entry = self.l2.get(full_key)
+                except Exception:
+                    entry = None
+                if entry is not None:
+                    self.l1.set(full_key, entry, ttl=max(entry["expires_at"] - time.time(), 0))
+                    return entry["value"]
+
+        try:
+            started = time.monotonic()
+            value = compute()
+            self._count("computes")
+            self._write(full_key, value, ttl, delta=time.monotonic() - started)
+            return value
+        finally:
+            if acquired:
+                try:
+                    self.l2.delete(lock_key)
+                except Exception:
+                    self._count("l2_errors")
+
+    def clear_local(self):
+        self.l1.clear()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["l1_hits"] + stats["l2_hits"] + stats["misses"]
+        stats["l1_size"] = len(self.l1)
+        stats["hit_ratio"] = (stats["l1_hits"] + stats["l2_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def reset_stats(self):
+        with self._stats_lock:
+            for name in self._stats:
+                self._stats[name] = 0
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def get_cache(namespace, **options):
+    """Return the process-wide ``TieredCache`` for ``namespace``.
+
+    Options only apply the first time a namespace is requested.
+    """
+    cache = _registry.get(namespace)
+    if cache is None:
+        with _registry_lock:
+            cache = _registry.get(namespace)
+            if cache is None:
+                cache = _registry[namespace] = TieredCache(namespace, **options)
+    return cache
+
+
+def cache_stats():
+    """Hit/miss counters for every namespace used in this process."""
+    return {namespace: cache.stats() for namespace, cache in sorted(_registry.items())}
+
+
+def clear_local_caches():
+    for cache in list(_registry.values()):
+        cache.clear_local()
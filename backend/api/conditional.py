@@ -0,0 +1,106 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.http import HttpResponseNotModified
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework.response import Response
+
+
+class ConditionalGetMixin:
+    """Emit ETag/Last-Modified on ``list``/``retrieve`` and answer 304 early.
+
+    List validators come from one aggregate over the filtered queryset
+    (``max(updated_at)`` plus the row count, and any extra aggregates from
+    ``get_validator_aggregates``); detail validators come from the object's
+    ``updated_at`` plus ``get_object_validator_parts``. Matching
+    ``If-None-Match``/``If-Modified-Since`` requests get a 304 before the
+    serializer runs.
+
+    Lists never answer ``If-Modified-Since`` alone: deleting any row but the
+    newest leaves ``max(updated_at)`` where it was, and only the ETag (which
+    includes the row count) notices. Views whose detail payload can change
+    without ``updated_at`` moving (e.g. a related row being deleted) should
+    set ``trust_if_modified_since = False`` so only the ETag can produce a 304
+    there either.
+    """
+
+    modified_field = "updated_at"
+    trust_if_modified_since = True
+
+    def get_validator_aggregates(self):
+        """Extra aggregates for list validators, for payloads built from related rows."""
+        return {}
+
+    def get_object_validator_parts(self, instance):
+        """Extra values for detail validators, for payloads built from related rows."""
+        return ()
+
+    def get_validator_salt(self):
+        """Extra input mixed into every ETag, for time-dependent payloads."""
+        return ""
+
+    def _validator_audience(self, request):
+        user = getattr(request, "user", None)
+        return "staff" if getattr(user, "is_staff", False) else "public"
+
+    def _make_etag(self, request, *parts):
+        source = "|".join(
+            str(part) for part in (request.get_full_path(), self._validator_audience(request),
+                                   self.get_validator_salt(), *parts)
+        )
+        return quote_etag(hashlib.sha256(source.encode()).hexdigest()[:32])
+
+    def _honours_if_modified_since(self):
+        return self.trust_if_modified_since and getattr(self, "action", None) != "list"
+
+    def _not_modified(self, request, etag, last_modified):
+        if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+        if if_none_match:
+            etags = parse_etags(if_none_match)
+            return "*" in etags or etag in etags or f"W/{etag}" in etags
+        if not self._honours_if_modified_since():
+            return False
+        if_modified_since = parse_http_date_safe(request.META.get("HTTP_IF_MODIFIED_SINCE") or "")
+        if if_modified_since is not None and last_modified is not None:
+            return int(last_modified.timestamp()) <= if_modified_since
+        return False
+
+    def _conditional_response(self, request, etag, last_modified, handler, *args, **kwargs):
+        if self._not_modified(request, etag, last_modified):
+            response = HttpResponseNotModified()
+        else:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response["ETag"] = etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified.timestamp())
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        values = queryset.order_by().aggregate(
+            _last_modified=Max(self.modified_field),
+            _count=Count("pk", distinct=True),
+            **self.get_validator_aggregates(),
+        )
+        last_modified = values.pop("_last_modified")
+        etag = self._make_etag(
+            request, last_modified and last_modified.isoformat(), values.pop("_count"),
+            *(values[name] for name in sorted(values)),
+        )
+        return self._conditional_response(request, etag, last_modified, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        last_modified = getattr(instance, self.modified_field)
+        etag = self._make_etag(
+            request, instance.pk, last_modified and last_modified.isoformat(),
+            *self.get_object_validator_parts(instance),
+        )
+        # Serialize the instance already loaded for the validators instead of
+        # letting RetrieveModelMixin fetch it a second time.
+        return self._conditional_response(
+            request, etag, last_modified, lambda request, *args, **kwargs: Response(self.get_serializer(instance).data),
+            *args, **kwargs,
+        )
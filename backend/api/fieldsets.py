@@ -0,0 +1,111 @@
+"""Sparse fieldsets for read endpoints: ``?fields=`` and ``?omit=``.
+
+``fields`` takes a comma-separated list of field names and/or preset names
+from ``Meta.field_presets`` (e.g. ``?fields=card`` or ``?fields=card,description``);
+``omit`` removes names from whatever is left. Unknown names are ignored.
+
+Serializers using ``SparseFieldsetsSerializerMixin`` drop the unrequested
+fields when they are built, so their ``SerializerMethodField``s never run.
+Views using ``SparseFieldsetsViewMixin`` narrow the queryset with ``.only()``
+when every requested field maps to known columns: concrete model fields map
+to themselves and everything else must be listed in
+``Meta.field_dependencies`` (an empty list means "no columns needed").
+"""
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = "fields"
+OMIT_PARAM = "omit"
+
+
+def _split(value):
+    return [name.strip() for name in (value or "").split(",") if name.strip()]
+
+
+def requested_fields(request, serializer_class):
+    """Return the set of field names requested for ``serializer_class``, or None for all."""
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    params = getattr(request, "query_params", None) or getattr(request, "GET", {})
+    fields = _split(params.get(FIELDS_PARAM))
+    omit = set(_split(params.get(OMIT_PARAM)))
+    if not fields and not omit:
+        return None
+
+    meta = getattr(serializer_class, "Meta", None)
+    presets = getattr(meta, "field_presets", {})
+    available = list(getattr(meta, "fields", None) or [])
+
+    if fields:
+        selected = set()
+        for name in fields:
+            if name in presets:
+                preset = presets[name]
+                selected.update(available if preset is None else preset)
+            else:
+                selected.add(name)
+    else:
+        selected = set(available)
+    return selected - omit
+
+
+class SparseFieldsetsSerializerMixin:
+    """Drop fields that were not requested via ``?fields=``/``?omit=``."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected = requested_fields(self.context.get("request"), type(self))
+        if selected is None:
+            return
+        for name in list(self.fields):
+            if name not in selected:
+                self.fields.pop(name)
+
+
+def only_columns(model, serializer_class, selected):
+    """Map requested serializer fields to model columns, or None if any is unknown."""
+    dependencies = getattr(getattr(serializer_class, "Meta", None), "field_dependencies", {})
+    columns = {model._meta.pk.name}
+    for name in selected:
+        if name in dependencies:
+            columns.update(dependencies[name])
+            continue
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if not field.concrete or field.many_to_many:
+            return None
+        columns.add(field.name)
+    return columns
+
+
+class SparseFieldsetsViewMixin:
+    """Load only the columns the requested fieldset needs on list/retrieve."""
+
+    sparse_fieldset_actions = ("list", "retrieve")
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if getattr(self, "action", None) not in self.sparse_fieldset_actions:
+            return queryset
+        serializer_class = self.get_serializer_class()
+        selected = requested_fields(self.request, serializer_class)
+        if selected is None:
+            return queryset
+        columns = only_columns(queryset.model, serializer_class, selected)
+        if columns is None:
+            return queryset
+        lookup_field = getattr(self, "lookup_field", None)
+        if lookup_field:
+            columns.add(lookup_field)
+        queryset = queryset.only(*columns)
+        related = queryset.query.select_related
+        if isinstance(related, dict):
+            # A relation cannot be both deferred and traversed: stop joining the dropped ones
+            kept = [name for name in related if name in columns]
+            queryset = queryset.select_related(None)
+            if kept:
+                queryset = queryset.select_related(*kept)
+        return queryset
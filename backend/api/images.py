@@ -0,0 +1,212 @@
+"""Responsive variants for uploaded course and service images.
+
+When a model's image changes, the upload is resized to each width in
+``IMAGE_VARIANT_WIDTHS`` (never upscaled) and encoded in every format of
+``IMAGE_VARIANT_FORMATS`` that this Pillow build supports. Each variant is
+saved next to the original under ``variants/`` with a content hash in its
+name, so URLs can be cached forever. The list of variants is stored on the
+model as a manifest::
+
+    {"source": "course_images/a.png",
+     "variants": [{"name": ..., "width": 320, "format": "webp"}, ...]}
+
+Encoding runs after the transaction commits, on a small thread pool when
+``IMAGE_VARIANTS_ASYNC`` is set (Pillow releases the GIL while encoding).
+The manifest is only written if the row still points at the same source,
+so a quick second upload never gets the first upload's variants.
+"""
+
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps, features
+from rest_framework import serializers
+
+from .response_cache import bump_generation
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = "variants"
+FORMAT_EXTENSIONS = {"avif": "avif", "webp": "webp", "jpeg": "jpg"}
+# Best compression first; also the order <source> elements should use.
+FORMAT_PREFERENCE = ("avif", "webp", "jpeg")
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_VARIANT_WORKERS,
+            thread_name_prefix="image-variants",
+        )
+    return _executor
+
+
+def supported_formats():
+    formats = []
+    for fmt in settings.IMAGE_VARIANT_FORMATS:
+        if fmt == "jpeg" or (fmt in FORMAT_EXTENSIONS and features.check(fmt)):
+            formats.append(fmt)
+    return formats
+
+
+def target_widths(original_width):
+    """Configured widths that don't upscale; the original width if all would."""
+    widths = sorted({width for width in settings.IMAGE_VARIANT_WIDTHS if width <= original_width})
+    return widths or [original_width]
+
+
+def _encode(image, fmt):
+    buffer = BytesIO()
+    quality = settings.IMAGE_VARIANT_QUALITY
+    if fmt == "jpeg":
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+    elif fmt == "webp":
+        image.save(buffer, "WEBP", quality=quality, method=4)
+    else:
+        image.save(buffer, "AVIF", quality=quality)
+    return buffer.getvalue()
+
+
+def variant_name(source_name, width, fmt, content):
+    directory, filename = os.path.split(source_name)
+    stem = os.path.splitext(filename)[0]
+    digest = hashlib.sha256(content).hexdigest()[:16]
+    return os.path.join(directory, VARIANTS_DIR, f"{stem}-{width}w.{digest}.{FORMAT_EXTENSIONS[fmt]}")
+
+
+def generate_variants(storage, source_name):
+    """Encode every variant of ``source_name`` and return the manifest."""
+    with storage.open(source_name, "rb") as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+
+    variants = []
+    for width in target_widths(image.width):
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.Resampling.LANCZOS)
+        for fmt in supported_formats():
+            content = _encode(resized, fmt)
+            # Always save: with content-addressed storage this just adds a
+            # reference for this manifest, and deleting it drops that reference.
+            name = storage.save(variant_name(source_name, width, fmt, content), ContentFile(content))
+            variants.append({"name": name, "width": width, "height": height, "format": fmt})
+    return {"source": source_name, "variants": variants}
+
+
+def delete_variants(storage, manifest):
+    for variant in (manifest or {}).get("variants", []):
+        try:
+            if storage.exists(variant["name"]):
+                storage.delete(variant["name"])
+        except Exception:
+            # File cleanup should never block the caller
+            logger.warning("Could not delete image variant %s", variant.get("name"), exc_info=True)
+
+
+def build_variants(model, pk, field_name, manifest_field, source_name):
+    """Generate variants for one row and store the manifest; None if it failed or went stale."""
+    storage = model._meta.get_field(field_name).storage
+    try:
+        manifest = generate_variants(storage, source_name)
+    except Exception:
+        logger.exception("Could not generate image variants for %s", source_name)
+        return None
+    updated = model.objects.filter(pk=pk, **{field_name: source_name}).update(**{manifest_field: manifest})
+    if not updated:
+        # The image was replaced or the row deleted while we were encoding.
+        delete_variants(storage, manifest)
+        return None
+    # update() sends no signals; orphan cached responses that lack the variants.
+    bump_generation(model._meta.label_lower)
+    return manifest
+
+
+def _build_variants_in_background(*args):
+    try:
+        build_variants(*args)
+    finally:
+        connections.close_all()
+
+
+def schedule_image_variants(instance, field_name="image", manifest_field="image_variants"):
+    """Generate variants for ``instance``'s current image once the transaction commits."""
+    image = getattr(instance, field_name)
+    if not image:
+        return
+    args = (type(instance), instance.pk, field_name, manifest_field, image.name)
+    if settings.IMAGE_VARIANTS_ASYNC:
+        transaction.on_commit(lambda: _get_executor().submit(_build_variants_in_background, *args))
+    else:
+        transaction.on_commit(lambda: build_variants(*args))
+
+
+def manifest_matches(image, manifest):
+    return bool(image) and bool(manifest) and manifest.get("source") == image.name
+
+
+def image_srcsets(image, manifest, build_url):
+    """Return ``{format: srcset}`` (best format first) or None without variants.
+
+    ``build_url`` turns a storage URL into an absolute one.
+    """
+    if not manifest_matches(image, manifest):
+        return None
+    storage = image.storage
+    srcsets = {}
+    for fmt in FORMAT_PREFERENCE:
+        entries = sorted(
+            (variant for variant in manifest["variants"] if variant["format"] == fmt),
+            key=lambda variant: variant["width"],
+        )
+        if entries:
+            srcsets[fmt] = ", ".join(
+                f"{build_url(storage.url(variant['name']))} {variant['width']}w" for variant in entries
+            )
+    return srcsets or None
+
+
+def variant_url(image, manifest, width, fmt="jpeg"):
+    """URL of the narrowest ``fmt`` variant at least ``width`` wide, else the original."""
+    if not image:
+        return None
+    if manifest_matches(image, manifest):
+        candidates = sorted(
+            (variant for variant in manifest["variants"] if variant["format"] == fmt),
+            key=lambda variant: variant["width"],
+        )
+        if candidates:
+            chosen = next((variant for variant in candidates if variant["width"] >= width), candidates[-1])
+            return image.storage.url(chosen["name"])
+    return image.url
+
+
+class ImageSrcsetField(serializers.Field):
+    """Read-only ``{format: srcset}`` for a model's image variants (None until generated)."""
+
+    def __init__(self, image_field="image", manifest_field="image_variants", **kwargs):
+        self.image_field = image_field
+        self.manifest_field = manifest_field
+        kwargs["source"] = "*"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        request = self.context.get("request")
+        build_url = request.build_absolute_uri if request is not None else (lambda url: url)
+        return image_srcsets(
+            getattr(instance, self.image_field), getattr(instance, self.manifest_field, None), build_url,
+        )
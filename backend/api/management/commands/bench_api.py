@@ -0,0 +1,79 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import bench
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the main API endpoints against a throwaway database seeded with a "
+        "deterministic dataset. Prints latency percentiles, throughput and queries per "
+        "request as JSON, to compare between commits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", type=int, default=100, help="Courses, services and users to seed.")
+        parser.add_argument("--clients", type=int, default=4, help="Concurrent clients.")
+        parser.add_argument("--requests", type=int, default=50, help="Iterations of each scenario per client.")
+        parser.add_argument("--warmup", type=int, default=5, help="Unmeasured iterations before each scenario.")
+        parser.add_argument("--transport", choices=("client", "server"), default="client",
+                            help="Django test client in-process, or HTTP to a local threaded server.")
+        parser.add_argument("--scenario", action="append", choices=list(bench.SCENARIOS),
+                            help="Run only this scenario. Repeatable; all by default.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed for the generated dataset.")
+        parser.add_argument("--pdf-kb", type=int, default=256, help="Size of the downloaded Terms PDF (at most 1024).")
+        parser.add_argument("--compare", help="A previous JSON report to compute the changes against.")
+        parser.add_argument("--output", help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        if options["clients"] < 1 or options["requests"] < 1 or options["scale"] < 1:
+            raise CommandError("--scale, --clients and --requests must be at least 1.")
+        if not 1 <= options["pdf_kb"] <= 1024:
+            raise CommandError("--pdf-kb must be between 1 and 1024.")
+        baseline = None
+        if options["compare"]:
+            try:
+                with open(options["compare"]) as handle:
+                    baseline = json.load(handle)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Could not read {options['compare']}: {exc}")
+
+        report = {
+            "meta": {
+                **bench.environment(),
+                "transport": options["transport"],
+                "scale": options["scale"],
+                "clients": options["clients"],
+                "requests_per_client": options["requests"],
+                "warmup": options["warmup"],
+                "seed": options["seed"],
+                "scenarios": [name for name in bench.SCENARIOS if name in (options["scenario"] or bench.SCENARIOS)],
+            },
+        }
+        with bench.isolated_database(), bench.bench_environment():
+            dataset = bench.seed(
+                options["scale"], clients=options["clients"], seed=options["seed"], pdf_kb=options["pdf_kb"],
+            )
+            try:
+                report["results"] = bench.run(
+                    dataset, scenarios=options["scenario"], clients=options["clients"],
+                    requests=options["requests"], warmup=options["warmup"], transport=options["transport"],
+                    seed=options["seed"],
+                )
+            finally:
+                bench.cleanup(dataset)
+        if baseline is not None:
+            report["baseline"] = {"path": options["compare"], "commit": baseline.get("meta", {}).get("commit")}
+            report["changes"] = bench.compare(report["results"], baseline.get("results", {}))
+
+        body = json.dumps(report, indent=2)
+        if not options["output"]:
+            self.stdout.write(body)
+            return
+        with open(options["output"], "w") as handle:
+            handle.write(body + "\n")
+        errors = sum(summary["errors"] for summary in report["results"].values())
+        self.stdout.write(self.style.SUCCESS(
+            f"bench_api output={options['output']} operations={len(report['results'])} errors={errors}"
+        ))
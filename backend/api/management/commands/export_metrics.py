@@ -0,0 +1,72 @@
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from api import metrics
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves the merged metrics to scrapers presenting ``METRICS_AUTH_TOKEN``."""
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        if not metrics.scrape_allowed(self.headers.get("Authorization")):
+            self.send_error(403)
+            return
+        try:
+            body = metrics.render().encode()
+        finally:
+            connections.close_all()
+        self.send_response(200)
+        self.send_header("Content-Type", metrics.CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Export metrics from PROMETHEUS_MULTIPROC_DIR for hosts that only run "
+        "workers: write them once (for node_exporter's textfile collector) or "
+        "serve them over HTTP."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", help="Write the exposition to this file instead of stdout.")
+        parser.add_argument(
+            "--port", type=int,
+            help="Serve /metrics on this port until interrupted. Scrapers must send METRICS_AUTH_TOKEN.",
+        )
+        parser.add_argument("--bind", default="127.0.0.1")
+
+    def handle(self, *args, **options):
+        if options["port"]:
+            if not settings.METRICS_AUTH_TOKEN:
+                raise CommandError("Set METRICS_AUTH_TOKEN before serving metrics over HTTP.")
+            server = ThreadingHTTPServer((options["bind"], options["port"]), MetricsHandler)
+            self.stdout.write(self.style.SUCCESS(f"export_metrics serving port={options['port']}"))
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.server_close()
+            return
+
+        body = metrics.render()
+        if not options["output"]:
+            self.stdout.write(body, ending="")
+            return
+        temporary = f"{options['output']}.{os.getpid()}.tmp"
+        with open(temporary, "w") as handle:
+            handle.write(body)
+        os.replace(temporary, options["output"])
+        self.stdout.write(self.style.SUCCESS(f"export_metrics output={options['output']} bytes={len(body)}"))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from api.images import build_variants, delete_variants, manifest_matches
+from courses.models import Course
+from services.models import Service
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate responsive variants for course and service images that are "
+        "missing them (e.g. uploaded before variants existed)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Regenerate existing variants too.")
+
+    def handle(self, *args, **options):
+        generated = 0
+        skipped = 0
+        failed = 0
+        for model in (Course, Service):
+            queryset = model.objects.exclude(image="").exclude(image__isnull=True).only("pk", "image", "image_variants")
+            for instance in queryset.iterator():
+                if not options["force"] and manifest_matches(instance.image, instance.image_variants):
+                    skipped += 1
+                    continue
+                manifest = build_variants(model, instance.pk, "image", "image_variants", instance.image.name)
+                if manifest is None:
+                    failed += 1
+                    continue
+                generated += 1
+                # The new manifest holds its own references; release the old one's
+                delete_variants(instance.image.storage, instance.image_variants)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"image_variants generated={generated} skipped={skipped} failed={failed}"
+            )
+        )
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import profiling
+
+
+class Command(BaseCommand):
+    help = (
+        "List stored request profiles, or export one as collapsed stacks for "
+        "flamegraph.pl or speedscope."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--export", metavar="PROFILE_ID", help="Export this profile.")
+        parser.add_argument("--output", help="Write the export to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        if options["export"]:
+            profile = profiling.get_profile(options["export"])
+            if profile is None:
+                raise CommandError(f"No stored profile with id {options['export']}.")
+            collapsed = profiling.to_collapsed(profile)
+            if not options["output"]:
+                self.stdout.write(collapsed, ending="")
+                return
+            with open(options["output"], "w") as handle:
+                handle.write(collapsed)
+            self.stdout.write(self.style.SUCCESS(
+                f"profiles exported id={profile['id']} samples={profile['samples']} output={options['output']}"
+            ))
+            return
+
+        profiles = profiling.list_profiles()
+        for profile in profiles:
+            self.stdout.write(
+                f"{profile['id']} {profile['at']} {profile['method']} {profile['path']} view={profile['view']} "
+                f"status={profile['status']} duration_ms={profile['duration_ms']} samples={profile['samples']}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"profiles stored={len(profiles)}"))
@@ -0,0 +1,49 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from api import slow_queries
+
+
+class Command(BaseCommand):
+    help = "Show the slow query log, optionally aggregated by normalized query fingerprint."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--aggregate", action="store_true", help="Group entries by fingerprint.")
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--plans", action="store_true", help="Include EXPLAIN plans.")
+        parser.add_argument("--json", action="store_true", help="Print the raw entries or groups as JSON.")
+        parser.add_argument("--clear", action="store_true", help="Empty the log afterwards.")
+
+    def handle(self, *args, **options):
+        entries = slow_queries.entries()
+        rows = slow_queries.aggregate(entries) if options["aggregate"] else entries
+        rows = rows[:options["limit"]]
+
+        if options["json"]:
+            self.stdout.write(json.dumps(rows, indent=2, default=str))
+        elif options["aggregate"]:
+            for group in rows:
+                self.stdout.write(
+                    f"{group['fingerprint']} count={group['count']} total_ms={group['total_ms']} "
+                    f"mean_ms={group['mean_ms']} max_ms={group['max_ms']} callers={','.join(group['callers'])}"
+                )
+                self.stdout.write(f"  {group['query']}")
+                if options["plans"] and group["slowest"]["plan"]:
+                    self.stdout.write("  " + group["slowest"]["plan"].replace("\n", "\n  "))
+        else:
+            for entry in rows:
+                self.stdout.write(
+                    f"{entry['at']} {entry['duration_ms']}ms {entry['caller']} {entry['fingerprint']}"
+                )
+                self.stdout.write(f"  {entry['sql']}")
+                self.stdout.write(f"  params={entry['params']}")
+                if options["plans"] and entry["plan"]:
+                    self.stdout.write("  " + entry["plan"].replace("\n", "\n  "))
+
+        if options["clear"]:
+            slow_queries.clear()
+        if not options["json"]:
+            self.stdout.write(self.style.SUCCESS(
+                f"slow_queries entries={len(entries)} shown={len(rows)} cleared={options['clear']}"
+            ))
@@ -0,0 +1,415 @@
+"""Prometheus metrics for the web processes and the email queue worker.
+
+Each process keeps its counters and histograms in memory. With the
+``PROMETHEUS_MULTIPROC_DIR`` environment variable set (the
+``METRICS_MULTIPROC_DIR`` setting), each process also writes them to
+``<dir>/<host>-<pid>.json``:
+
+* at most every ``METRICS_FLUSH_INTERVAL_SECONDS``, after a request;
+* when a command calls ``flush(final=True)``;
+* at exit.
+
+``/metrics`` (and ``manage.py export_metrics`` on worker hosts) merges every
+file in the directory, so one scrape of any gunicorn worker covers them all.
+Counters and histograms from processes that have exited are folded into
+``archive.json`` and kept. Their gauges are dropped.
+
+Without the directory a scrape only sees the process that answered it.
+That is fine for ``runserver`` and tests, not for several gunicorn workers.
+
+Queue depth is read from the database at scrape time. It describes the
+whole system, not one process.
+"""
+
+import atexit
+import fcntl
+import hmac
+import json
+import os
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Min
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+ARCHIVE_FILE = "archive.json"
+LOCK_FILE = ".lock"
+# Families whose samples add up across processes.
+SUMMED_TYPES = ("counter", "histogram")
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name + "_total", dict(zip(self.labelnames, key)), value)
+                    for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += 1
+            state[2] += value
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+        samples = []
+        for key, counts, count, total in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append((self.name + "_bucket", {**labels, "le": bound}, cumulative))
+            samples.append((self.name + "_bucket", {**labels, "le": float("inf")}, count))
+            samples.append((self.name + "_count", labels, count))
+            samples.append((self.name + "_sum", labels, total))
+        return samples
+
+
+_registry = []
+
+email_job_age = Histogram(
+    "ordinaly_email_job_age_seconds", "Time from a job being queued to its send attempt.",
+    ("notification_type",), buckets=(1, 5, 30, 60, 300, 900, 3600, 6 * 3600, 24 * 3600, 7 * 24 * 3600),
+)
+email_send_duration = Histogram(
+    "ordinaly_email_send_duration_seconds", "Time spent sending one email notification job.",
+    ("notification_type", "outcome"), buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+email_jobs = Counter(
+    "ordinaly_email_jobs", "Email notification send attempts by outcome (sent, retried, failed).",
+    ("notification_type", "outcome"),
+)
+stripe_webhook_lag = Histogram(
+    "ordinaly_stripe_webhook_lag_seconds", "Time from Stripe creating an event to us processing it.",
+    ("event_type",), buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600),
+)
+
+
+def _family(name, type_, documentation, samples):
+    return {"name": name, "type": type_, "help": documentation, "samples": samples}
+
+
+def _request_families():
+    from .timing import route_timing_stats
+
+    durations, components, queries = [], [], []
+    for route, stats in route_timing_stats().items():
+        method, _, view = route.partition(" ")
+        labels = {"method": method, "view": view}
+        for name in ("total", "db", "http", "serialize"):
+            histogram = stats[name]
+            if name == "total":
+                target, sample_labels, metric = durations, labels, "ordinaly_http_request_duration_seconds"
+            else:
+                target, sample_labels = components, {**labels, "component": name}
+                metric = "ordinaly_http_request_component_seconds"
+            for bound, count in histogram["buckets"]:
+                target.append((metric + "_bucket", {**sample_labels, "le": bound}, count))
+            target.append((metric + "_count", sample_labels, histogram["count"]))
+            target.append((metric + "_sum", sample_labels, histogram["sum"]))
+        queries.append(("ordinaly_http_request_queries_total", labels, stats["queries"]))
+    return [
+        _family("ordinaly_http_request_duration_seconds", "histogram", "Request wall time by view.", durations),
+        _family(
+            "ordinaly_http_request_component_seconds", "histogram",
+            "Time spent in SQL, outbound HTTP and serializers, for sampled requests.", components,
+        ),
+        _family("ordinaly_http_request_queries", "counter", "SQL queries run by sampled requests.", queries),
+    ]
+
+
+def _cache_families():
+    from users.services.token_cache import token_cache_stats
+    from users.throttling import auth_throttle_stats
+
+    from .cache import cache_stats
+    from .response_cache import response_cache_stats
+
+    tiered = []
+    for namespace, stats in cache_stats().items():
+        for event, value in stats.items():
+            if event not in ("l1_size", "hit_ratio"):
+                tiered.append(("ordinaly_tiered_cache_events_total", {"namespace": namespace, "event": event}, value))
+    responses = [("ordinaly_response_cache_events_total", {"event": event}, value)
+                 for event, value in response_cache_stats().items()]
+    tokens = [("ordinaly_token_cache_events_total", {"event": event}, value)
+              for event, value in token_cache_stats().items() if event not in ("size", "hit_ratio")]
+    throttle_stats = auth_throttle_stats()
+    throttles = [("ordinaly_auth_throttle_requests_total", {"scope": scope, "outcome": "allowed"}, value)
+                 for scope, value in throttle_stats["allowed"].items()]
+    for name, value in throttle_stats["throttled"].items():
+        scope, _, kind = name.partition(".")
+        throttles.append(("ordinaly_auth_throttle_requests_total", {"scope": scope, "outcome": f"throttled_{kind}"}, value))
+    throttles.append(("ordinaly_auth_throttle_requests_total", {"scope": "password", "outcome": "shed"}, throttle_stats["shed"]))
+    return [
+        _family("ordinaly_tiered_cache_events", "counter", "TieredCache lookups and writes by namespace.", tiered),
+        _family("ordinaly_response_cache_events", "counter", "Anonymous response cache hits, misses and stores.", responses),
+        _family("ordinaly_token_cache_events", "counter", "Token snapshot cache lookups.", tokens),
+        _family("ordinaly_auth_throttle_requests", "counter", "Auth endpoint requests by throttle outcome.", throttles),
+    ]
+
+
+def _db_families():
+    open_connections, pool = [], []
+    for connection in connections.all(initialized_only=True):
+        alias = connection.alias
+        open_connections.append(("ordinaly_db_connections_open", {"alias": alias}, int(connection.connection is not None)))
+        if connection.settings_dict.get("OPTIONS", {}).get("pool"):
+            for stat, value in connection.pool.get_stats().items():
+                if stat in ("pool_size", "pool_available", "requests_waiting"):
+                    pool.append(("ordinaly_db_pool_connections", {"alias": alias, "stat": stat}, value))
+    return [
+        _family("ordinaly_db_connections_open", "gauge", "Open database connections held by the process.", open_connections),
+        _family("ordinaly_db_pool_connections", "gauge", "psycopg pool size, idle connections and waiting requests.", pool),
+    ]
+
+
+def process_families():
+    """Everything this process has recorded."""
+    families = [_family(metric.name, metric.type, metric.documentation, metric.samples()) for metric in _registry]
+    return families + _request_families() + _cache_families() + _db_families()
+
+
+def _queue_families():
+    from users.models import EmailNotificationJob
+
+    depth = [
+        ("ordinaly_email_queue_jobs", {"status": row["status"], "notification_type": row["notification_type"]}, row["jobs"])
+        for row in EmailNotificationJob.objects.values("status", "notification_type").annotate(jobs=Count("id"))
+    ]
+    oldest = EmailNotificationJob.objects.filter(
+        status=EmailNotificationJob.STATUS_PENDING, scheduled_for__lte=_now(),
+    ).aggregate(oldest=Min("scheduled_for"))["oldest"]
+    overdue = (_now() - oldest).total_seconds() if oldest else 0
+    return [
+        _family("ordinaly_email_queue_jobs", "gauge", "Email notification jobs by status and type.", depth),
+        _family(
+            "ordinaly_email_queue_oldest_due_seconds", "gauge", "How long the oldest due pending job has waited.",
+            [("ordinaly_email_queue_oldest_due_seconds", {}, overdue)],
+        ),
+    ]
+
+
+def _now():
+    from django.utils import timezone
+
+    return timezone.now()
+
+
+# Multiprocess files
+
+_next_flush = 0.0
+_atexit_registered = False
+_exited = False
+
+
+def _process_file(directory):
+    return os.path.join(directory, f"{socket.gethostname()}-{os.getpid()}.json")
+
+
+def _write_json(path, data):
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as handle:
+        json.dump(data, handle)
+    os.replace(temporary, path)
+
+
+def _encode(families):
+    # JSON has no infinity; "le" bounds are stored as strings.
+    return [
+        {**family, "samples": [[name, {k: _format_number(v) if k == "le" else v for k, v in labels.items()}, value]
+                               for name, labels, value in family["samples"]]}
+        for family in families
+    ]
+
+
+def flush(final=False):
+    """Write this process's metrics to ``METRICS_MULTIPROC_DIR``, if configured."""
+    global _next_flush, _atexit_registered, _exited
+    directory = settings.METRICS_MULTIPROC_DIR
+    if not directory or _exited:
+        return  # once marked exited the file may already be archived; never write it again
+    _exited = final
+    if not _atexit_registered:
+        _atexit_registered = True
+        atexit.register(flush, final=True)
+    _next_flush = time.monotonic() + settings.METRICS_FLUSH_INTERVAL_SECONDS
+    os.makedirs(directory, exist_ok=True)
+    _write_json(_process_file(directory), {
+        "host": socket.gethostname(),
+        "pid": os.getpid(),
+        "exited": final,
+        "families": _encode(process_families()),
+    })
+
+
+def maybe_flush():
+    if settings.METRICS_MULTIPROC_DIR and time.monotonic() >= _next_flush:
+        flush()
+
+
+def _alive(data):
+    if data.get("exited"):
+        return False
+    if data.get("host") != socket.gethostname():
+        return True  # cannot check another host's pids; trust the exit flag
+    try:
+        os.kill(data["pid"], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge(merged, families, include_gauges=True):
+    for family in families:
+        if family["type"] not in SUMMED_TYPES and not include_gauges:
+            continue
+        entry = merged.setdefault(family["name"], {**family, "samples": {}})
+        for name, labels, value in family["samples"]:
+            key = (name, tuple(labels.items()))
+            entry["samples"][key] = entry["samples"].get(key, 0) + value
+
+
+def _read(path):
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+def _collect_directory(directory):
+    """Merge every process file, folding those of exited processes into the archive."""
+    merged = {}
+    with open(os.path.join(directory, LOCK_FILE), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive_path = os.path.join(directory, ARCHIVE_FILE)
+        archive = {}
+        _merge(archive, (_read(archive_path) or {}).get("families", []))
+        archived = False
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith(".json") or filename == ARCHIVE_FILE:
+                continue
+            path = os.path.join(directory, filename)
+            data = _read(path)
+            if data is None:
+                continue
+            if _alive(data):
+                _merge(merged, data["families"])
+            else:
+                _merge(archive, data["families"], include_gauges=False)
+                os.remove(path)
+                archived = True
+        if archived:
+            _write_json(archive_path, {"families": [
+                {**family, "samples": [[name, dict(labels), value] for (name, labels), value in family["samples"].items()]}
+                for family in archive.values()
+            ]})
+    for family in archive.values():
+        entry = merged.setdefault(family["name"], {**family, "samples": {}})
+        for key, value in family["samples"].items():
+            entry["samples"][key] = entry["samples"].get(key, 0) + value
+    return merged
+
+
+def collect():
+    """Metric families for a scrape: every process's (or just this one's), plus queue depth."""
+    directory = settings.METRICS_MULTIPROC_DIR
+    if directory:
+        flush()
+        merged = _collect_directory(directory)
+    else:
+        merged = {}
+        _merge(merged, _encode(process_families()))
+    _merge(merged, _encode(_queue_families()))
+    return merged
+
+
+def _format_number(value):
+    if isinstance(value, str):
+        return value
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render():
+    """The Prometheus text exposition of ``collect()``."""
+    lines = []
+    for name, family in sorted(collect().items()):
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for (sample, labels), value in family["samples"].items():
+            label_text = ",".join(f'{key}="{_escape(label)}"' for key, label in labels)
+            lines.append(f"{sample}{{{label_text}}} {_format_number(value)}" if labels else f"{sample} {_format_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def scrape_allowed(authorization):
+    """Whether an ``Authorization`` header value carries ``METRICS_AUTH_TOKEN``.
+
+    Always False while the token is unset, so metrics are never served
+    without one.
+    """
+    if not settings.METRICS_AUTH_TOKEN:
+        return False
+    return hmac.compare_digest(authorization or "", f"Bearer {settings.METRICS_AUTH_TOKEN}")
+
+
+def reset():
+    """Clear this process's recorded counters and histograms (for tests)."""
+    for metric in _registry:
+        metric.reset()
@@ -1,3 +1,17 @@
 from django.db import models
 
-# Create your models here.
+
+class MediaBlob(models.Model):
+    """One stored media file, shared by every upload with the same content.
+
+    `references` counts the model fields (and image variants) pointing at
+    `name`; the file is removed when it drops to zero (see api.storage).
+    """
+    digest = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    references = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.references} refs)"
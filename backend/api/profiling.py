@@ -0,0 +1,207 @@
+"""On-demand sampling profiler for single requests.
+
+A staff user gets a short-lived signed token from ``POST /api/profiler/token/``.
+They send it back as ``X-Profile: <token>`` or ``?_profile=<token>`` on the
+request to profile.
+
+While such a request runs, a background thread samples the handling thread's
+stack every ``PROFILER_INTERVAL_MS``. The samples are stored as collapsed
+stacks (``frame;frame;frame count``), the input format of flamegraph.pl and
+speedscope. They are kept in the ``PROFILER_CACHE_ALIAS`` cache under the
+request id, which is the incoming ``X-Request-ID`` or a new one, returned as
+``X-Profile-Id``. ``manage.py profiles`` lists and exports them.
+
+Requests without the header or parameter only pay for the two lookups that
+notice it is missing. Invalid or expired tokens are ignored and the request
+runs unprofiled.
+"""
+
+import logging
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+
+from .timing import route_name
+
+logger = logging.getLogger(__name__)
+
+TOKEN_SALT = "api.profiling"
+HEADER = "HTTP_X_PROFILE"
+QUERY_PARAMETER = "_profile"
+REQUEST_ID_HEADER = "HTTP_X_REQUEST_ID"
+SEQUENCE_KEY = "profile:seq"
+SLOT_KEY_PREFIX = "profile:slot"
+PROFILE_KEY_PREFIX = "profile:data"
+MAX_DEPTH = 200
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+def _cache():
+    return caches[settings.PROFILER_CACHE_ALIAS]
+
+
+def issue_token(user):
+    """A token that lets ``user`` profile requests for ``PROFILER_TOKEN_MAX_AGE_SECONDS``."""
+    return signing.dumps({"user": user.pk}, salt=TOKEN_SALT)
+
+
+def verify_token(token):
+    """Return the id of the user who requested ``token``, or None if it is invalid or expired."""
+    if not token:
+        return None
+    try:
+        return signing.loads(token, salt=TOKEN_SALT, max_age=settings.PROFILER_TOKEN_MAX_AGE_SECONDS)["user"]
+    except (signing.BadSignature, KeyError, TypeError):
+        return None
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}.{code.co_qualname}:{frame.f_lineno}"
+
+
+def collapse(frame):
+    """``frame``'s stack, outermost call first, in collapsed-stack notation."""
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        names.append(_frame_name(frame).replace(";", ":"))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """Samples one thread's stack from a background thread until stopped."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+
+def store(profile):
+    """Keep ``profile`` and index it in the ring of the ``PROFILER_MAX_PROFILES`` newest."""
+    cache = _cache()
+    cache.add(SEQUENCE_KEY, 0, timeout=None)
+    sequence = cache.incr(SEQUENCE_KEY)
+    ttl = settings.PROFILER_RETENTION_SECONDS
+    summary = {key: value for key, value in profile.items() if key != "stacks"}
+    cache.set(f"{PROFILE_KEY_PREFIX}:{profile['id']}", profile, timeout=ttl)
+    cache.set(f"{SLOT_KEY_PREFIX}:{sequence % settings.PROFILER_MAX_PROFILES}", {**summary, "seq": sequence}, timeout=ttl)
+
+
+def list_profiles():
+    """Summaries of the stored profiles, newest first."""
+    cache = _cache()
+    sequence = cache.get(SEQUENCE_KEY) or 0
+    size = settings.PROFILER_MAX_PROFILES
+    numbers = list(range(sequence, max(sequence - size, 0), -1))
+    keys = [f"{SLOT_KEY_PREFIX}:{number % size}" for number in numbers]
+    found = cache.get_many(keys)
+    return [found[key] for key, number in zip(keys, numbers) if key in found and found[key]["seq"] == number]
+
+
+def get_profile(profile_id):
+    return _cache().get(f"{PROFILE_KEY_PREFIX}:{profile_id}")
+
+
+def clear():
+    cache = _cache()
+    cache.delete_many([f"{PROFILE_KEY_PREFIX}:{summary['id']}" for summary in list_profiles()])
+    cache.delete_many([f"{SLOT_KEY_PREFIX}:{slot}" for slot in range(settings.PROFILER_MAX_PROFILES)])
+    cache.delete(SEQUENCE_KEY)
+
+
+def to_collapsed(profile):
+    """The profile as collapsed-stack text, heaviest stacks first."""
+    stacks = sorted(profile["stacks"].items(), key=lambda item: item[1], reverse=True)
+    return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+
+def _requested_token(request):
+    token = request.META.get(HEADER)
+    if token is None and QUERY_PARAMETER + "=" in request.META.get("QUERY_STRING", ""):
+        token = parse_qs(request.META["QUERY_STRING"]).get(QUERY_PARAMETER, [None])[0]
+    return token
+
+
+def _is_staff(user_id):
+    from django.contrib.auth import get_user_model
+
+    return get_user_model().objects.filter(pk=user_id, is_active=True, is_staff=True).exists()
+
+
+class ProfilerMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if HEADER not in request.META and QUERY_PARAMETER not in request.META.get("QUERY_STRING", ""):
+            return self.get_response(request)
+        return self._profile(request)
+
+    def _profile(self, request):
+        token = _requested_token(request)
+        user_id = verify_token(token) if settings.PROFILER_ENABLED else None
+        if user_id is not None and not _is_staff(user_id):
+            user_id = None  # lost staff rights since the token was issued
+        if user_id is None:
+            if token:
+                logger.info("Ignoring profile request with an invalid or expired token for %s", request.path)
+            return self.get_response(request)
+
+        request_id = request.META.get(REQUEST_ID_HEADER, "")
+        if not _REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex
+        sampler = StackSampler(threading.get_ident(), settings.PROFILER_INTERVAL_MS / 1000)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            stacks = sampler.stop()
+        duration = time.perf_counter() - started
+
+        try:
+            store({
+                "id": request_id,
+                "at": datetime.now(timezone.utc).isoformat(),
+                "user": user_id,
+                "method": request.method,
+                "path": request.path,
+                "view": route_name(request),
+                "status": response.status_code,
+                "duration_ms": round(duration * 1000, 3),
+                "interval_ms": settings.PROFILER_INTERVAL_MS,
+                "samples": sum(stacks.values()),
+                "stacks": dict(stacks),
+            })
+        except Exception:
+            logger.warning("Could not store profile %s", request_id, exc_info=True)
+            return response
+        response["X-Profile-Id"] = request_id
+        return response
@@ -0,0 +1,202 @@
+import gzip
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import parse_http_date_safe
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY_PREFIX = "resp-gen"
+RESPONSE_KEY_PREFIX = "resp"
+CACHED_HEADERS = ("ETag", "Last-Modified")
+
+
+def _cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def _generation_cache():
+    return caches[settings.RESPONSE_CACHE_GENERATION_ALIAS]
+
+
+def _generation_key(label):
+    return f"{GENERATION_KEY_PREFIX}:{label}"
+
+
+def get_generations(labels):
+    """Return the current generation for each model label.
+
+    Missing counters are seeded from the clock rather than 1, so an evicted
+    counter can never roll back onto a generation that still has bodies
+    cached under it.
+    """
+    cache = _generation_cache()
+    keys = [_generation_key(label) for label in labels]
+    values = cache.get_many(keys)
+    generations = []
+    for key in keys:
+        value = values.get(key)
+        if value is None:
+            cache.add(key, time.time_ns(), timeout=None)
+            value = cache.get(key)
+        generations.append(value)
+    return generations
+
+
+def bump_generation(label):
+    """Invalidate every cached response built from ``label``'s rows."""
+    cache = _generation_cache()
+    key = _generation_key(label)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+class ResponseCacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {"hits": 0, "misses": 0, "stores": 0}
+
+    def count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        with self._lock:
+            for name in self._counts:
+                self._counts[name] = 0
+
+
+_stats = ResponseCacheStats()
+
+
+def response_cache_stats():
+    return _stats.snapshot()
+
+
+def reset_response_cache_stats():
+    _stats.reset()
+
+
+def _accepts_gzip(request):
+    return "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", "").lower()
+
+
+def _build_response(entry, request):
+    use_gzip = entry.get("gzip") is not None and _accepts_gzip(request)
+    response = HttpResponse(
+        entry["gzip"] if use_gzip else entry["body"],
+        status=entry["status"],
+        content_type=entry["content_type"],
+    )
+    if use_gzip:
+        response["Content-Encoding"] = "gzip"
+    for name, value in entry.get("headers", {}).items():
+        response[name] = value
+    response["Content-Length"] = str(len(response.content))
+    patch_vary_headers(response, ("Accept", "Accept-Encoding"))
+    return response
+
+
+class CachedResponseMixin:
+    """Serve anonymous-safe ``list``/``retrieve`` responses from the cache.
+
+    Only JSON responses are cached. Keys combine the absolute request URL
+    (payloads embed absolute media URLs, so scheme and host matter), the
+    audience (public or staff, so drafts never leak) and the generation of
+    every model in ``response_cache_models``. Saving or deleting any of those
+    models bumps its generation (see ``api.signals``) in the cache every worker
+    shares, which orphans the old entries; the TTL bounds anything time-dependent in the payload. Bodies
+    are stored rendered and, above a size threshold, gzip-compressed as well,
+    so a hit does no serialization and no compression. Validators set by
+    ``ConditionalGetMixin`` are stored with the body, so conditional requests
+    that hit the cache are answered without touching the database; list this
+    mixin first so it wraps the conditional one.
+    """
+
+    response_cache_models = ()
+    response_cache_actions = ("list", "retrieve")
+
+    def _response_cache_key(self, request):
+        if not settings.RESPONSE_CACHE_ENABLED or request.method != "GET":
+            return None
+        if getattr(self, "action", None) not in self.response_cache_actions:
+            return None
+        renderer = getattr(request, "accepted_renderer", None)
+        if renderer is None or renderer.format != "json":
+            return None
+
+        user = getattr(request, "user", None)
+        audience = "staff" if getattr(user, "is_staff", False) else "public"
+        labels = [model._meta.label_lower for model in self.response_cache_models]
+        generations = ".".join(str(value) for value in get_generations(labels))
+        digest = hashlib.sha256(request.build_absolute_uri().encode()).hexdigest()[:32]
+        return f"{RESPONSE_KEY_PREFIX}:{self.basename}:{audience}:{generations}:{digest}"
+
+    def _cached_response(self, request, handler, *args, **kwargs):
+        key = self._response_cache_key(request)
+        if key is not None:
+            entry = _cache().get(key)
+            if entry is not None:
+                _stats.count("hits")
+                return self._conditional_hit(request, entry)
+            _stats.count("misses")
+        self._response_cache_store_key = key
+        return handler(request, *args, **kwargs)
+
+    def _conditional_hit(self, request, entry):
+        """Answer a hit, honouring validators stored with it (see ConditionalGetMixin)."""
+        response = _build_response(entry, request)
+        headers = entry.get("headers", {})
+        if not headers:
+            return response
+        last_modified = None
+        honours_if_modified_since = getattr(self, "_honours_if_modified_since", None)
+        if honours_if_modified_since is not None and honours_if_modified_since():
+            last_modified = parse_http_date_safe(headers.get("Last-Modified") or "")
+        return get_conditional_response(
+            request, etag=headers.get("ETag"), last_modified=last_modified, response=response,
+        )
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(request, super().retrieve, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, "_response_cache_store_key", None)
+        if key is None or response.status_code != 200:
+            return response
+
+        self._response_cache_store_key = None
+        response.render()
+        body = response.content
+        entry = {
+            "status": response.status_code,
+            "content_type": response["Content-Type"],
+            "headers": {name: response[name] for name in CACHED_HEADERS if response.has_header(name)},
+            "body": body,
+            "gzip": (
+                gzip.compress(body) if len(body) >= settings.RESPONSE_CACHE_MIN_GZIP_BYTES else None
+            ),
+        }
+        try:
+            _cache().set(key, entry, timeout=settings.RESPONSE_CACHE_TTL_SECONDS)
+            _stats.count("stores")
+        except Exception:
+            logger.warning("Response cache write failed", exc_info=True)
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return response
@@ -0,0 +1,289 @@
+"""Media storage on any S3-compatible object store (AWS S3, MinIO, R2, ...).
+
+Every request is authorized with an AWS Signature Version 4 presigned URL
+and sent with ``requests``, so the same code path serves server-side
+reads/writes and the URLs handed to browsers for direct uploads and
+downloads. Signing is a handful of HMACs and needs no SDK.
+
+Configure with ``MEDIA_STORAGE_BACKEND=api.s3.ContentAddressedS3Storage``
+and the ``S3_*`` settings; a local MinIO (``S3_ENDPOINT_URL=http://localhost:9000``,
+``S3_ADDRESSING_STYLE=path``) behaves like production.
+"""
+
+import base64
+import hashlib
+import hmac
+import time
+from datetime import datetime, timezone
+from tempfile import SpooledTemporaryFile
+from urllib.parse import quote, urlsplit
+
+import requests
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import Storage
+from django.utils.deconstruct import deconstructible
+
+from .storage import ContentAddressedStorageMixin
+
+ALGORITHM = "AWS4-HMAC-SHA256"
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+# Server-side requests are sent right away; their URLs only need to live briefly.
+REQUEST_EXPIRES_SECONDS = 60
+# Downloads larger than this are spooled to disk instead of memory.
+SPOOL_MAX_BYTES = 5 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class S3Error(Exception):
+    def __init__(self, status_code, body=""):
+        self.status_code = status_code
+        self.body = body
+        super().__init__(f"S3 request failed with HTTP {status_code}: {body[:200]}")
+
+
+def _hmac(key, message):
+    return hmac.new(key, message.encode("utf-8"), hashlib.sha256).digest()
+
+
+def signing_key(secret_key, date_stamp, region, service="s3"):
+    key = _hmac(f"AWS4{secret_key}".encode("utf-8"), date_stamp)
+    key = _hmac(key, region)
+    key = _hmac(key, service)
+    return _hmac(key, "aws4_request")
+
+
+def _encode(value):
+    return quote(str(value), safe="-_.~")
+
+
+def canonical_query(params):
+    return "&".join(f"{_encode(key)}={_encode(value)}" for key, value in sorted(params.items()))
+
+
+def canonical_request(method, path, params, headers):
+    """``headers`` must be lower-cased and include ``host``."""
+    names = sorted(headers)
+    canonical_headers = "".join(f"{name}:{str(headers[name]).strip()}\n" for name in names)
+    return "\n".join([
+        method, path, canonical_query(params), canonical_headers, ";".join(names), UNSIGNED_PAYLOAD,
+    ])
+
+
+def string_to_sign(amz_date, scope, request):
+    return "\n".join([ALGORITHM, amz_date, scope, hashlib.sha256(request.encode("utf-8")).hexdigest()])
+
+
+def checksum_header(sha256_hex):
+    """Value of ``x-amz-checksum-sha256`` (base64 of the raw digest) for a hex digest."""
+    return base64.b64encode(bytes.fromhex(sha256_hex)).decode("ascii")
+
+
+class S3Client:
+    """Minimal S3 client: presigned URLs plus the few object calls storage needs."""
+
+    def __init__(self, *, endpoint_url, bucket, region, access_key, secret_key,
+                 addressing_style="path", timeout=10, session=None):
+        self.endpoint = urlsplit(endpoint_url.rstrip("/"))
+        self.bucket = bucket
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.addressing_style = addressing_style
+        self.timeout = timeout
+        self.session = session or requests.Session()
+
+    def _location(self, key):
+        path = quote(key, safe="/~")
+        if self.addressing_style == "virtual":
+            return f"{self.bucket}.{self.endpoint.netloc}", f"{self.endpoint.path}/{path}"
+        return self.endpoint.netloc, f"{self.endpoint.path}/{self.bucket}/{path}"
+
+    def presign(self, method, key, *, expires_in, headers=None, params=None, signed_at=None):
+        """Return a URL that performs ``method`` on ``key`` without credentials.
+
+        ``headers`` become part of the signature, so the caller of the URL
+        has to send exactly those values (e.g. Content-Type, Content-Length).
+        """
+        host, path = self._location(key)
+        moment = datetime.fromtimestamp(time.time() if signed_at is None else signed_at, tz=timezone.utc)
+        amz_date = moment.strftime("%Y%m%dT%H%M%SZ")
+        date_stamp = amz_date[:8]
+        scope = f"{date_stamp}/{self.region}/s3/aws4_request"
+
+        signed_headers = {name.lower(): value for name, value in (headers or {}).items()}
+        signed_headers["host"] = host
+        query = dict(params or {})
+        query.update({
+            "X-Amz-Algorithm": ALGORITHM,
+            "X-Amz-Credential": f"{self.access_key}/{scope}",
+            "X-Amz-Date": amz_date,
+            "X-Amz-Expires": str(int(expires_in)),
+            "X-Amz-SignedHeaders": ";".join(sorted(signed_headers)),
+        })
+        request = canonical_request(method, path, query, signed_headers)
+        signature = hmac.new(
+            signing_key(self.secret_key, date_stamp, self.region),
+            string_to_sign(amz_date, scope, request).encode("utf-8"),
+            hashlib.sha256,
+        ).hexdigest()
+        query["X-Amz-Signature"] = signature
+        return f"{self.endpoint.scheme}://{host}{path}?{canonical_query(query)}"
+
+    def request(self, method, key, *, headers=None, params=None, data=None, stream=False, expected=(200,)):
+        url = self.presign(method, key, expires_in=REQUEST_EXPIRES_SECONDS, headers=headers, params=params)
+        response = self.session.request(
+            method, url, headers=headers, data=data, stream=stream, timeout=self.timeout,
+        )
+        if response.status_code not in expected:
+            body = "" if method == "HEAD" else response.text
+            response.close()
+            raise S3Error(response.status_code, body)
+        return response
+
+    def head_object(self, key):
+        """Return the object's response headers, or None if it doesn't exist."""
+        try:
+            response = self.request(
+                "HEAD", key, headers={"x-amz-checksum-mode": "ENABLED"}, expected=(200, 404),
+            )
+        except S3Error as error:
+            if error.status_code == 403:  # no s3:ListBucket permission hides 404s
+                return None
+            raise
+        return None if response.status_code == 404 else response.headers
+
+    def get_object(self, key):
+        return self.request("GET", key, stream=True)
+
+    def put_object(self, key, data, content_type):
+        self.request("PUT", key, headers={"content-type": content_type}, data=data)
+
+    def delete_object(self, key):
+        self.request("DELETE", key, expected=(200, 204, 404))
+
+
+@deconstructible(path="api.s3.S3Storage")
+class S3Storage(Storage):
+    """Django storage whose files are objects in an S3-compatible bucket.
+
+    ``url()`` returns ``S3_PUBLIC_BASE_URL/<key>`` when the bucket (or a CDN
+    in front of it) is public, otherwise a presigned GET. Presigned URLs are
+    signed at the start of a time window so they stay identical for half of
+    ``S3_URL_EXPIRES_SECONDS``, which keeps cached API responses and browser
+    caches valid.
+    """
+
+    def __init__(self, **options):
+        self.options = options
+        self._client = None
+
+    def _setting(self, name):
+        return self.options.get(name.lower(), getattr(settings, f"S3_{name}"))
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = S3Client(
+                endpoint_url=self._setting("ENDPOINT_URL"),
+                bucket=self._setting("BUCKET_NAME"),
+                region=self._setting("REGION"),
+                access_key=self._setting("ACCESS_KEY_ID"),
+                secret_key=self._setting("SECRET_ACCESS_KEY"),
+                addressing_style=self._setting("ADDRESSING_STYLE"),
+                timeout=self._setting("TIMEOUT_SECONDS"),
+            )
+        return self._client
+
+    def _key(self, name):
+        return name.replace("\\", "/").lstrip("/")
+
+    def _open(self, name, mode="rb"):
+        if "w" in mode or "a" in mode or "+" in mode:
+            raise ValueError("S3 files can only be opened for reading.")
+        response = self.client.get_object(self._key(name))
+        spooled = SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        try:
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                spooled.write(chunk)
+        finally:
+            response.close()
+        spooled.seek(0)
+        return File(spooled, name)
+
+    def _save(self, name, content):
+        if hasattr(content, "seek"):
+            content.seek(0)
+        content_type = (
+            getattr(content, "content_type", None)
+            or getattr(getattr(content, "file", None), "content_type", None)
+            or "application/octet-stream"
+        )
+        self.client.put_object(self._key(name), content, content_type)
+        return name
+
+    def head(self, name):
+        return self.client.head_object(self._key(name))
+
+    def exists(self, name):
+        return self.head(name) is not None
+
+    def size(self, name):
+        headers = self.head(name)
+        if headers is None:
+            raise FileNotFoundError(name)
+        return int(headers.get("Content-Length", 0))
+
+    def stored_digest(self, name):
+        """SHA-256 hex digest S3 verified on upload, or None if it wasn't sent."""
+        headers = self.head(name)
+        checksum = headers and headers.get("x-amz-checksum-sha256")
+        if not checksum:
+            return None
+        return base64.b64decode(checksum).hex()
+
+    def delete(self, name):
+        self.client.delete_object(self._key(name))
+
+    def _signing_window_start(self):
+        window = max(self._setting("URL_EXPIRES_SECONDS") // 2, 1)
+        now = int(time.time())
+        return now - now % window
+
+    def presigned_download_url(self, name, *, filename=None, content_type=None):
+        params = {}
+        if filename:
+            params["response-content-disposition"] = f'attachment; filename="{filename}"'
+        if content_type:
+            params["response-content-type"] = content_type
+        return self.client.presign(
+            "GET", self._key(name), expires_in=self._setting("URL_EXPIRES_SECONDS"),
+            params=params, signed_at=self._signing_window_start(),
+        )
+
+    def presigned_upload(self, name, *, content_type, size, sha256):
+        """Return ``(url, headers)`` for a browser PUT of exactly these bytes.
+
+        Content type, length and SHA-256 are signed, so S3 rejects any other
+        upload to the URL.
+        """
+        headers = {
+            "Content-Type": content_type,
+            "Content-Length": str(size),
+            "x-amz-checksum-sha256": checksum_header(sha256),
+        }
+        url = self.client.presign(
+            "PUT", self._key(name), expires_in=self._setting("UPLOAD_EXPIRES_SECONDS"), headers=headers,
+        )
+        return url, headers
+
+    def url(self, name):
+        public_base = self._setting("PUBLIC_BASE_URL")
+        if public_base:
+            return f"{public_base.rstrip('/')}/{quote(self._key(name), safe='/~')}"
+        return self.presigned_download_url(name)
+
+
+@deconstructible(path="api.s3.ContentAddressedS3Storage")
+class ContentAddressedS3Storage(ContentAddressedStorageMixin, S3Storage):
+    pass
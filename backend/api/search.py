@@ -0,0 +1,311 @@
+"""Full-text search over published services and courses.
+
+On PostgreSQL each searchable table has a ``search_vector`` column kept up to
+date by a trigger (Spanish and English stems, title weighted above subtitle
+above body) and a GIN index on it. Both text-search configs are copies of the
+stock ones with the ``unaccent`` dictionary in front of the stemmer, so
+documents and queries are accent-folded the same way. On SQLite the same
+content is mirrored into an FTS5 table per model, also trigger-maintained,
+which keeps the search path exercised in tests. Other backends fall back to
+``icontains``.
+
+Every backend matches the last search term as a prefix, so results follow
+the user while they type.
+
+Migrations are generated at deploy time, so the vendor-specific DDL is
+installed idempotently from ``post_migrate`` (see ``install_search_schema``).
+"""
+
+import logging
+import re
+from dataclasses import dataclass
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import DatabaseError, connection as default_connection
+from django.db.models import F, Q
+from rest_framework.filters import SearchFilter
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CONFIGS = ("spanish", "english")
+UNACCENT_CONFIGS = {config: f"{config}_unaccent" for config in SEARCH_CONFIGS}
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+@dataclass(frozen=True)
+class SearchSource:
+    kind: str
+    table: str
+    title: str
+    subtitle: str
+    body: tuple
+
+    @property
+    def model(self):
+        from courses.models import Course
+        from services.models import Service
+
+        return {"service": Service, "course": Course}[self.kind]
+
+    @property
+    def fts_table(self):
+        return f"{self.table}_fts"
+
+    @property
+    def columns(self):
+        return (self.title, self.subtitle, *self.body)
+
+
+SOURCES = (
+    SearchSource("service", "services_service", "title", "subtitle", ("description", "requisites")),
+    SearchSource("course", "courses_course", "title", "subtitle", ("description",)),
+)
+SOURCES_BY_KIND = {source.kind: source for source in SOURCES}
+
+
+def search_backend(connection=None):
+    vendor = (connection or default_connection).vendor
+    if vendor in ("postgresql", "sqlite"):
+        return vendor
+    return None
+
+
+# Schema installation
+
+def _postgres_config_statements():
+    statements = ["CREATE EXTENSION IF NOT EXISTS unaccent"]
+    for config, name in UNACCENT_CONFIGS.items():
+        statements += [
+            f"""
+            DO $$
+            BEGIN
+                IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = '{name}') THEN
+                    CREATE TEXT SEARCH CONFIGURATION {name} (COPY = pg_catalog.{config});
+                END IF;
+            END
+            $$
+            """,
+            f"ALTER TEXT SEARCH CONFIGURATION {name} "
+            f"ALTER MAPPING FOR hword, hword_part, word WITH unaccent, {config}_stem",
+        ]
+    return statements
+
+
+def _postgres_vector(source, row=""):
+    def weighted(expression, weight):
+        return " || ".join(
+            f"setweight(to_tsvector('{name}', {expression}), '{weight}')"
+            for name in UNACCENT_CONFIGS.values()
+        )
+
+    body = " || ' ' || ".join(f"coalesce({row}{column}, '')" for column in source.body)
+    return " || ".join([
+        weighted(f"coalesce({row}{source.title}, '')", "A"),
+        weighted(f"coalesce({row}{source.subtitle}, '')", "B"),
+        weighted(body, "C"),
+    ])
+
+
+def _postgres_statements(source):
+    function = f"{source.table}_search_vector_update"
+    return [
+        f"""
+        CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := {_postgres_vector(source, "NEW.")};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        f"DROP TRIGGER IF EXISTS {source.table}_search_vector_trigger ON {source.table}",
+        f"""
+        CREATE TRIGGER {source.table}_search_vector_trigger
+        BEFORE INSERT OR UPDATE ON {source.table}
+        FOR EACH ROW EXECUTE FUNCTION {function}()
+        """,
+        f"CREATE INDEX IF NOT EXISTS {source.table}_search_gin ON {source.table} USING gin (search_vector)",
+        # Fill rows written before the trigger existed, or indexed with an
+        # older definition of the vector.
+        f"UPDATE {source.table} SET id = id "
+        f"WHERE search_vector IS DISTINCT FROM ({_postgres_vector(source)})",
+    ]
+
+
+def _sqlite_statements(source):
+    body = " || ' ' || ".join(f"coalesce(new.{column}, '')" for column in source.body)
+    values = f"new.id, new.draft, new.{source.title}, coalesce(new.{source.subtitle}, ''), {body}"
+    insert = (
+        f"INSERT INTO {source.fts_table}(rowid, draft, title, subtitle, body) VALUES ({values});"
+    )
+    delete = f"DELETE FROM {source.fts_table} WHERE rowid = old.id;"
+    backfill_body = " || ' ' || ".join(f"coalesce({column}, '')" for column in source.body)
+    return [
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {source.fts_table} USING fts5(
+            draft UNINDEXED, title, subtitle, body,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+        """,
+        f"CREATE TRIGGER IF NOT EXISTS {source.fts_table}_ai AFTER INSERT ON {source.table} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {source.fts_table}_au AFTER UPDATE ON {source.table} BEGIN {delete} {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {source.fts_table}_ad AFTER DELETE ON {source.table} BEGIN {delete} END",
+        f"""
+        INSERT INTO {source.fts_table}(rowid, draft, title, subtitle, body)
+        SELECT id, draft, {source.title}, coalesce({source.subtitle}, ''), {backfill_body}
+        FROM {source.table}
+        WHERE id NOT IN (SELECT rowid FROM {source.fts_table})
+        """,
+    ]
+
+
+def install_search_schema(connection=None):
+    """Create (or refresh) the triggers and indexes backing full-text search."""
+    connection = connection or default_connection
+    backend = search_backend(connection)
+    if backend is None:
+        return
+    tables = set(connection.introspection.table_names())
+    builder = _postgres_statements if backend == "postgresql" else _sqlite_statements
+    with connection.cursor() as cursor:
+        if backend == "postgresql":
+            for statement in _postgres_config_statements():
+                cursor.execute(statement)
+        for source in SOURCES:
+            if source.table not in tables:
+                continue
+            for statement in builder(source):
+                cursor.execute(statement)
+
+
+def install_search_schema_on_migrate(sender, using="default", **kwargs):
+    from django.db import connections
+
+    try:
+        install_search_schema(connections[using])
+    except DatabaseError:
+        logger.exception("Could not install full-text search schema on %s", using)
+
+
+# Queries
+
+def _terms(query):
+    return WORD_RE.findall(query or "")
+
+
+def _fts5_query(terms):
+    # Quote every term so user input is never parsed as FTS5 syntax; the
+    # trailing * makes the last word match as a prefix while typing.
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _tsquery(terms):
+    # Terms are plain \w+ runs, so they never carry to_tsquery operators; the
+    # trailing :* mirrors the FTS5 prefix match on the last word.
+    return " & ".join([*terms[:-1], f"{terms[-1]}:*"])
+
+
+def _postgres_query(terms):
+    search_query = None
+    for name in UNACCENT_CONFIGS.values():
+        part = SearchQuery(_tsquery(terms), config=name, search_type="raw")
+        search_query = part if search_query is None else search_query | part
+    return search_query
+
+
+def _sqlite_matches(source, terms, include_drafts, limit=None):
+    sql = (
+        f"SELECT rowid, -bm25({source.fts_table}, 0, 10.0, 4.0, 1.0) AS rank "
+        f"FROM {source.fts_table} WHERE {source.fts_table} MATCH %s"
+    )
+    params = [_fts5_query(terms)]
+    if not include_drafts:
+        sql += " AND draft = 0"
+    sql += " ORDER BY rank DESC"
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit)
+    with default_connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _icontains(terms, fields):
+    condition = Q()
+    for term in terms:
+        term_condition = Q()
+        for field in fields:
+            term_condition |= Q(**{f"{field}__icontains": term})
+        condition &= term_condition
+    return condition
+
+
+def filter_queryset_by_search(queryset, query, fallback_fields=()):
+    """Restrict ``queryset`` to rows matching ``query`` using the FTS backend.
+
+    ``fallback_fields`` the index does not cover (e.g. ``slug``) are matched
+    with ``icontains`` alongside it; without an FTS backend all of them are.
+    """
+    terms = _terms(query)
+    if not terms:
+        return queryset
+    source = next((s for s in SOURCES if s.model is queryset.model), None)
+    backend = search_backend()
+    if source is None or backend is None:
+        return queryset.filter(_icontains(terms, fallback_fields))
+    if backend == "postgresql":
+        condition = Q(search_vector=_postgres_query(terms))
+    else:
+        condition = Q(pk__in=[row[0] for row in _sqlite_matches(source, terms, include_drafts=True)])
+    unindexed = [field for field in fallback_fields if field not in source.columns]
+    if unindexed:
+        condition |= _icontains(terms, unindexed)
+    return queryset.filter(condition)
+
+
+class FullTextSearchFilter(SearchFilter):
+    """``?search=`` backed by the full-text index instead of ``ILIKE`` scans.
+
+    ``search_fields`` outside the index are matched with ``icontains`` (see
+    ``filter_queryset_by_search``).
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        params = getattr(request, "query_params", None) or getattr(request, "GET", {})
+        query = params.get(self.search_param, "")
+        return filter_queryset_by_search(queryset, query, getattr(view, "search_fields", ()))
+
+
+def search_catalogue(query, *, kinds=None, include_drafts=False, limit=20):
+    """Return ``(rank, kind, obj)`` tuples across services and courses, best first."""
+    terms = _terms(query)
+    if not terms:
+        return []
+    backend = search_backend()
+    sources = [SOURCES_BY_KIND[kind] for kind in (kinds or SOURCES_BY_KIND)]
+    results = []
+    for source in sources:
+        model = source.model
+        queryset = model.objects.all()
+        if not include_drafts:
+            queryset = queryset.filter(draft=False)
+
+        if backend == "postgresql":
+            search_query = _postgres_query(terms)
+            matches = (
+                queryset.filter(search_vector=search_query)
+                .annotate(rank=SearchRank(F("search_vector"), search_query))
+                .order_by("-rank")[:limit]
+            )
+            results.extend((match.rank, source.kind, match) for match in matches)
+        elif backend == "sqlite":
+            ranks = dict(_sqlite_matches(source, terms, include_drafts, limit))
+            for obj in queryset.filter(pk__in=ranks):
+                results.append((ranks[obj.pk], source.kind, obj))
+        else:
+            for obj in filter_queryset_by_search(queryset, query, ("title", "subtitle", "description"))[:limit]:
+                results.append((0.0, source.kind, obj))
+
+    results.sort(key=lambda item: item[0], reverse=True)
+    return results[:limit]
@@ -0,0 +1,163 @@
+"""Serve stored files without pushing their bytes through Python.
+
+With ``SENDFILE_BACKEND = "x-accel-redirect"`` (nginx) or ``"x-sendfile"``
+(Apache/lighttpd), the view only sets headers and the front proxy sends the
+file, ranges included. Without a proxy the file is streamed from an open
+descriptor, so gunicorn can use ``sendfile()`` for whole files and for
+single byte ranges alike.
+
+Every response carries a strong ETag built from the content hash.
+Versioned URLs (``?v=`` set to the hash prefix from ``file_version``) are
+marked immutable, so browsers and CDNs keep them for good. Unversioned
+requests always revalidate.
+"""
+
+import hashlib
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import content_disposition_header, parse_etags, quote_etag
+
+from .storage import content_digest
+
+VERSION_LENGTH = 16
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+RANGE_NOT_SATISFIABLE = "unsatisfiable"
+
+
+def file_digest(field_file):
+    """SHA-256 of a stored file: the ``MediaBlob`` digest, or hashed once and cached."""
+    storage = field_file.storage
+    digest = storage.digest(field_file.name) if hasattr(storage, "digest") else None
+    if digest:
+        return digest
+    size = field_file.size
+    key = "file-digest:" + hashlib.sha256(f"{field_file.name}:{size}".encode()).hexdigest()
+    cache = caches["default"]
+    digest = cache.get(key)
+    if digest is None:
+        with storage.open(field_file.name, "rb") as stored:
+            digest, _size = content_digest(stored)
+        cache.set(key, digest, timeout=None)
+    return digest
+
+
+def file_version(field_file):
+    return file_digest(field_file)[:VERSION_LENGTH]
+
+
+def parse_byte_range(header, size):
+    """Return ``(start, end)`` for a single ``bytes=`` range, inclusive.
+
+    None means "send the whole file": no header, a malformed one, or several
+    ranges (which servers may answer with the full body).
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    spec = header[len("bytes="):].strip()
+    if "," in spec:
+        return None
+    first, separator, last = spec.partition("-")
+    if not separator:
+        return None
+    try:
+        if first == "":
+            suffix = int(last)
+            if suffix <= 0 or size == 0:
+                return RANGE_NOT_SATISFIABLE
+            return max(size - suffix, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return RANGE_NOT_SATISFIABLE
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+class FileRange:
+    """Read at most ``length`` bytes of ``file`` from its current position.
+
+    ``fileno`` is kept so WSGI servers can still ``sendfile()`` the range:
+    gunicorn sends Content-Length bytes from the descriptor's offset.
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def _stream(request, field_file, etag, filename, content_type):
+    storage = field_file.storage
+    size = storage.size(field_file.name)
+    byte_range = None
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if not if_range or if_range == etag:
+        byte_range = parse_byte_range(request.META.get("HTTP_RANGE"), size)
+    if byte_range == RANGE_NOT_SATISFIABLE:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    stored = storage.open(field_file.name, "rb")
+    if byte_range is None:
+        response = FileResponse(stored, as_attachment=True, filename=filename, content_type=content_type)
+        response["Content-Length"] = size
+        return response
+    start, end = byte_range
+    stored.seek(start)
+    response = FileResponse(
+        FileRange(stored, end - start + 1), status=206, as_attachment=True, filename=filename,
+        content_type=content_type,
+    )
+    response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Content-Length"] = end - start + 1
+    return response
+
+
+def serve_file(request, field_file, *, filename, content_type, version=None, digest=None):
+    """Answer a download of ``field_file``, honouring conditional and range requests.
+
+    Pass ``digest`` when the caller already stores the content hash.
+    """
+    digest = digest or file_digest(field_file)
+    etag = quote_etag(digest)
+    immutable = version is not None and version == digest[:VERSION_LENGTH]
+
+    if_none_match = parse_etags(request.META.get("HTTP_IF_NONE_MATCH") or "")
+    if etag in if_none_match or "*" in if_none_match:
+        response = HttpResponseNotModified()
+    elif settings.SENDFILE_BACKEND == "x-accel-redirect":
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = settings.SENDFILE_URL_PREFIX.rstrip("/") + "/" + quote(field_file.name)
+        response["Content-Disposition"] = content_disposition_header(True, filename)
+    elif settings.SENDFILE_BACKEND == "x-sendfile":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = field_file.storage.path(field_file.name)
+        response["Content-Disposition"] = content_disposition_header(True, filename)
+    else:
+        response = _stream(request, field_file, etag, filename, content_type)
+
+    response["ETag"] = etag
+    response["Accept-Ranges"] = "bytes"
+    response["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+    return response
@@ -0,0 +1,25 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from courses.models import Course, Enrollment
+from services.models import Service
+from terms.models import Terms
+
+from .response_cache import bump_generation
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+@receiver(post_save, sender=Terms)
+@receiver(post_delete, sender=Terms)
+def invalidate_cached_responses(sender, **kwargs):
+    label = sender._meta.label_lower
+    bump_generation(label)
+    # Bump again once the write is visible, so a response cached from the
+    # pre-commit state by a concurrent reader is orphaned as well.
+    transaction.on_commit(lambda: bump_generation(label))
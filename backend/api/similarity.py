@@ -0,0 +1,26 @@
+"""Helpers shared by the precomputed recommendation tables."""
+
+import numpy as np
+
+
+def top_neighbours(similarity, candidates, top_k, min_score):
+    """Yield ``(row, [(column, score), ...])`` with the best candidate columns per row.
+
+    ``similarity`` is a square item-item matrix and ``candidates`` a boolean
+    mask of the columns that may be recommended. An item is never its own
+    neighbour, and scores below ``min_score`` are dropped.
+    """
+    similarity = np.array(similarity, dtype=np.float64)
+    np.fill_diagonal(similarity, -np.inf)
+    similarity[:, ~candidates] = -np.inf
+    k = min(top_k, similarity.shape[1])
+    if k <= 0:
+        return
+    best = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+    for row in range(similarity.shape[0]):
+        columns = best[row][np.argsort(-similarity[row, best[row]])]
+        yield row, [
+            (int(column), float(similarity[row, column]))
+            for column in columns
+            if similarity[row, column] >= min_score
+        ]
@@ -0,0 +1,260 @@
+"""Slow query log with EXPLAIN plans.
+
+Every database connection gets an ``execute_wrapper`` that times its
+statements. A statement slower than ``SLOW_QUERY_THRESHOLD_MS`` is stored
+in a fixed-size ring buffer in the ``SLOW_QUERY_CACHE_ALIAS`` cache. Each
+entry holds the SQL, its parameters, the view or command that ran it and
+its plan: ``EXPLAIN (ANALYZE off)`` on PostgreSQL, ``EXPLAIN QUERY PLAN`` on
+SQLite. Use a shared cache (Redis) so entries from every worker end up in
+one buffer.
+
+Parameters are recorded as type and length only, unless
+``SLOW_QUERY_CAPTURE_PARAMS`` is on. Even then, statements touching tables
+that hold credentials (tokens, password and OTP hashes, sessions, queued
+emails) keep only the redacted form, so the log never exposes secrets.
+
+The plan is taken on a bare backend cursor. It skips the execute wrappers
+and ``connection.queries``, so it is neither logged again nor counted by
+``assertNumQueries``. Inside a PostgreSQL transaction it runs in a
+savepoint, so a failing EXPLAIN cannot abort the caller's transaction.
+
+``GET /api/slow-queries/`` (staff) and ``manage.py slow_queries`` list the
+entries or aggregate them by normalized-statement fingerprint.
+"""
+
+import hashlib
+import logging
+import re
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+SEQUENCE_KEY = "slow-query:seq"
+ENTRY_KEY_PREFIX = "slow-query:entry"
+MAX_SQL_LENGTH = 10000
+MAX_PARAM_LENGTH = 200
+EXPLAIN_PREFIXES = {
+    "postgresql": "EXPLAIN (ANALYZE off) ",
+    "sqlite": "EXPLAIN QUERY PLAN ",
+    "mysql": "EXPLAIN ",
+}
+EXPLAINABLE = ("select", "with", "update", "delete")
+SENSITIVE_TABLES = (
+    "authtoken_token",
+    "authentication_tokenlease",
+    "users_customuser",
+    "users_emailverificationotp",
+    "users_emailnotificationjob",
+    "django_session",
+)
+
+_caller = ContextVar("slow_query_caller", default=None)
+_capturing = threading.local()
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+_SENSITIVE = re.compile(r"\b(?:%s)\b" % "|".join(SENSITIVE_TABLES), re.IGNORECASE)
+
+
+def _cache():
+    return caches[settings.SLOW_QUERY_CACHE_ALIAS]
+
+
+def normalize(sql):
+    """Collapse literals, placeholder lists and whitespace so equivalent statements match."""
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = sql.replace("%s", "?")
+    sql = _PLACEHOLDER_LIST.sub("(...)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+def fingerprint(sql):
+    return hashlib.sha1(normalize(sql).encode()).hexdigest()[:16]
+
+
+def current_caller():
+    """The view (``"GET service-list"``), command or thread running the current query."""
+    request = _caller.get()
+    if request is not None:
+        from .timing import route_name
+
+        return route_name(request)
+    if threading.current_thread() is not threading.main_thread():
+        return f"thread:{threading.current_thread().name}"
+    if len(sys.argv) > 1 and sys.argv[0].endswith("manage.py"):
+        return f"command:{sys.argv[1]}"
+    return "unknown"
+
+
+def _param(value):
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    text = str(value)
+    return text if len(text) <= MAX_PARAM_LENGTH else text[:MAX_PARAM_LENGTH] + "…"
+
+
+def _redacted(value):
+    if value is None:
+        return None
+    return f"<{type(value).__name__}:{len(str(value))}>"
+
+
+def _params(sql, params):
+    if params is None:
+        return None
+    capture = settings.SLOW_QUERY_CAPTURE_PARAMS and not _SENSITIVE.search(sql)
+    convert = _param if capture else _redacted
+    if isinstance(params, dict):
+        return {key: convert(value) for key, value in params.items()}
+    return [convert(value) for value in params]
+
+
+def explain(connection, sql, params):
+    """Return the plan of ``sql`` as text, or None if the backend or statement is not supported."""
+    prefix = EXPLAIN_PREFIXES.get(connection.vendor)
+    if prefix is None or not sql.lstrip().lower().startswith(EXPLAINABLE):
+        return None
+    savepoint = connection.vendor == "postgresql" and not connection.get_autocommit()
+    cursor = connection.create_cursor()
+    try:
+        if savepoint:
+            cursor.execute("SAVEPOINT slow_query_explain")
+        try:
+            cursor.execute(prefix + sql, params)
+            rows = cursor.fetchall()
+        except Exception:
+            if savepoint:
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            raise
+        if savepoint:
+            cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+    finally:
+        cursor.close()
+    return "\n".join(str(row[-1]) for row in rows)
+
+
+def record(entry):
+    """Append ``entry`` to the shared ring buffer."""
+    cache = _cache()
+    cache.add(SEQUENCE_KEY, 0, timeout=None)
+    sequence = cache.incr(SEQUENCE_KEY)
+    entry["seq"] = sequence
+    slot = sequence % settings.SLOW_QUERY_LOG_SIZE
+    cache.set(f"{ENTRY_KEY_PREFIX}:{slot}", entry, timeout=settings.SLOW_QUERY_RETENTION_SECONDS)
+
+
+def _capture(connection, sql, params, many, elapsed):
+    plan = None
+    if settings.SLOW_QUERY_EXPLAIN and not many:
+        try:
+            plan = explain(connection, sql, params)
+        except Exception as exc:
+            plan = f"EXPLAIN failed: {exc}"
+    record({
+        "at": datetime.now(timezone.utc).isoformat(),
+        "duration_ms": round(elapsed * 1000, 3),
+        "alias": connection.alias,
+        "caller": current_caller(),
+        "fingerprint": fingerprint(sql),
+        "sql": sql[:MAX_SQL_LENGTH],
+        "params": None if many else _params(sql, params),
+        "many": many,
+        "plan": plan,
+    })
+
+
+def slow_query_wrapper(execute, sql, params, many, context):
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    elapsed = time.perf_counter() - started
+    threshold = settings.SLOW_QUERY_THRESHOLD_MS
+    if threshold and elapsed * 1000 >= threshold and not getattr(_capturing, "active", False):
+        _capturing.active = True
+        try:
+            _capture(context["connection"], sql, params, many, elapsed)
+        except Exception:
+            logger.warning("Could not record slow query", exc_info=True)
+        finally:
+            _capturing.active = False
+    return result
+
+
+def install_slow_query_wrapper(sender, connection, **kwargs):
+    """``connection_created`` receiver: time every statement on the new connection."""
+    if slow_query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(slow_query_wrapper)
+
+
+class SlowQueryMiddleware:
+    """Lets slow queries name the view that ran them."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _caller.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _caller.reset(token)
+
+
+def entries(limit=None):
+    """Recorded slow queries, newest first."""
+    cache = _cache()
+    sequence = cache.get(SEQUENCE_KEY) or 0
+    size = settings.SLOW_QUERY_LOG_SIZE
+    oldest = max(sequence - size + 1, 1)
+    keys = [f"{ENTRY_KEY_PREFIX}:{number % size}" for number in range(sequence, oldest - 1, -1)]
+    found = cache.get_many(keys)
+    result = [
+        found[key] for key, number in zip(keys, range(sequence, oldest - 1, -1))
+        if key in found and found[key].get("seq") == number
+    ]
+    return result[:limit] if limit else result
+
+
+def aggregate(items):
+    """Group entries by fingerprint, heaviest total time first."""
+    groups = {}
+    for item in items:
+        group = groups.get(item["fingerprint"])
+        if group is None:
+            group = groups[item["fingerprint"]] = {
+                "fingerprint": item["fingerprint"],
+                "query": normalize(item["sql"]),
+                "count": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "callers": set(),
+                "slowest": item,
+            }
+        group["count"] += 1
+        group["total_ms"] += item["duration_ms"]
+        group["callers"].add(item["caller"])
+        if item["duration_ms"] >= group["max_ms"]:
+            group["max_ms"] = item["duration_ms"]
+            group["slowest"] = item
+    result = []
+    for group in groups.values():
+        group["total_ms"] = round(group["total_ms"], 3)
+        group["mean_ms"] = round(group["total_ms"] / group["count"], 3)
+        group["callers"] = sorted(group["callers"])
+        result.append(group)
+    return sorted(result, key=lambda group: group["total_ms"], reverse=True)
+
+
+def clear():
+    cache = _cache()
+    cache.delete_many([f"{ENTRY_KEY_PREFIX}:{slot}" for slot in range(settings.SLOW_QUERY_LOG_SIZE)])
+    cache.delete(SEQUENCE_KEY)
@@ -0,0 +1,179 @@
+"""Content-addressed, reference-counted media storage.
+
+Uploads are hashed while they are saved. The first upload of some content
+is written as ``<upload dir>/<original stem>.<hash prefix><ext>`` and gets a
+``MediaBlob`` row; later uploads of identical bytes (or duplicated
+courses/services, via ``share_file``) reuse that file and bump its
+reference count instead of writing another copy. ``delete`` drops one
+reference and only removes the file when the last one goes away.
+
+Files saved before this storage was enabled have no ``MediaBlob`` row and
+are treated as having a single reference.
+
+Two workers saving the same new content at once both write a file. The one
+whose ``MediaBlob`` insert loses the unique-digest race shares the winner's
+row and removes its own copy.
+"""
+
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+
+HASH_PREFIX_LENGTH = 16
+
+
+def content_digest(content):
+    """Return ``(sha256 hex digest, size)`` of a Django ``File``, rewinding it afterwards."""
+    digest = hashlib.sha256()
+    size = 0
+    if hasattr(content, "seek"):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+        size += len(chunk)
+    if hasattr(content, "seek"):
+        content.seek(0)
+    return digest.hexdigest(), size
+
+
+class ContentAddressedStorageMixin:
+    """Dedupe saves by content hash and reference-count deletes.
+
+    Mix into any Django storage class; it only relies on the public
+    ``save``/``exists``/``delete``/``open`` API of the base class.
+    """
+
+    def _blobs(self):
+        from .models import MediaBlob
+
+        return MediaBlob.objects
+
+    def _create_blob(self, digest, name, size):
+        """Record ``name`` as the file for ``digest`` and return the name to store.
+
+        That is ``name`` itself, or the file of a concurrent save that
+        recorded the same content first.
+        """
+        try:
+            with transaction.atomic():
+                self._blobs().create(digest=digest, name=name, size=size, references=1)
+            return name
+        except IntegrityError:
+            blob = self._blobs().select_for_update().filter(digest=digest).first()
+            if blob is None:
+                raise
+        self._blobs().filter(pk=blob.pk).update(references=F("references") + 1)
+        return blob.name
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            from django.core.files import File
+
+            content = File(content, name)
+        digest, size = content_digest(content)
+
+        with transaction.atomic():
+            blob = self._blobs().select_for_update().filter(digest=digest).first()
+            if blob is not None and super().exists(blob.name):
+                self._blobs().filter(pk=blob.pk).update(references=F("references") + 1)
+                return blob.name
+
+            directory, filename = os.path.split(name)
+            stem, ext = os.path.splitext(filename)
+            prefix = digest[:HASH_PREFIX_LENGTH]
+            if not stem.endswith(prefix):  # callers may already put the hash in the name
+                stem = f"{stem}.{prefix}"
+            hashed = os.path.join(directory, f"{stem}{ext.lower()}")
+            stored = super().save(hashed, content, max_length=max_length)
+            if blob is None:
+                shared = self._create_blob(digest, stored, size)
+                if shared != stored:
+                    super().delete(stored)
+                return shared
+            # The row outlived its file (e.g. removed by hand); start over.
+            self._blobs().filter(pk=blob.pk).update(name=stored, size=size, references=1)
+            return stored
+
+    def add_reference(self, name):
+        """Record one more owner of ``name`` (used to share a file without copying it)."""
+        with transaction.atomic():
+            updated = self._blobs().filter(name=name).update(references=F("references") + 1)
+            if not updated:
+                # A file from before dedup existed: its current owner plus the new one.
+                with self.open(name, "rb") as existing:
+                    digest, size = content_digest(existing)
+                try:
+                    with transaction.atomic():
+                        self._blobs().create(digest=digest, name=name, size=size, references=2)
+                except IntegrityError:
+                    # A concurrent call adopted it first; count this owner on top.
+                    self._blobs().filter(name=name).update(references=F("references") + 1)
+        return name
+
+    def adopt(self, name):
+        """Take ownership of ``name``, written outside ``save`` (a direct upload).
+
+        Returns the name to store: ``name`` itself, or an existing file with
+        the same content.
+        """
+        digest = getattr(self, "stored_digest", lambda name: None)(name)
+        size = None
+        if digest is None:
+            with self.open(name, "rb") as uploaded:
+                digest, size = content_digest(uploaded)
+        with transaction.atomic():
+            blob = self._blobs().select_for_update().filter(Q(name=name) | Q(digest=digest)).first()
+            if blob is not None and (blob.name == name or super().exists(blob.name)):
+                self._blobs().filter(pk=blob.pk).update(references=F("references") + 1)
+                return blob.name
+            if size is None:
+                size = self.size(name)
+            if blob is None:
+                return self._create_blob(digest, name, size)
+            self._blobs().filter(pk=blob.pk).update(name=name, size=size, references=1)
+            return name
+
+    def digest(self, name):
+        """SHA-256 hex digest of ``name``'s content, or None if it has no ``MediaBlob``."""
+        return self._blobs().filter(name=name).values_list("digest", flat=True).first()
+
+    def references(self, name):
+        blob = self._blobs().filter(name=name).only("references").first()
+        if blob is None:
+            return 1 if super().exists(name) else 0
+        return blob.references
+
+    def delete(self, name):
+        with transaction.atomic():
+            blob = self._blobs().select_for_update().filter(name=name).first()
+            if blob is not None and blob.references > 1:
+                self._blobs().filter(pk=blob.pk).update(references=F("references") - 1)
+                return
+            if blob is not None:
+                blob.delete()
+            super().delete(name)
+
+
+class ContentAddressedFileSystemStorage(ContentAddressedStorageMixin, FileSystemStorage):
+    pass
+
+
+def share_file(field_file):
+    """Return a name another model can store to point at ``field_file``'s content.
+
+    Content-addressed storages just add a reference; other storages get a
+    streamed copy.
+    """
+    storage = field_file.storage
+    if hasattr(storage, "add_reference"):
+        return storage.add_reference(field_file.name)
+    field_file.open("rb")
+    try:
+        return storage.save(field_file.name, field_file)
+    finally:
+        field_file.close()
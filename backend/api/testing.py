@@ -0,0 +1,103 @@
+"""Test helpers: cache resets and query-budget assertions for API endpoints.
+
+``reset_caches`` empties every cache the app keeps between requests (Django
+caches, per-process LRUs, the token snapshot cache and the autocomplete
+index). Throttle buckets, cached responses and recorded diagnostics otherwise
+carry over from one test to the next. Under pytest the autouse fixture in
+conftest.py calls it; test classes that depend on empty caches call it in
+``setUp`` too, so ``manage.py test`` behaves the same.
+
+Query budgets catch N+1 regressions.
+
+``assertQueryBudget`` requests an endpoint against datasets of growing size
+(1, 10, 100 and 1000 rows by default). It fails when the query count grows
+with the row count, or when any run goes over the declared budget. The
+failure message lists the offending queries by fingerprint, normalized as in
+the slow query log.
+
+Each run starts with empty caches and with the response cache disabled, so
+every size measures the same cold code path.
+"""
+
+from collections import Counter
+
+from django.core.cache import caches
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .cache import clear_local_caches
+from .slow_queries import fingerprint, normalize
+
+DATASET_SIZES = (1, 10, 100, 1000)
+
+
+def reset_caches():
+    from users.services.token_cache import get_token_cache
+
+    from .autocomplete import reset_autocomplete_index
+
+    for cache in caches.all():
+        cache.clear()
+    clear_local_caches()
+    get_token_cache().clear()
+    reset_autocomplete_index()
+
+
+def _describe(counts, statements, limit=10):
+    lines = []
+    for key, count in counts.most_common(limit):
+        lines.append(f"  {count:>5} x {key}  {normalize(statements[key])[:200]}")
+    return lines
+
+
+class QueryBudgetMixin:
+    """Mix into an ``APITestCase``. Authenticate ``self.client`` before asserting."""
+
+    query_budget_sizes = DATASET_SIZES
+
+    def assertQueryBudget(self, url, data=None, *, budget, populate, sizes=None, **extra):
+        """Check that ``GET url`` runs at most ``budget`` queries, whatever the row count.
+
+        ``populate(start, stop)`` must add the rows numbered ``start`` to
+        ``stop - 1``. It is called once per size with the next slice.
+        """
+        sizes = sizes or self.query_budget_sizes
+        runs = []
+        created = 0
+        for size in sizes:
+            populate(created, size)
+            created = size
+            reset_caches()
+            with override_settings(RESPONSE_CACHE_ENABLED=False), CaptureQueriesContext(connection) as captured:
+                response = self.client.get(url, data, **extra)
+            self.assertEqual(response.status_code, 200, f"GET {url} with {size} rows returned {response.status_code}")
+            statements = {}
+            counts = Counter()
+            for query in captured.captured_queries:
+                key = fingerprint(query["sql"])
+                statements.setdefault(key, query["sql"])
+                counts[key] += 1
+            runs.append((size, counts, statements))
+
+        problems = []
+        (first_size, first_counts, _), (last_size, last_counts, last_statements) = runs[0], runs[-1]
+        first_total, last_total = sum(first_counts.values()), sum(last_counts.values())
+        if last_total > first_total:
+            grown = Counter({key: count - first_counts[key] for key, count in last_counts.items()
+                             if count > first_counts[key]})
+            problems.append(
+                f"query count grows with rows: {first_total} at {first_size} rows, {last_total} at {last_size} rows. "
+                f"Extra queries at {last_size} rows:"
+            )
+            problems.extend(_describe(grown, last_statements))
+        for size, counts, statements in runs:
+            total = sum(counts.values())
+            if total > budget:
+                problems.append(f"{total} queries at {size} rows, over the budget of {budget}:")
+                problems.extend(_describe(counts, statements))
+                break
+
+        if problems:
+            self.fail(f"GET {url}: " + "\n".join(problems))
+        return [sum(counts.values()) for _size, counts, _statements in runs]
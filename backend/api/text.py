@@ -0,0 +1,13 @@
+"""Text normalization shared by autocomplete and recommendations."""
+
+import re
+import unicodedata
+
+NON_WORD_RE = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def normalize(text):
+    """Fold accents and case and collapse everything else to single spaces."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return NON_WORD_RE.sub(" ", stripped.casefold()).strip()
@@ -0,0 +1,270 @@
+"""Per-request timing: wall clock, SQL, outbound HTTP and serializers.
+
+``ServerTimingMiddleware`` instruments a sampled fraction of requests
+(``PERF_SAMPLE_RATE``) plus any request that sends ``X-Server-Timing: 1``.
+Unsampled requests pay for one ``random()`` call and a header lookup.
+
+On an instrumented request:
+
+* SQL is counted and timed through ``connection.execute_wrapper``.
+* ``requests.Session.send`` is timed. That covers BillionMail, Stripe (its
+  default HTTP client is ``requests``), Google OAuth and S3. Each call is
+  attributed to a service by host.
+* ``Serializer.data``, ``ListSerializer.data`` and ``is_valid`` are timed.
+  Only the outermost call counts, so nested serializers are not counted
+  twice.
+
+The totals are added to per-route histograms (``route_timing_stats``).
+Staff users also get them back as a ``Server-Timing`` header. With
+``METRICS_ENABLED``, every request's wall time also goes into its route's
+histogram, for ``/metrics``. That costs another microsecond or two.
+"""
+
+import contextvars
+import random
+import threading
+import time
+from contextlib import ExitStack
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+FORCE_HEADER = "HTTP_X_SERVER_TIMING"
+COMPONENTS = ("total", "db", "http", "serialize")
+# Histogram upper bounds in seconds (Prometheus' defaults).
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Outbound host suffix -> service name. BillionMail and S3 endpoints are
+# also matched by the hosts configured in settings.
+OUTBOUND_SERVICES = (
+    ("stripe.com", "stripe"),
+    ("googleapis.com", "google"),
+    ("google.com", "google"),
+    ("billionmail.com", "billionmail"),
+)
+
+_current = contextvars.ContextVar("request_timing", default=None)
+
+
+class RequestTiming:
+    """Totals for one request. Also the ``execute_wrapper`` that feeds them."""
+
+    __slots__ = ("db_count", "db_time", "http", "http_depth", "serialize_time", "serializing")
+
+    def __init__(self):
+        self.db_count = 0
+        self.db_time = 0.0
+        self.http = {}
+        self.http_depth = 0
+        self.serialize_time = 0.0
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.db_count += 1
+
+    @property
+    def http_time(self):
+        return sum(self.http.values())
+
+    def server_timing(self, total):
+        entries = [
+            f"total;dur={total * 1000:.2f}",
+            f'db;dur={self.db_time * 1000:.2f};desc="{self.db_count} queries"',
+            f"http;dur={self.http_time * 1000:.2f}",
+        ]
+        entries.extend(f"http-{service};dur={elapsed * 1000:.2f}" for service, elapsed in sorted(self.http.items()))
+        entries.append(f"serialize;dur={self.serialize_time * 1000:.2f}")
+        return ", ".join(entries)
+
+
+def current_timing():
+    """The ``RequestTiming`` of the request being handled, or None if it is not sampled."""
+    return _current.get()
+
+
+def _host_matches(host, suffix):
+    return host == suffix or host.endswith("." + suffix)
+
+
+def outbound_service(url):
+    host = (urlsplit(url).hostname or "").lower()
+    for setting, service in (("BILLIONMAIL_BASE_URL", "billionmail"), ("S3_ENDPOINT_URL", "s3")):
+        configured = getattr(settings, setting, None)
+        if configured and host == (urlsplit(configured).hostname or "").lower():
+            return service
+    for suffix, service in OUTBOUND_SERVICES:
+        if _host_matches(host, suffix):
+            return service
+    return "other"
+
+
+class RouteTimingStats:
+    """Per-route histograms. ``total`` counts every request, the components only sampled ones."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def _empty(self):
+        return {
+            "queries": 0,
+            **{name: {"count": 0, "sum": 0.0, "buckets": [0] * len(BUCKETS)} for name in COMPONENTS},
+        }
+
+    @staticmethod
+    def _add(histogram, value):
+        histogram["count"] += 1
+        histogram["sum"] += value
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                histogram["buckets"][index] += 1
+                break
+
+    def observe(self, route, total, timing=None):
+        with self._lock:
+            entry = self._routes.get(route)
+            if entry is None:
+                entry = self._routes[route] = self._empty()
+            self._add(entry["total"], total)
+            if timing is not None:
+                entry["queries"] += timing.db_count
+                self._add(entry["db"], timing.db_time)
+                self._add(entry["http"], timing.http_time)
+                self._add(entry["serialize"], timing.serialize_time)
+
+    def snapshot(self):
+        """Per route: request count, sampled count, queries, and cumulative ``(le, count)`` buckets."""
+        with self._lock:
+            snapshot = {}
+            for route, entry in self._routes.items():
+                route_snapshot = {
+                    "count": entry["total"]["count"],
+                    "sampled": entry["db"]["count"],
+                    "queries": entry["queries"],
+                }
+                for name in COMPONENTS:
+                    histogram = entry[name]
+                    cumulative, buckets = 0, []
+                    for bound, count in zip(BUCKETS, histogram["buckets"]):
+                        cumulative += count
+                        buckets.append((bound, cumulative))
+                    buckets.append((float("inf"), histogram["count"]))
+                    route_snapshot[name] = {"count": histogram["count"], "sum": histogram["sum"], "buckets": buckets}
+                snapshot[route] = route_snapshot
+            return snapshot
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+_stats = RouteTimingStats()
+
+
+def route_timing_stats():
+    return _stats.snapshot()
+
+
+def reset_route_timing_stats():
+    _stats.reset()
+
+
+def route_name(request):
+    """``"<METHOD> <url name>"``, e.g. ``"GET service-list"``. Bounded, unlike raw paths."""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return f"{request.method} unmatched"
+    return f"{request.method} {match.view_name or match._func_path}"
+
+
+class ServerTimingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = settings.PERF_SAMPLE_RATE
+        if not (rate and random.random() < rate) and request.META.get(FORCE_HEADER) != "1":
+            if not settings.METRICS_ENABLED:
+                return self.get_response(request)
+            started = time.perf_counter()
+            response = self.get_response(request)
+            _stats.observe(route_name(request), time.perf_counter() - started)
+            metrics.maybe_flush()
+            return response
+
+        timing = RequestTiming()
+        token = _current.set(timing)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timing))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - started
+
+        _stats.observe(route_name(request), total, timing)
+        if settings.METRICS_ENABLED:
+            metrics.maybe_flush()
+        user = getattr(request, "user", None)
+        if user is not None and user.is_staff:
+            response["Server-Timing"] = timing.server_timing(total)
+        return response
+
+
+def _timed_send(send):
+    def timed_send(session, request, **kwargs):
+        timing = _current.get()
+        if timing is None or timing.http_depth:  # redirects re-enter send()
+            return send(session, request, **kwargs)
+        timing.http_depth += 1
+        started = time.perf_counter()
+        try:
+            return send(session, request, **kwargs)
+        finally:
+            timing.http_depth -= 1
+            service = outbound_service(request.url)
+            timing.http[service] = timing.http.get(service, 0.0) + time.perf_counter() - started
+
+    timed_send.__wrapped__ = send
+    return timed_send
+
+
+def _timed_serializer(method):
+    def timed(serializer, *args, **kwargs):
+        timing = _current.get()
+        if timing is None or timing.serializing:
+            return method(serializer, *args, **kwargs)
+        timing.serializing = True
+        started = time.perf_counter()
+        try:
+            return method(serializer, *args, **kwargs)
+        finally:
+            timing.serializing = False
+            timing.serialize_time += time.perf_counter() - started
+
+    timed.__wrapped__ = method
+    return timed
+
+
+def install():
+    """Hook outbound HTTP and DRF serializers. Called once from ``ApiConfig.ready``."""
+    import requests
+    from rest_framework import serializers
+
+    if not hasattr(requests.Session.send, "__wrapped__"):
+        requests.Session.send = _timed_send(requests.Session.send)
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        prop = cls.__dict__["data"]
+        if not hasattr(prop.fget, "__wrapped__"):
+            cls.data = property(_timed_serializer(prop.fget), doc=prop.__doc__)
+    if not hasattr(serializers.BaseSerializer.is_valid, "__wrapped__"):
+        serializers.BaseSerializer.is_valid = _timed_serializer(serializers.BaseSerializer.is_valid)
@@ -0,0 +1,107 @@
+"""Reject oversized or mistyped multipart uploads while they stream in.
+
+``LimitedUploadHandler`` runs before Django's memory/temporary-file
+handlers. It refuses multipart bodies larger than ``UPLOAD_MAX_REQUEST_BYTES``
+before reading them, checks the magic bytes of the first chunk of every
+file field listed in ``FIELD_TARGETS``, and stops as soon as such a file
+passes its size limit. A bad upload therefore costs a few kilobytes of
+I/O rather than spooling the whole body and decoding it with Pillow. The
+serializer and model checks still run for everything that gets through.
+
+``UploadLimitMultiPartParser`` turns a rejection into a DRF error response
+(413 for size, 400 for content). Plain Django views, such as the admin, get
+Django's 400 response for ``SuspiciousOperation``.
+"""
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousOperation
+from django.core.files.uploadhandler import FileUploadHandler
+from rest_framework import exceptions, status
+from rest_framework.parsers import MultiPartParser
+
+from .uploads import UPLOAD_TARGETS
+
+# Multipart file field -> upload target whose size and type limits apply.
+# Course and service images share the same limits.
+FIELD_TARGETS = {
+    "image": UPLOAD_TARGETS["course_image"],
+    "pdf_content": UPLOAD_TARGETS["terms_pdf"],
+}
+SNIFF_BYTES = 16
+
+
+def sniff_content_type(head):
+    """Return the content type given away by a file's first bytes, or None."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head.startswith(b"%PDF-"):
+        return "application/pdf"
+    return None
+
+
+class UploadRejected(SuspiciousOperation):
+    def __init__(self, message, field_name=None, too_large=False):
+        super().__init__(message)
+        self.message = message
+        self.field_name = field_name
+        self.too_large = too_large
+
+
+class LimitedUploadHandler(FileUploadHandler):
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length > settings.UPLOAD_MAX_REQUEST_BYTES:
+            raise UploadRejected("Request body is too large.", too_large=True)
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.target = FIELD_TARGETS.get(field_name)
+        self.head = b""
+        self.received = 0
+        if self.target is not None and self.content_length and self.content_length > self.target.max_size:
+            self._reject_size()
+
+    def _reject_size(self):
+        raise UploadRejected("File must be 1MB or less.", self.field_name, too_large=True)
+
+    def _check_type(self):
+        if sniff_content_type(self.head) not in self.target.content_types:
+            raise UploadRejected(
+                f"File content must be one of: {', '.join(self.target.content_types)}", self.field_name,
+            )
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.target is None:
+            return raw_data
+        if len(self.head) < SNIFF_BYTES:
+            self.head += raw_data[:SNIFF_BYTES - len(self.head)]
+            if len(self.head) == SNIFF_BYTES:
+                self._check_type()
+        self.received += len(raw_data)
+        if self.received > self.target.max_size:
+            self._reject_size()
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.target is not None and len(self.head) < SNIFF_BYTES:
+            self._check_type()  # tiny files never filled the sniff buffer
+        return None
+
+
+class UploadTooLarge(exceptions.ValidationError):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+
+class UploadLimitMultiPartParser(MultiPartParser):
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return super().parse(stream, media_type, parser_context)
+        except UploadRejected as rejection:
+            field = rejection.field_name
+            detail = {field: [rejection.message]} if field else {"detail": rejection.message}
+            raise (UploadTooLarge if rejection.too_large else exceptions.ValidationError)(detail)
@@ -0,0 +1,175 @@
+"""Direct browser uploads of course images, service images and terms PDFs.
+
+An admin first asks ``POST /api/uploads/`` for a ticket, declaring the
+target, file name, content type, size and SHA-256 of the file. If the
+same content is already stored, the ticket simply names its key and
+nothing has to be uploaded. Otherwise it carries a presigned PUT URL for a
+content-addressed key, signed so that the bucket only accepts exactly the
+declared bytes. The browser uploads straight to the bucket and then sends
+only the key (``image_key``/``pdf_key``) to the usual create/update
+endpoint, which checks the object and takes a reference to it.
+"""
+
+import os
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils.text import slugify
+from rest_framework import serializers
+
+from .storage import HASH_PREFIX_LENGTH
+
+MAX_UPLOAD_SIZE = 1024 * 1024  # 1MB, as for multipart uploads
+EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+    "application/pdf": ".pdf",
+}
+IMAGE_CONTENT_TYPES = ("image/jpeg", "image/png", "image/webp", "image/gif")
+
+
+@dataclass(frozen=True)
+class UploadTarget:
+    directory: str
+    content_types: tuple
+    max_size: int = MAX_UPLOAD_SIZE
+
+
+UPLOAD_TARGETS = {
+    "course_image": UploadTarget("course_images", IMAGE_CONTENT_TYPES),
+    "service_image": UploadTarget("service_images", IMAGE_CONTENT_TYPES),
+    "terms_pdf": UploadTarget("terms", ("application/pdf",)),
+}
+
+
+def supports_direct_upload(storage=None):
+    return hasattr(storage or default_storage, "presigned_upload")
+
+
+def object_key(target, filename, content_type, sha256):
+    """Content-addressed key, named like ``ContentAddressedStorageMixin.save`` names files."""
+    stem = slugify(os.path.splitext(os.path.basename(filename))[0])[:80] or "upload"
+    return f"{target.directory}/{stem}.{sha256[:HASH_PREFIX_LENGTH]}{EXTENSIONS[content_type]}"
+
+
+def issue_upload_ticket(target_name, *, filename, content_type, size, sha256, storage=None):
+    from .models import MediaBlob
+
+    storage = storage or default_storage
+    target = UPLOAD_TARGETS[target_name]
+    existing = MediaBlob.objects.filter(digest=sha256).values_list("name", flat=True).first()
+    if existing and existing.startswith(f"{target.directory}/") and storage.exists(existing):
+        return {"key": existing, "upload": None}
+
+    key = object_key(target, filename, content_type, sha256)
+    url, headers = storage.presigned_upload(key, content_type=content_type, size=size, sha256=sha256)
+    return {
+        "key": key,
+        "upload": {
+            "method": "PUT",
+            "url": url,
+            "headers": headers,
+            "expires_in": settings.S3_UPLOAD_EXPIRES_SECONDS,
+        },
+    }
+
+
+class UploadTicketSerializer(serializers.Serializer):
+    target = serializers.ChoiceField(choices=sorted(UPLOAD_TARGETS))
+    filename = serializers.CharField(max_length=255)
+    content_type = serializers.CharField(max_length=100)
+    size = serializers.IntegerField(min_value=1)
+    sha256 = serializers.RegexField(r"^[0-9a-f]{64}$")
+
+    def validate(self, data):
+        target = UPLOAD_TARGETS[data["target"]]
+        if data["content_type"] not in target.content_types:
+            raise serializers.ValidationError({
+                "content_type": f"Must be one of: {', '.join(target.content_types)}"
+            })
+        if data["size"] > target.max_size:
+            raise serializers.ValidationError({"size": "File must be 1MB or less."})
+        return data
+
+
+def _stored_object(storage, key):
+    """Return ``(size, content_type)`` of a stored object, or None if it is missing."""
+    if hasattr(storage, "head"):
+        headers = storage.head(key)
+        if headers is None:
+            return None
+        return int(headers.get("Content-Length", 0)), headers.get("Content-Type", "")
+    if not storage.exists(key):
+        return None
+    extension = os.path.splitext(key)[1].lower()
+    content_type = next((ctype for ctype, ext in EXTENSIONS.items() if ext == extension), "")
+    return storage.size(key), content_type
+
+
+class UploadedObjectKeyField(serializers.CharField):
+    """Write-only key of a direct upload for ``target`` (see ``issue_upload_ticket``)."""
+
+    def __init__(self, target, **kwargs):
+        self.target = UPLOAD_TARGETS[target]
+        kwargs.setdefault("write_only", True)
+        kwargs.setdefault("required", False)
+        kwargs.setdefault("max_length", 255)
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        key = super().to_internal_value(data)
+        if not key.startswith(f"{self.target.directory}/") or ".." in key.split("/"):
+            raise serializers.ValidationError("Not an upload key for this field.")
+        stored = _stored_object(default_storage, key)
+        if stored is None:
+            raise serializers.ValidationError("No uploaded file with this key.")
+        size, content_type = stored
+        if size > self.target.max_size:
+            raise serializers.ValidationError("File must be 1MB or less.")
+        if content_type not in self.target.content_types:
+            raise serializers.ValidationError("Uploaded file has an unsupported content type.")
+        return key
+
+
+class DirectUploadSerializerMixin:
+    """Accept uploaded object keys in place of files.
+
+    ``Meta.direct_upload_fields`` maps key fields to file fields, e.g.
+    ``{"image_key": "image"}``. A key stands in for the file during
+    validation; the storage only takes its reference in ``save()``, inside
+    the same transaction as the row.
+    """
+
+    def to_internal_value(self, data):
+        uploads = getattr(self.Meta, "direct_upload_fields", {})
+        for key_field, file_field in uploads.items():
+            if data.get(key_field) and file_field in self.fields:
+                self.fields[file_field].required = False
+        validated = super().to_internal_value(data)
+        self._direct_uploads = {}
+        for key_field, file_field in uploads.items():
+            key = validated.pop(key_field, None)
+            if key:
+                validated[file_field] = key
+                self._direct_uploads[file_field] = key
+        return validated
+
+    def save(self, **kwargs):
+        uploads = {
+            file_field: key
+            for file_field, key in getattr(self, "_direct_uploads", {}).items()
+            # Cleared in validate() (e.g. remove_image), or already the current file
+            if self.validated_data.get(file_field) == key
+            and not (self.instance is not None and getattr(self.instance, file_field).name == key)
+        }
+        if not uploads:
+            return super().save(**kwargs)
+        with transaction.atomic():
+            for file_field, key in uploads.items():
+                storage = self.Meta.model._meta.get_field(file_field).storage
+                kwargs[file_field] = storage.adopt(key) if hasattr(storage, "adopt") else key
+            return super().save(**kwargs)
@@ -1,10 +1,23 @@
 from django.urls import path, include
 
+from .views import (
+    AutocompleteView,
+    CatalogueSearchView,
+    DirectUploadView,
+    ProfilerTokenView,
+    SlowQueryLogView,
+)
+
 
 urlpatterns = [
     path('courses/', include('courses.urls')),
     path('terms/', include('terms.urls')),
     path('users/', include('users.urls')),
     path('services/', include('services.urls')),
+    path('search/', CatalogueSearchView.as_view(), name='catalogue-search'),
+    path('search/autocomplete/', AutocompleteView.as_view(), name='catalogue-autocomplete'),
+    path('uploads/', DirectUploadView.as_view(), name='direct-upload'),
+    path('slow-queries/', SlowQueryLogView.as_view(), name='slow-query-log'),
+    path('profiler/token/', ProfilerTokenView.as_view(), name='profiler-token'),
 
 ]
@@ -1,7 +1,159 @@
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse
 from django.views.decorators.http import require_GET
+from rest_framework import status
+from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import metrics as metrics_registry
+from . import profiling, slow_queries
+from .autocomplete import autocomplete
+from .search import SOURCES_BY_KIND, search_catalogue
+from .uploads import UploadTicketSerializer, issue_upload_ticket, supports_direct_upload
+
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 50
+AUTOCOMPLETE_DEFAULT_LIMIT = 8
+AUTOCOMPLETE_MAX_LIMIT = 20
+
+
+def _parse_limit(request, default, maximum):
+    try:
+        limit = int(request.query_params.get("limit", default))
+    except ValueError:
+        limit = default
+    return max(1, min(limit, maximum))
+
+
+def _parse_kinds(request):
+    kind = request.query_params.get("type")
+    return [kind] if kind in SOURCES_BY_KIND else None
 
 
 @require_GET
 def home(request):
     return JsonResponse({"msg": "API OK"})
+
+
+@require_GET
+def metrics(request):
+    """Prometheus scrape endpoint; hidden until METRICS_AUTH_TOKEN is set."""
+    if not settings.METRICS_ENABLED or not settings.METRICS_AUTH_TOKEN:
+        raise Http404
+    if not metrics_registry.scrape_allowed(request.META.get("HTTP_AUTHORIZATION")):
+        return HttpResponse(status=403)
+    return HttpResponse(metrics_registry.render(), content_type=metrics_registry.CONTENT_TYPE)
+
+
+class CatalogueSearchView(APIView):
+    """Ranked full-text search across services and courses.
+
+    ``?q=`` is the query, ``?type=service`` or ``?type=course`` restricts the
+    result kinds and ``?limit=`` caps the number of results.
+    """
+
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        query = (request.query_params.get("q") or "").strip()
+        limit = _parse_limit(request, SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT)
+        include_drafts = bool(request.user and request.user.is_staff)
+        results = search_catalogue(query, kinds=_parse_kinds(request), include_drafts=include_drafts, limit=limit)
+        return Response({
+            "query": query,
+            "results": [
+                {
+                    "type": result_kind,
+                    "id": obj.pk,
+                    "slug": obj.slug,
+                    "title": obj.title,
+                    "subtitle": obj.subtitle,
+                    "rank": round(float(rank), 6),
+                }
+                for rank, result_kind, obj in results
+            ],
+        })
+
+
+class AutocompleteView(APIView):
+    """Title type-ahead over services and courses from an in-memory index.
+
+    Takes the same ``?q=``, ``?type=`` and ``?limit=`` parameters as
+    ``CatalogueSearchView``; ``q`` matches the start of the title, of any word
+    in it, or of the slug, ignoring accents and case.
+    """
+
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        query = request.query_params.get("q") or ""
+        limit = _parse_limit(request, AUTOCOMPLETE_DEFAULT_LIMIT, AUTOCOMPLETE_MAX_LIMIT)
+        include_drafts = bool(request.user and request.user.is_staff)
+        suggestions = autocomplete(query, kinds=_parse_kinds(request), include_drafts=include_drafts, limit=limit)
+        return Response({
+            "query": query,
+            "results": [
+                {"type": suggestion.kind, "id": suggestion.id, "slug": suggestion.slug, "title": suggestion.title}
+                for suggestion in suggestions
+            ],
+        })
+
+
+class DirectUploadView(APIView):
+    """Issue a presigned upload ticket for a course image, service image or terms PDF.
+
+    See ``api.uploads``; the returned ``key`` is what the create/update
+    endpoints accept as ``image_key``/``pdf_key``.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        if not supports_direct_upload():
+            return Response(
+                {"detail": "Direct uploads need S3 media storage."},
+                status=status.HTTP_501_NOT_IMPLEMENTED,
+            )
+        serializer = UploadTicketSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        ticket = issue_upload_ticket(
+            data["target"], filename=data["filename"], content_type=data["content_type"],
+            size=data["size"], sha256=data["sha256"],
+        )
+        return Response(ticket, status=status.HTTP_201_CREATED)
+
+
+class SlowQueryLogView(APIView):
+    """Recent slow queries, or with ``?aggregate=1`` their totals per fingerprint.
+
+    ``DELETE`` empties the log.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        limit = _parse_limit(request, settings.SLOW_QUERY_LOG_SIZE, settings.SLOW_QUERY_LOG_SIZE)
+        entries = slow_queries.entries()
+        if request.query_params.get("aggregate") in ("1", "true"):
+            return Response({"fingerprints": slow_queries.aggregate(entries)[:limit]})
+        return Response({"entries": entries[:limit]})
+
+    def delete(self, request):
+        slow_queries.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ProfilerTokenView(APIView):
+    """Issue a short-lived token that turns on the profiler for requests that carry it."""
+
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        return Response({
+            "token": profiling.issue_token(request.user),
+            "header": "X-Profile",
+            "query_parameter": profiling.QUERY_PARAMETER,
+            "expires_in": settings.PROFILER_TOKEN_MAX_AGE_SECONDS,
+        }, status=status.HTTP_201_CREATED)
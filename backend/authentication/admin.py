@@ -1,3 +1,10 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import TokenLease
+
+
+@admin.register(TokenLease)
+class TokenLeaseAdmin(admin.ModelAdmin):
+    list_display = ("token", "expires_at", "last_used_at")
+    list_filter = ("expires_at",)
+    raw_id_fields = ("token",)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from rest_framework.authtoken.models import Token
+
+from authentication.utils import expired_tokens, grant_missing_leases
+
+
+class Command(BaseCommand):
+    help = "Delete expired API tokens (and their leases) in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = max(options["batch_size"], 1)
+        granted = grant_missing_leases()
+        purged = 0
+        while True:
+            keys = list(expired_tokens().values_list("key", flat=True)[:batch_size])
+            if not keys:
+                break
+            Token.objects.filter(key__in=keys).delete()
+            purged += len(keys)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"auth_token_purge purged={purged} leases_granted={granted}")
+        )
@@ -1,3 +1,22 @@
 from django.db import models
+from rest_framework.authtoken.models import Token
 
-# Create your models here.
+
+class TokenLease(models.Model):
+    """Expiry and last-use bookkeeping for a DRF auth token.
+
+    Tokens without a lease (created before leases existed) expire
+    AUTH_TOKEN_TTL_HOURS after ``Token.created``.
+    """
+
+    token = models.OneToOneField(
+        Token,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="lease",
+    )
+    expires_at = models.DateTimeField(db_index=True)
+    last_used_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.token_id} (expires {self.expires_at:%Y-%m-%d %H:%M})"
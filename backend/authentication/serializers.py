@@ -1,17 +1,16 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.db.models import Q
-from users.services.otp_service import create_otp_for_user
-from users.services.email_service import send_verification_email
 from django.utils import timezone 
-from users.services.otp_service import validate_otp 
+from users.services.otp_service import get_active_otp, invalidate_otps_for_user, validate_otp
 from users.services.notification_service import (
     queue_and_dispatch_account_created_notification,
     queue_and_dispatch_email_updated_notification,
+    queue_and_dispatch_verification_email,
 )
-from users.models import EmailVerificationOTP 
 from django.conf import settings
 from django.contrib.auth import authenticate
+from users.throttling import password_check_slot
 
 
 User = get_user_model()
@@ -76,8 +75,7 @@ class SignupSerializer(serializers.ModelSerializer):
             email_verified_at=None
         )
 
-        code, _ = create_otp_for_user(user)
-        send_verification_email(user.email, code)
+        queue_and_dispatch_verification_email(user)
 
         return user
 
@@ -160,12 +158,9 @@ class ResendVerificationSerializer(serializers.Serializer):
         self.user = user
         self.target_email = (user.pending_email if is_pending_email_verification else user.email) or email
         
-        otp = EmailVerificationOTP.objects.filter(
-            user=user,
-            invalidated_at__isnull=True
-        ).order_by("-created_at").first()
+        otp = get_active_otp(user)
 
-        if otp:
+        if otp and otp.last_sent_at:
             elapsed = (timezone.now() - otp.last_sent_at).total_seconds()
             if elapsed < settings.EMAIL_OTP_RESEND_COOLDOWN_SECONDS:
                 remaining = int(settings.EMAIL_OTP_RESEND_COOLDOWN_SECONDS - elapsed)
@@ -176,8 +171,7 @@ class ResendVerificationSerializer(serializers.Serializer):
     def save(self):
         user = self.user
 
-        code, _ = create_otp_for_user(user)
-        send_verification_email(self.target_email, code)
+        queue_and_dispatch_verification_email(user, self.target_email)
 
         return user
 
@@ -205,13 +199,9 @@ class ChangeEmailUnverifiedSerializer(serializers.Serializer):
         user.email = new_email
         user.save()
 
-        EmailVerificationOTP.objects.filter(
-            user=user,
-            invalidated_at__isnull=True
-        ).update(invalidated_at=timezone.now())
+        invalidate_otps_for_user(user)
 
-        code, _ = create_otp_for_user(user)
-        send_verification_email(new_email, code)
+        queue_and_dispatch_verification_email(user, new_email)
 
         return user
 
@@ -227,7 +217,8 @@ class LoginSerializer(serializers.Serializer):
         if not email or not password:
             raise serializers.ValidationError("Email y contraseña son obligatorios")
 
-        user = authenticate(email=email, password=password)
+        with password_check_slot():
+            user = authenticate(email=email, password=password)
 
         if not user:
             raise serializers.ValidationError("Credenciales inválidas")
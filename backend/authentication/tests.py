@@ -7,6 +7,7 @@ from django.contrib.auth import get_user_model
 from django.utils import timezone
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APITestCase
+from api.testing import reset_caches
 from .utils import create_internal_token
 
 
@@ -36,6 +37,111 @@ class CreateInternalTokenTests(TestCase):
         self.assertEqual(token_key, existing_token.key)
         self.assertEqual(Token.objects.filter(user=self.user).count(), 1)
 
+    def test_replaces_expired_token(self):
+        from authentication.models import TokenLease
+        existing_token = Token.objects.create(user=self.user)
+        TokenLease.objects.create(token=existing_token, expires_at=timezone.now() - timedelta(seconds=1))
+
+        token_key = create_internal_token(self.user)
+
+        self.assertNotEqual(token_key, existing_token.key)
+        self.assertTrue(TokenLease.objects.filter(token_id=token_key).exists())
+
+
+class TokenLifecycleTests(APITestCase):
+    def setUp(self):
+        reset_caches()
+        self.User = get_user_model()
+        self.user = self.User.objects.create_user(
+            email="lease@example.com",
+            username="lease_user",
+            password="test-password-123",
+            name="Lease",
+            surname="User",
+            company="Ordinaly",
+        )
+
+    def _authenticate(self, key):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {key}")
+        return self.client.get("/api/users/check_role/")
+
+    def test_login_reuses_live_token_by_default(self):
+        token = Token.objects.create(user=self.user)
+        response = self.client.post("/auth/login/", {
+            "email": "lease@example.com",
+            "password": "test-password-123",
+        }, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["token"], token.key)
+
+    @override_settings(AUTH_TOKEN_ROTATE_ON_LOGIN=True)
+    def test_login_rotates_token(self):
+        from authentication.models import TokenLease
+        old_token = Token.objects.create(user=self.user)
+        response = self.client.post("/auth/login/", {
+            "email": "lease@example.com",
+            "password": "test-password-123",
+        }, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data["token"], old_token.key)
+        self.assertFalse(Token.objects.filter(key=old_token.key).exists())
+        self.assertTrue(TokenLease.objects.filter(token_id=response.data["token"]).exists())
+
+    def test_expired_token_is_rejected(self):
+        from authentication.models import TokenLease
+        token = Token.objects.create(user=self.user)
+        TokenLease.objects.create(token=token, expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(self._authenticate(token.key).status_code, 401)
+
+    @override_settings(AUTH_TOKEN_TTL_HOURS=1)
+    def test_legacy_token_gets_lease_on_first_use(self):
+        from authentication.models import TokenLease
+        token = Token.objects.create(user=self.user)
+        Token.objects.filter(pk=token.pk).update(created=timezone.now() - timedelta(hours=2))
+        self.assertEqual(self._authenticate(token.key).status_code, 200)
+        lease = TokenLease.objects.get(token=token)
+        self.assertGreater(lease.expires_at, timezone.now() + timedelta(minutes=50))
+
+    @override_settings(AUTH_TOKEN_TOUCH_INTERVAL_SECONDS=300)
+    def test_last_used_is_written_once_per_interval_and_slides_expiry(self):
+        from authentication.models import TokenLease
+        from authentication.utils import issue_token
+        token = issue_token(self.user)
+        TokenLease.objects.filter(token=token).update(expires_at=timezone.now() + timedelta(minutes=5))
+
+        self.assertEqual(self._authenticate(token.key).status_code, 200)
+        lease = TokenLease.objects.get(token=token)
+        first_use = lease.last_used_at
+        self.assertIsNotNone(first_use)
+        self.assertGreater(lease.expires_at, timezone.now() + timedelta(hours=1))
+
+        from users.services.token_cache import get_token_cache
+        get_token_cache().clear()
+        self.assertEqual(self._authenticate(token.key).status_code, 200)
+        self.assertEqual(TokenLease.objects.get(token=token).last_used_at, first_use)
+
+    def test_purge_expired_tokens_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from authentication.models import TokenLease
+        other = self.User.objects.create_user(
+            email="lease-other@example.com",
+            username="lease_other",
+            password="test-password-123",
+            name="Other",
+            surname="User",
+        )
+        expired = Token.objects.create(user=self.user)
+        TokenLease.objects.create(token=expired, expires_at=timezone.now() - timedelta(days=1))
+        live = Token.objects.create(user=other)
+
+        out = StringIO()
+        call_command("purge_expired_tokens", stdout=out)
+
+        self.assertIn("purged=1 leases_granted=1", out.getvalue())
+        self.assertEqual(list(Token.objects.values_list("key", flat=True)), [live.key])
+        self.assertEqual(list(TokenLease.objects.values_list("token_id", flat=True)), [live.key])
+
 
 class GoogleCallbackTests(TestCase):
     def setUp(self):
@@ -218,6 +324,7 @@ class DeleteAccountViewsTests(APITestCase):
 
 class EmailVerificationMiddlewareTests(APITestCase):
     def setUp(self):
+        reset_caches()
         CustomUser = get_user_model()
         self.unverified_user = CustomUser.objects.create_user(
             email="unverified@example.com",
@@ -346,9 +453,8 @@ class AuthSerializerTests(TestCase):
             company="Ordinaly",
         )
 
-    @patch("authentication.serializers.send_verification_email")
-    @patch("authentication.serializers.create_otp_for_user", return_value=("123456", Mock()))
-    def test_signup_serializer_creates_user(self, mock_otp, mock_email):
+    @patch("authentication.serializers.queue_and_dispatch_verification_email")
+    def test_signup_serializer_creates_user(self, mock_queue):
         from authentication.serializers import SignupSerializer
         data = {"email": "new@example.com", "password": "newpass123"}
         serializer = SignupSerializer(data=data)
@@ -356,8 +462,7 @@ class AuthSerializerTests(TestCase):
         user = serializer.save()
         self.assertEqual(user.email, "new@example.com")
         self.assertEqual(user.status, "pending_verification")
-        mock_otp.assert_called_once()
-        mock_email.assert_called_once_with("new@example.com", "123456")
+        mock_queue.assert_called_once_with(user)
 
     @patch("authentication.serializers.queue_and_dispatch_account_created_notification")
     @patch("authentication.serializers.validate_otp", return_value=(True, "OK"))
@@ -462,21 +567,19 @@ class AuthSerializerTests(TestCase):
         serializer = ResendVerificationSerializer(data={"email": self.user.email})
         self.assertFalse(serializer.is_valid())
 
-    @patch("authentication.serializers.send_verification_email")
-    @patch("authentication.serializers.create_otp_for_user", return_value=("654321", Mock()))
+    @patch("authentication.serializers.queue_and_dispatch_verification_email")
     @override_settings(EMAIL_OTP_RESEND_COOLDOWN_SECONDS=0)
-    def test_resend_verification_success(self, mock_otp, mock_email):
+    def test_resend_verification_success(self, mock_queue):
         from authentication.serializers import ResendVerificationSerializer
         serializer = ResendVerificationSerializer(data={"email": self.user.email})
         self.assertTrue(serializer.is_valid(), serializer.errors)
         user = serializer.save()
         self.assertEqual(user.email, self.user.email)
-        mock_email.assert_called_once()
+        mock_queue.assert_called_once_with(self.user, self.user.email)
 
-    @patch("authentication.serializers.send_verification_email")
-    @patch("authentication.serializers.create_otp_for_user", return_value=("654321", Mock()))
+    @patch("authentication.serializers.queue_and_dispatch_verification_email")
     @override_settings(EMAIL_OTP_RESEND_COOLDOWN_SECONDS=0)
-    def test_resend_verification_uses_pending_email_for_verified_user(self, mock_otp, mock_email):
+    def test_resend_verification_uses_pending_email_for_verified_user(self, mock_queue):
         from authentication.serializers import ResendVerificationSerializer
 
         self.user.email_verified_at = timezone.now()
@@ -486,7 +589,7 @@ class AuthSerializerTests(TestCase):
         serializer = ResendVerificationSerializer(data={"email": "pending@example.com"})
         self.assertTrue(serializer.is_valid(), serializer.errors)
         serializer.save()
-        mock_email.assert_called_once_with("pending@example.com", "654321")
+        mock_queue.assert_called_once_with(self.user, "pending@example.com")
 
     def test_change_email_duplicate(self):
         from authentication.serializers import ChangeEmailUnverifiedSerializer
@@ -505,9 +608,8 @@ class AuthSerializerTests(TestCase):
         )
         self.assertFalse(serializer.is_valid())
 
-    @patch("authentication.serializers.send_verification_email")
-    @patch("authentication.serializers.create_otp_for_user", return_value=("111111", Mock()))
-    def test_change_email_success(self, mock_otp, mock_email):
+    @patch("authentication.serializers.queue_and_dispatch_verification_email")
+    def test_change_email_success(self, mock_queue):
         from authentication.serializers import ChangeEmailUnverifiedSerializer
         request = Mock()
         request.user = self.user
@@ -518,7 +620,7 @@ class AuthSerializerTests(TestCase):
         self.assertTrue(serializer.is_valid(), serializer.errors)
         user = serializer.save()
         self.assertEqual(user.email, "brand_new@example.com")
-        mock_email.assert_called_once_with("brand_new@example.com", "111111")
+        mock_queue.assert_called_once_with(self.user, "brand_new@example.com")
 
     def test_login_serializer_missing_fields(self):
         from authentication.serializers import LoginSerializer
@@ -539,6 +641,7 @@ class AuthSerializerTests(TestCase):
 
 class AuthViewTests(APITestCase):
     def setUp(self):
+        reset_caches()
         self.User = get_user_model()
 
     @patch.dict(os.environ, {"GOOGLE_CLIENT_ID": "cid", "GOOGLE_REDIRECT_URI": "http://localhost/cb"})
@@ -626,9 +729,8 @@ class AuthViewTests(APITestCase):
         self.assertEqual(response.status_code, 302)
         self.assertIn("error=missing_email", response.url)
 
-    @patch("authentication.serializers.send_verification_email")
-    @patch("authentication.serializers.create_otp_for_user", return_value=("123456", Mock()))
-    def test_signup_view_success(self, mock_otp, mock_email):
+    @patch("authentication.serializers.queue_and_dispatch_verification_email")
+    def test_signup_view_success(self, mock_queue):
         response = self.client.post("/auth/signup/", {
             "email": "signup@example.com",
             "password": "strongpassword123",
@@ -654,10 +756,9 @@ class AuthViewTests(APITestCase):
         }, format="json")
         self.assertEqual(response.status_code, 200)
 
-    @patch("authentication.serializers.send_verification_email")
-    @patch("authentication.serializers.create_otp_for_user", return_value=("123456", Mock()))
+    @patch("authentication.serializers.queue_and_dispatch_verification_email")
     @override_settings(EMAIL_OTP_RESEND_COOLDOWN_SECONDS=0)
-    def test_resend_verification_view_success(self, mock_otp, mock_email):
+    def test_resend_verification_view_success(self, mock_queue):
         self.User.objects.create_user(
             email="resend@example.com",
             username="resend_user",
@@ -670,9 +771,8 @@ class AuthViewTests(APITestCase):
         }, format="json")
         self.assertEqual(response.status_code, 200)
 
-    @patch("authentication.serializers.send_verification_email")
-    @patch("authentication.serializers.create_otp_for_user", return_value=("123456", Mock()))
-    def test_change_email_view_success(self, mock_otp, mock_email):
+    @patch("authentication.serializers.queue_and_dispatch_verification_email")
+    def test_change_email_view_success(self, mock_queue):
         user = self.User.objects.create_user(
             email="changeme@example.com",
             username="changeme_user",
@@ -712,6 +812,7 @@ class AuthViewTests(APITestCase):
 
 class PasswordResetViewTests(APITestCase):
     def setUp(self):
+        reset_caches()
         self.User = get_user_model()
         self.user = self.User.objects.create_user(
             email="resetme@example.com",
@@ -1,6 +1,94 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 from rest_framework.authtoken.models import Token
 
+from .models import TokenLease
+
+
+def token_ttl():
+    return timedelta(hours=settings.AUTH_TOKEN_TTL_HOURS)
+
+
+def token_expires_at(token, lease=None, *, now=None):
+    if lease is not None:
+        return lease.expires_at
+    # Tokens issued before leases existed count as issued now; their first use
+    # or the next purge gives them a lease.
+    return (now or timezone.now()) + token_ttl()
+
+
+def token_is_expired(token, lease=None, *, now=None):
+    now = now or timezone.now()
+    return now >= token_expires_at(token, lease, now=now)
+
+
+def _get_lease(token):
+    try:
+        return token.lease
+    except TokenLease.DoesNotExist:
+        return None
+
+
+def issue_token(user, *, rotate=False):
+    """Return a usable token for ``user``.
+
+    An existing unexpired token is reused unless ``rotate`` is set; expired or
+    rotated tokens are replaced by a fresh key with a new lease.
+    """
+    with transaction.atomic():
+        token = Token.objects.select_related("lease").filter(user=user).first()
+        if token is not None and not rotate and not token_is_expired(token, _get_lease(token)):
+            return token
+        if token is not None:
+            token.delete()
+        token = Token.objects.create(user=user)
+        TokenLease.objects.create(token=token, expires_at=token.created + token_ttl())
+    return token
+
+
+def touch_token(token, lease=None, *, now=None):
+    """Record use of ``token``, writing at most once per AUTH_TOKEN_TOUCH_INTERVAL_SECONDS.
+
+    With AUTH_TOKEN_SLIDING enabled the expiry moves forward on each write.
+    Returns the ``(expires_at, last_used_at)`` pair now in effect.
+    """
+    now = now or timezone.now()
+    expires_at = token_expires_at(token, lease, now=now)
+    last_used_at = lease.last_used_at if lease is not None else None
+    interval = timedelta(seconds=settings.AUTH_TOKEN_TOUCH_INTERVAL_SECONDS)
+    if last_used_at is not None and now - last_used_at < interval:
+        return expires_at, last_used_at
+
+    if settings.AUTH_TOKEN_SLIDING:
+        expires_at = max(expires_at, now + token_ttl())
+    updated = TokenLease.objects.filter(token_id=token.pk).update(
+        expires_at=expires_at,
+        last_used_at=now,
+    )
+    if not updated:
+        TokenLease.objects.get_or_create(
+            token_id=token.pk,
+            defaults={"expires_at": expires_at, "last_used_at": now},
+        )
+    return expires_at, now
+
+
+def grant_missing_leases(*, now=None):
+    """Give every lease-less token a lease starting at ``now``; returns how many."""
+    now = now or timezone.now()
+    keys = Token.objects.filter(lease__isnull=True).values_list("key", flat=True)
+    leases = [TokenLease(token_id=key, expires_at=now + token_ttl()) for key in keys]
+    TokenLease.objects.bulk_create(leases, ignore_conflicts=True)
+    return len(leases)
+
+
+def expired_tokens(*, now=None):
+    now = now or timezone.now()
+    return Token.objects.filter(lease__expires_at__lte=now)
+
 
 def create_internal_token(user):
-    token, _ = Token.objects.get_or_create(user=user)
-    return token.key
+    return issue_token(user).key
@@ -15,7 +15,6 @@ from django.views.decorators.http import require_GET
 from google.auth.transport import requests as google_requests
 from google.oauth2 import id_token
 from rest_framework import generics, status
-from rest_framework.authtoken.models import Token
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -27,8 +26,12 @@ from authentication.serializers import (
     SignupSerializer,
     VerifyEmailSerializer,
 )
-from users.services.notification_service import queue_and_dispatch_password_reset_completed_notification
-from .utils import create_internal_token
+from users.services.notification_service import (
+    queue_and_dispatch_password_reset_completed_notification,
+    queue_and_dispatch_verification_email,
+)
+from users.throttling import AUTH_THROTTLE_CLASSES
+from .utils import create_internal_token, issue_token
 
 
 def _frontend_base_url():
@@ -184,10 +187,7 @@ def google_callback(request):
         # Send verification email for new or unverified users
         if not user.email_verified_at:
             try:
-                from users.services.otp_service import create_otp_for_user
-                from users.services.email_service import send_verification_email
-                code, _ = create_otp_for_user(user)
-                send_verification_email(user.email, code)
+                queue_and_dispatch_verification_email(user)
             except Exception:
                 # print(f"Failed to send verification email for Google OAuth user: {e}")
                 pass
@@ -203,6 +203,8 @@ def google_callback(request):
 class VerifyEmailView(generics.GenericAPIView):
     serializer_class = VerifyEmailSerializer
     permission_classes = [AllowAny]
+    throttle_classes = AUTH_THROTTLE_CLASSES
+    throttle_scope = "verify_email"
 
     def post(self, request):
         serializer = self.get_serializer(data=request.data)
@@ -213,12 +215,14 @@ class VerifyEmailView(generics.GenericAPIView):
 class SignupView(generics.GenericAPIView):
     serializer_class = SignupSerializer
     permission_classes = [AllowAny]
+    throttle_classes = AUTH_THROTTLE_CLASSES
+    throttle_scope = "signup"
 
     def post(self, request):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.save()
-        token, _ = Token.objects.get_or_create(user=user)
+        token = issue_token(user)
         return Response(
             {
                 "token": token.key,
@@ -235,12 +239,14 @@ class SignupView(generics.GenericAPIView):
 class LoginView(generics.GenericAPIView):
     serializer_class = LoginSerializer
     permission_classes = [AllowAny]
+    throttle_classes = AUTH_THROTTLE_CLASSES
+    throttle_scope = "login"
 
     def post(self, request):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data["user"]
-        token, _ = Token.objects.get_or_create(user=user)
+        token = issue_token(user, rotate=settings.AUTH_TOKEN_ROTATE_ON_LOGIN)
         return Response(
             {
                 "token": token.key,
@@ -257,6 +263,8 @@ class LoginView(generics.GenericAPIView):
 class ResendVerificationView(generics.GenericAPIView):
     serializer_class = ResendVerificationSerializer
     permission_classes = [AllowAny]
+    throttle_classes = AUTH_THROTTLE_CLASSES
+    throttle_scope = "resend_verification"
 
     def post(self, request):
         serializer = self.get_serializer(data=request.data)
@@ -499,6 +507,8 @@ confirm_delete_account = ConfirmDeleteAccountView.as_view()
 
 class RequestPasswordResetView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = AUTH_THROTTLE_CLASSES
+    throttle_scope = "password_reset"
     http_method_names = ["post", "options"]
 
     def post(self, request):
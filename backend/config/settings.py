@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 import os
+import tempfile
 from dotenv import load_dotenv
 from pathlib import Path
 import dj_database_url
@@ -32,6 +33,14 @@ BILLIONMAIL_SENDER = os.getenv("BILLIONMAIL_SENDER")
 EMAIL_OTP_TTL_MINUTES = int(os.getenv("EMAIL_OTP_TTL_MINUTES", 15))
 EMAIL_OTP_MAX_ATTEMPTS = int(os.getenv("EMAIL_OTP_MAX_ATTEMPTS", 5))
 EMAIL_OTP_RESEND_COOLDOWN_SECONDS = int(os.getenv("EMAIL_OTP_RESEND_COOLDOWN_SECONDS", 60))
+# Where verification codes live: the DB table (default) or a shared cache via
+# "users.services.otp_service.CacheOTPBackend". The alias must be shared by
+# every worker, or a code sent by one is unknown to the others.
+EMAIL_OTP_BACKEND = os.getenv("EMAIL_OTP_BACKEND", "users.services.otp_service.DatabaseOTPBackend")
+EMAIL_OTP_CACHE_ALIAS = os.getenv("EMAIL_OTP_CACHE_ALIAS", "shared")
+# Send high-priority emails (verification codes) from a background thread after commit
+EMAIL_DISPATCH_ASYNC = os.getenv("EMAIL_DISPATCH_ASYNC", "True") == "True"
+EMAIL_DISPATCH_WORKERS = int(os.getenv("EMAIL_DISPATCH_WORKERS", 2))
 
 
 # SECURITY WARNING: don't run with debug turned on in production!
@@ -62,6 +71,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'api.timing.ServerTimingMiddleware',
+    'api.slow_queries.SlowQueryMiddleware',
+    'api.profiling.ProfilerMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -116,6 +128,82 @@ if ENGINE == "django.db.backends.postgresql":
     DATABASES["default"]["OPTIONS"].setdefault("application_name", "django-app")
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Per-process by default; point CACHE_BACKEND/CACHE_LOCATION at Redis or
+# memcached in production so every worker shares counters and bodies.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", "ordinaly-default"),
+        "TIMEOUT": int(os.getenv("CACHE_TIMEOUT_SECONDS", 300)),
+    },
+    # L2 for api.cache.TieredCache: Redis when REDIS_URL is set, otherwise a
+    # filesystem cache so local runs still share entries between workers.
+    "shared": (
+        {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+        if os.getenv("REDIS_URL")
+        else {
+            "BACKEND": os.getenv("SHARED_CACHE_BACKEND", "django.core.cache.backends.filebased.FileBasedCache"),
+            "LOCATION": os.getenv("SHARED_CACHE_LOCATION", os.path.join(tempfile.gettempdir(), "ordinaly-cache")),
+        }
+    ),
+}
+
+# Two-tier cache (api.cache): per-process LRU in front of the "shared" alias.
+TIERED_CACHE_L2_ALIAS = os.getenv("TIERED_CACHE_L2_ALIAS", "shared")
+TIERED_CACHE_L1_SIZE = int(os.getenv("TIERED_CACHE_L1_SIZE", 1024))
+TIERED_CACHE_L1_TTL_SECONDS = int(os.getenv("TIERED_CACHE_L1_TTL_SECONDS", 10))
+TIERED_CACHE_DEFAULT_TTL_SECONDS = int(os.getenv("TIERED_CACHE_DEFAULT_TTL_SECONDS", 300))
+# How long a worker trusts its copy of a namespace version before asking L2.
+TIERED_CACHE_VERSION_TTL_SECONDS = float(os.getenv("TIERED_CACHE_VERSION_TTL_SECONDS", 1))
+# Higher beta refreshes hot keys earlier; 1.0 is the usual XFetch default.
+TIERED_CACHE_EARLY_REFRESH_BETA = float(os.getenv("TIERED_CACHE_EARLY_REFRESH_BETA", 1.0))
+TIERED_CACHE_LOCK_TIMEOUT_SECONDS = float(os.getenv("TIERED_CACHE_LOCK_TIMEOUT_SECONDS", 10))
+TIERED_CACHE_LOCK_POLL_SECONDS = float(os.getenv("TIERED_CACHE_LOCK_POLL_SECONDS", 0.05))
+
+# Cached JSON bodies for the public list/detail endpoints (services, courses,
+# terms), invalidated by per-model generation counters in api.signals.
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "True") == "True"
+RESPONSE_CACHE_ALIAS = os.getenv("RESPONSE_CACHE_ALIAS", "default")
+# Generation counters must be seen by every worker, or a save in one process
+# leaves the others serving stale bodies until the TTL runs out.
+RESPONSE_CACHE_GENERATION_ALIAS = os.getenv("RESPONSE_CACHE_GENERATION_ALIAS", "shared")
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 300))
+RESPONSE_CACHE_MIN_GZIP_BYTES = int(os.getenv("RESPONSE_CACHE_MIN_GZIP_BYTES", 512))
+
+# "Related services" on service detail pages: TF-IDF neighbours precomputed by
+# services.recommendations and refreshed when a service's text or draft flag
+# changes, off the request thread unless RELATED_SERVICES_REFRESH_ASYNC is off.
+RELATED_SERVICES_TOP_K = int(os.getenv("RELATED_SERVICES_TOP_K", 4))
+RELATED_SERVICES_MIN_SCORE = float(os.getenv("RELATED_SERVICES_MIN_SCORE", 0.05))
+RELATED_SERVICES_REFRESH_ON_SAVE = os.getenv("RELATED_SERVICES_REFRESH_ON_SAVE", "True") == "True"
+RELATED_SERVICES_REFRESH_ASYNC = os.getenv("RELATED_SERVICES_REFRESH_ASYNC", "True") == "True"
+
+# Title autocomplete (api.autocomplete): the per-process index follows the
+# shared response-cache generations and is rebuilt at least this often anyway,
+# in case a bump was lost (e.g. a write that bypassed model signals).
+AUTOCOMPLETE_INDEX_TTL_SECONDS = int(os.getenv("AUTOCOMPLETE_INDEX_TTL_SECONDS", 300))
+
+# Resized course/service image variants (api.images), generated after upload.
+IMAGE_VARIANT_WIDTHS = [int(width) for width in os.getenv("IMAGE_VARIANT_WIDTHS", "320,640,960,1280").split(",")]
+IMAGE_VARIANT_FORMATS = os.getenv("IMAGE_VARIANT_FORMATS", "avif,webp,jpeg").split(",")
+IMAGE_VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", 80))
+IMAGE_VARIANTS_ASYNC = os.getenv("IMAGE_VARIANTS_ASYNC", "True") == "True"
+IMAGE_VARIANT_WORKERS = int(os.getenv("IMAGE_VARIANT_WORKERS", 2))
+
+# Course recommendations from enrollment co-occurrence, rebuilt offline by
+# `manage.py build_course_recommendations`. Users are streamed through the
+# build in blocks so memory stays bounded as enrollments grow.
+COURSE_RECOMMENDATIONS_TOP_K = int(os.getenv("COURSE_RECOMMENDATIONS_TOP_K", 10))
+COURSE_RECOMMENDATIONS_MIN_CO_ENROLLMENTS = int(os.getenv("COURSE_RECOMMENDATIONS_MIN_CO_ENROLLMENTS", 2))
+COURSE_RECOMMENDATIONS_USERS_PER_BLOCK = int(os.getenv("COURSE_RECOMMENDATIONS_USERS_PER_BLOCK", 4096))
+COURSE_RECOMMENDATIONS_LIMIT = int(os.getenv("COURSE_RECOMMENDATIONS_LIMIT", 6))
+
+
 # Zona horaria y TZ
 TIME_ZONE = os.getenv("TIME_ZONE", "Europe/Madrid")
 USE_TZ = True  # Django stores in UTC and converts to TIME_ZONE
@@ -159,6 +247,51 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploads are stored once per distinct content and reference-counted, so
+# duplicated courses/services share their images (api.storage).
+STORAGES = {
+    "default": {
+        "BACKEND": os.getenv("MEDIA_STORAGE_BACKEND", "api.storage.ContentAddressedFileSystemStorage"),
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
+# Multipart uploads are checked while they stream (api.upload_handlers): bodies
+# over UPLOAD_MAX_REQUEST_BYTES are refused unread, and image/PDF fields stop at
+# their 1MB limit or on unexpected magic bytes.
+FILE_UPLOAD_HANDLERS = [
+    "api.upload_handlers.LimitedUploadHandler",
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "django.core.files.uploadhandler.TemporaryFileUploadHandler",
+]
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", 1024 * 1024 + 256 * 1024))
+
+# How file downloads (api.sendfile) leave the app: "" streams them from the
+# worker (sendfile() under gunicorn), "x-accel-redirect" hands them to nginx
+# through an `internal` location at SENDFILE_URL_PREFIX aliasing MEDIA_ROOT, and
+# "x-sendfile" hands the absolute path to Apache/lighttpd.
+SENDFILE_BACKEND = os.getenv("SENDFILE_BACKEND", "")
+SENDFILE_URL_PREFIX = os.getenv("SENDFILE_URL_PREFIX", "/protected-media/")
+
+# S3-compatible object storage for media (api.s3), used when
+# MEDIA_STORAGE_BACKEND=api.s3.ContentAddressedS3Storage. For a local MinIO use
+# S3_ENDPOINT_URL=http://localhost:9000 and S3_ADDRESSING_STYLE=path. Browser
+# uploads go straight to the bucket, so its CORS rules must allow PUT with the
+# Content-Type and x-amz-checksum-sha256 headers from the frontend origin.
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "https://s3.amazonaws.com")
+S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME", "")
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_ACCESS_KEY_ID = os.getenv("S3_ACCESS_KEY_ID", "")
+S3_SECRET_ACCESS_KEY = os.getenv("S3_SECRET_ACCESS_KEY", "")
+S3_ADDRESSING_STYLE = os.getenv("S3_ADDRESSING_STYLE", "path")
+# Public (or CDN) base URL of the bucket; empty means media URLs are presigned.
+S3_PUBLIC_BASE_URL = os.getenv("S3_PUBLIC_BASE_URL", "")
+S3_URL_EXPIRES_SECONDS = int(os.getenv("S3_URL_EXPIRES_SECONDS", 3600))
+S3_UPLOAD_EXPIRES_SECONDS = int(os.getenv("S3_UPLOAD_EXPIRES_SECONDS", 900))
+S3_TIMEOUT_SECONDS = float(os.getenv("S3_TIMEOUT_SECONDS", 10))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -189,15 +322,107 @@ AUTHENTICATION_BACKENDS = [
 
 # Django REST framework configuration
 REST_FRAMEWORK = {
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'api.upload_handlers.UploadLimitMultiPartParser',
+    ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # Reverse proxies in front of gunicorn (nginx in production). DRF then
+    # takes the client address from the X-Forwarded-For entry the nearest
+    # proxy appended instead of anything the client sent. Use 0 when clients
+    # connect to gunicorn directly.
+    'NUM_PROXIES': int(os.getenv("NUM_PROXIES", 1)),
 }
 
+# API token lifetime. Expiry slides forward when a token is used, and last use is
+# written at most once per touch interval.
+AUTH_TOKEN_TTL_HOURS = int(os.getenv("AUTH_TOKEN_TTL_HOURS", 24 * 14))
+AUTH_TOKEN_SLIDING = os.getenv("AUTH_TOKEN_SLIDING", "True") == "True"
+AUTH_TOKEN_TOUCH_INTERVAL_SECONDS = int(os.getenv("AUTH_TOKEN_TOUCH_INTERVAL_SECONDS", 300))
+AUTH_TOKEN_ROTATE_ON_LOGIN = os.getenv("AUTH_TOKEN_ROTATE_ON_LOGIN", "False") == "True"
+
+# Token -> user snapshots used by CachedTokenAuthentication. The per-process LRU
+# keeps entries for a few seconds; set AUTH_TOKEN_SHARED_CACHE_ALIAS to a
+# CACHES alias to share them between workers as well.
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", 4096))
+AUTH_TOKEN_CACHE_TTL_SECONDS = int(os.getenv("AUTH_TOKEN_CACHE_TTL_SECONDS", 30))
+AUTH_TOKEN_SHARED_CACHE_ALIAS = os.getenv("AUTH_TOKEN_SHARED_CACHE_ALIAS") or None
+AUTH_TOKEN_SHARED_CACHE_TTL_SECONDS = int(os.getenv("AUTH_TOKEN_SHARED_CACHE_TTL_SECONDS", 300))
+# Where token/user invalidations are published. Every worker must read the
+# same cache, or signed-out tokens keep working until the local TTL runs out.
+AUTH_TOKEN_INVALIDATION_CACHE_ALIAS = os.getenv("AUTH_TOKEN_INVALIDATION_CACHE_ALIAS", "shared")
+
+# Token-bucket throttles for the unauthenticated auth endpoints, per client IP
+# and per submitted email/username. Rates are "<burst>/<period>". Buckets must
+# live in the shared cache, or every worker enforces the limits on its own.
+AUTH_THROTTLE_ENABLED = os.getenv("AUTH_THROTTLE_ENABLED", "True") == "True"
+AUTH_THROTTLE_CACHE_ALIAS = os.getenv("AUTH_THROTTLE_CACHE_ALIAS", "shared")
+# Per-bucket lock around each update: how long it may be held, and how long a
+# request waits for it before being throttled.
+AUTH_THROTTLE_LOCK_TIMEOUT_SECONDS = float(os.getenv("AUTH_THROTTLE_LOCK_TIMEOUT_SECONDS", 1))
+AUTH_THROTTLE_LOCK_WAIT_SECONDS = float(os.getenv("AUTH_THROTTLE_LOCK_WAIT_SECONDS", 0.5))
+AUTH_THROTTLE_RATES = {
+    "signin": {"ip": "30/min", "identifier": "10/min"},
+    "login": {"ip": "30/min", "identifier": "10/min"},
+    "signup": {"ip": "10/min", "identifier": "5/min"},
+    "verify_email": {"ip": "30/min", "identifier": "10/min"},
+    "resend_verification": {"ip": "10/min", "identifier": "3/min"},
+    "password_reset": {"ip": "10/min", "identifier": "3/min"},
+}
+
+# Password hashing is CPU bound; cap concurrent checks per process and shed the
+# excess with 429 rather than letting it starve the rest of the site.
+AUTH_PASSWORD_CHECK_CONCURRENCY = int(os.getenv("AUTH_PASSWORD_CHECK_CONCURRENCY", 4))
+AUTH_PASSWORD_CHECK_WAIT_SECONDS = float(os.getenv("AUTH_PASSWORD_CHECK_WAIT_SECONDS", 0.5))
+AUTH_LOAD_SHED_RETRY_AFTER_SECONDS = int(os.getenv("AUTH_LOAD_SHED_RETRY_AFTER_SECONDS", 2))
+
+# Per-request timing (api.timing). This fraction of requests (0-1) records SQL,
+# outbound HTTP and serializer time into per-route histograms. A request can
+# also opt in by sending "X-Server-Timing: 1". Staff get the numbers back in a
+# Server-Timing header.
+PERF_SAMPLE_RATE = float(os.getenv("PERF_SAMPLE_RATE", 0))
+
+# Prometheus metrics (api.metrics) at /metrics. Under gunicorn, point
+# PROMETHEUS_MULTIPROC_DIR at a directory shared by every worker and by the email
+# queue worker, so each scrape sees all of them. Scrapes must send
+# "Authorization: Bearer <METRICS_AUTH_TOKEN>"; without a token the endpoint
+# answers 404 (behind the reverse proxy every request comes from localhost, so
+# the client address proves nothing).
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True") == "True"
+METRICS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR") or None
+METRICS_FLUSH_INTERVAL_SECONDS = float(os.getenv("METRICS_FLUSH_INTERVAL_SECONDS", 5))
+METRICS_AUTH_TOKEN = os.getenv("METRICS_AUTH_TOKEN", "")
+
+# Slow query log (api.slow_queries). Statements slower than the threshold are kept,
+# with their EXPLAIN plan, in a ring buffer in this cache alias. It must be the
+# shared cache so every worker (and manage.py slow_queries) sees the same
+# buffer. A threshold of 0 disables it. Parameter values are only kept with
+# SLOW_QUERY_CAPTURE_PARAMS, and never for tables holding credentials.
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", 200))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "True") == "True"
+SLOW_QUERY_CAPTURE_PARAMS = os.getenv("SLOW_QUERY_CAPTURE_PARAMS", "False") == "True"
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", 200))
+SLOW_QUERY_CACHE_ALIAS = os.getenv("SLOW_QUERY_CACHE_ALIAS", "shared")
+SLOW_QUERY_RETENTION_SECONDS = int(os.getenv("SLOW_QUERY_RETENTION_SECONDS", 7 * 24 * 3600))
+
+# On-demand request profiler (api.profiling). Staff get a signed token from
+# /api/profiler/token/ and send it as "X-Profile" or "?_profile=". Those requests
+# are stack-sampled, and the result is kept in this cache alias. It must be the
+# shared cache, or manage.py profiles only sees its own (empty) process.
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "True") == "True"
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", 5))
+PROFILER_TOKEN_MAX_AGE_SECONDS = int(os.getenv("PROFILER_TOKEN_MAX_AGE_SECONDS", 15 * 60))
+PROFILER_CACHE_ALIAS = os.getenv("PROFILER_CACHE_ALIAS", "shared")
+PROFILER_MAX_PROFILES = int(os.getenv("PROFILER_MAX_PROFILES", 50))
+PROFILER_RETENTION_SECONDS = int(os.getenv("PROFILER_RETENTION_SECONDS", 7 * 24 * 3600))
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Ordinaly API',
     'DESCRIPTION': 'API for Ordinaly AI automation company',
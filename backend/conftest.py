@@ -20,3 +20,14 @@ def django_db_setup():
     )
     # Opcionalmente puedes reducir verbosidad de constraints
     settings.DATABASES['default']['ATOMIC_REQUESTS'] = False
+
+
+@pytest.fixture(autouse=True)
+def _clear_caches():
+    """
+    Vacía las cachés entre tests para que throttles y snapshots no se arrastren.
+    """
+    from api.testing import reset_caches
+
+    reset_caches()
+    yield
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from courses.recommendations import build_course_recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the course co-occurrence recommendations from enrollments. "
+        "Meant to run periodically (e.g. nightly) from a scheduler."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top-k", type=int, default=None)
+        parser.add_argument("--min-co-enrollments", type=int, default=None)
+        parser.add_argument("--users-per-block", type=int, default=None)
+
+    def handle(self, *args, **options):
+        rows = build_course_recommendations(
+            top_k=options["top_k"],
+            min_co_enrollments=options["min_co_enrollments"],
+            users_per_block=options["users_per_block"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"course_recommendations_build rows={rows}"))
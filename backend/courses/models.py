@@ -1,12 +1,13 @@
 from django.db import models
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from users.models import CustomUser
 from decimal import Decimal
-import os
 from datetime import datetime, timedelta
 from urllib.parse import urlparse
 from django.core.exceptions import ValidationError
 from django.utils.text import slugify
+from api.images import delete_variants, schedule_image_variants
 
 DATE_DISPLAY_FORMAT = '%B %d, %Y'
 
@@ -65,6 +66,8 @@ class Course(models.Model):
         help_text="YouTube link with a course explanation"
     )
     image = models.ImageField(upload_to='course_images/')
+    # Resized copies of `image` (see api.images); empty until generated
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     price = models.DecimalField(
         max_digits=10,
         decimal_places=2,
@@ -161,6 +164,8 @@ class Course(models.Model):
     max_attendants = models.PositiveIntegerField(validators=[MinValueValidator(1)])
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by a database trigger on PostgreSQL (see api.search)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return self.title
@@ -464,14 +469,20 @@ class Course(models.Model):
         self.slug = slug_candidate
 
     def _delete_replaced_image(self):
+        """Remove the previous image and its variants; return True if it changed."""
         try:
             old_instance = Course.objects.get(pk=self.pk)
-            # Delete old image if it's being replaced
-            if (old_instance.image and old_instance.image != self.image
-                    and os.path.isfile(old_instance.image.path)):
-                os.remove(old_instance.image.path)
         except Course.DoesNotExist:
-            pass  # This shouldn't happen, but handle gracefully
+            return bool(self.image)  # This shouldn't happen, but handle gracefully
+        if old_instance.image == self.image:
+            return False
+        storage = self._meta.get_field('image').storage
+        # Delete old image if it's being replaced (storage keeps it while shared)
+        if old_instance.image and storage.exists(old_instance.image.name):
+            storage.delete(old_instance.image.name)
+        delete_variants(storage, old_instance.image_variants)
+        self.image_variants = {}
+        return True
 
     def save(self, *args, **kwargs):
         # Ensure draft default
@@ -486,14 +497,23 @@ class Course(models.Model):
 
         # Handle image replacement on update
         if self.pk:  # This is an update
-            self._delete_replaced_image()
+            image_changed = self._delete_replaced_image()
+        else:
+            image_changed = bool(self.image)
+        update_fields = kwargs.get('update_fields')
+        if image_changed and update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'image_variants'}
 
         super().save(*args, **kwargs)
+        if image_changed:
+            schedule_image_variants(self)
 
     def delete(self, *args, **kwargs):
-        # Delete the image file from filesystem when model is deleted
-        if self.image and os.path.isfile(self.image.path):
-            os.remove(self.image.path)
+        # Delete the image file when model is deleted (storage keeps it while shared)
+        storage = self._meta.get_field('image').storage
+        if self.image and storage.exists(self.image.name):
+            storage.delete(self.image.name)
+        delete_variants(storage, self.image_variants)
         super().delete(*args, **kwargs)
 
     class Meta:
@@ -528,3 +548,27 @@ class Enrollment(models.Model):
 
     def __str__(self):
         return f"{self.user.username} enrolled in {self.course.title}"
+
+
+class CourseRecommendation(models.Model):
+    """Precomputed "people who took this course also took" neighbours.
+
+    Rebuilt wholesale by `build_course_recommendations`; never edit by hand.
+    """
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='recommendation_links')
+    recommended = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    co_enrollments = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['course', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['course', 'recommended'], name='unique_course_recommendation'),
+        ]
+        indexes = [
+            models.Index(fields=['course', 'rank'], name='course_recommendation_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.course_id} -> {self.recommended_id} ({self.score:.3f})"
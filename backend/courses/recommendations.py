@@ -0,0 +1,156 @@
+"""Course recommendations from enrollment co-occurrence.
+
+The offline build streams enrollments ordered by user and turns each block
+of users into a dense users x courses 0/1 matrix ``B``; the item-item
+co-occurrence matrix is the sum of ``B.T @ B`` over the blocks. Memory is
+bounded by ``COURSE_RECOMMENDATIONS_USERS_PER_BLOCK`` x number of courses no
+matter how many enrollments there are. Co-occurrence counts are normalized
+to cosine similarity (``C[i, j] / sqrt(C[i, i] * C[j, j])``) so popular
+courses don't crowd out everything else, and the best
+``COURSE_RECOMMENDATIONS_TOP_K`` neighbours per course are written to
+``CourseRecommendation``.
+
+Serving a user reads the rows of the courses they are enrolled in and sums
+the scores per candidate, which costs the same however large the
+enrollment table grows.
+"""
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from api.similarity import top_neighbours
+
+from .models import Course, CourseRecommendation, Enrollment
+
+ENROLLMENT_CHUNK_SIZE = 10000
+
+
+def cooccurrence_matrix(pairs, n_courses, users_per_block):
+    """Return the course x course co-occurrence counts for ``pairs``.
+
+    ``pairs`` yields ``(user_id, course_column)`` ordered by user, so that a
+    user's enrollments never straddle two blocks.
+    """
+    counts = np.zeros((n_courses, n_courses), dtype=np.float64)
+    rows, columns = [], []
+    users_in_block = 0
+    current_user = None
+
+    def flush():
+        if not rows:
+            return
+        block = np.zeros((users_in_block, n_courses), dtype=np.float64)
+        block[rows, columns] = 1.0
+        np.add(counts, block.T @ block, out=counts)
+
+    for user_id, column in pairs:
+        if user_id != current_user:
+            if users_in_block == users_per_block:
+                flush()
+                rows, columns = [], []
+                users_in_block = 0
+            current_user = user_id
+            users_in_block += 1
+        rows.append(users_in_block - 1)
+        columns.append(column)
+    flush()
+    return np.rint(counts).astype(np.int64)
+
+
+def cosine_from_cooccurrence(counts, min_co_enrollments=1):
+    """Normalize co-occurrence counts; pairs seen fewer than ``min_co_enrollments`` times score 0."""
+    totals = np.sqrt(np.diag(counts).astype(np.float64))
+    denominator = np.outer(totals, totals)
+    similarity = np.divide(
+        counts, denominator, out=np.zeros(counts.shape, dtype=np.float64), where=denominator > 0,
+    )
+    similarity[counts < min_co_enrollments] = 0.0
+    return similarity
+
+
+def compute_course_recommendations(pairs, courses, *, top_k=None, min_co_enrollments=None,
+                                   users_per_block=None):
+    """Return unsaved ``CourseRecommendation`` rows.
+
+    ``courses`` is a list of ``(course_id, draft)`` and ``pairs`` yields
+    ``(user_id, course_id)`` ordered by user.
+    """
+    top_k = settings.COURSE_RECOMMENDATIONS_TOP_K if top_k is None else top_k
+    min_co_enrollments = (
+        settings.COURSE_RECOMMENDATIONS_MIN_CO_ENROLLMENTS
+        if min_co_enrollments is None else min_co_enrollments
+    )
+    users_per_block = users_per_block or settings.COURSE_RECOMMENDATIONS_USERS_PER_BLOCK
+    if len(courses) < 2 or top_k <= 0:
+        return []
+
+    column_of = {course_id: column for column, (course_id, _draft) in enumerate(courses)}
+    counts = cooccurrence_matrix(
+        ((user_id, column_of[course_id]) for user_id, course_id in pairs if course_id in column_of),
+        len(courses),
+        max(users_per_block, 1),
+    )
+    similarity = cosine_from_cooccurrence(counts, max(min_co_enrollments, 1))
+    published = np.array([not draft for _course_id, draft in courses])
+
+    rows = []
+    # Any positive score means at least min_co_enrollments shared users.
+    for row, neighbours in top_neighbours(similarity, published, top_k, np.finfo(np.float64).tiny):
+        for rank, (column, score) in enumerate(neighbours, start=1):
+            rows.append(CourseRecommendation(
+                course_id=courses[row][0],
+                recommended_id=courses[column][0],
+                rank=rank,
+                score=round(score, 6),
+                co_enrollments=int(counts[row, column]),
+            ))
+    return rows
+
+
+def build_course_recommendations(*, top_k=None, min_co_enrollments=None, users_per_block=None):
+    """Rebuild the ``CourseRecommendation`` table. Returns the number of rows."""
+    courses = list(Course.objects.order_by('pk').values_list('pk', 'draft'))
+    pairs = (
+        Enrollment.objects.order_by('user_id', 'course_id')
+        .values_list('user_id', 'course_id')
+        .iterator(chunk_size=ENROLLMENT_CHUNK_SIZE)
+    )
+    rows = compute_course_recommendations(
+        pairs, courses, top_k=top_k, min_co_enrollments=min_co_enrollments,
+        users_per_block=users_per_block,
+    )
+    with transaction.atomic():
+        CourseRecommendation.objects.all().delete()
+        CourseRecommendation.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def recommend_courses_for_user(user, *, limit=None):
+    """Return ``[(course, score), ...]`` for ``user``, best first.
+
+    Scores are summed over the user's enrolled courses; courses the user is
+    already in, drafts and courses that have ended are left out.
+    """
+    limit = settings.COURSE_RECOMMENDATIONS_LIMIT if limit is None else limit
+    enrolled = list(Enrollment.objects.filter(user=user).values_list('course_id', flat=True))
+    if not enrolled or limit <= 0:
+        return []
+
+    today = timezone.localdate()
+    scores = list(
+        CourseRecommendation.objects.filter(course_id__in=enrolled, recommended__draft=False)
+        .exclude(recommended_id__in=enrolled)
+        .filter(~Q(recommended__end_date__lt=today))
+        .values('recommended_id')
+        .annotate(total=Sum('score'))
+        .order_by('-total', 'recommended_id')[:limit]
+    )
+    courses = Course.objects.defer('search_vector').in_bulk([row['recommended_id'] for row in scores])
+    return [
+        (courses[row['recommended_id']], row['total'])
+        for row in scores
+        if row['recommended_id'] in courses
+    ]
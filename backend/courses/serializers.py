@@ -1,10 +1,18 @@
 from urllib.parse import urlparse
 from rest_framework import serializers
+from api.fieldsets import SparseFieldsetsSerializerMixin
+from api.images import ImageSrcsetField
+from api.uploads import DirectUploadSerializerMixin, UploadedObjectKeyField
 from .models import Course, Enrollment
 from users.models import CustomUser
 
+SCHEDULE_FIELDS = [
+    'start_date', 'end_date', 'start_time', 'end_time', 'periodicity', 'timezone',
+    'weekdays', 'week_of_month', 'interval', 'exclude_dates',
+]
 
-class CourseSerializer(serializers.ModelSerializer):
+
+class CourseSerializer(DirectUploadSerializerMixin, SparseFieldsetsSerializerMixin, serializers.ModelSerializer):
     def validate_price(self, value):
         if value is not None:
             if value < 0 or value > 999999.99:
@@ -16,9 +24,12 @@ class CourseSerializer(serializers.ModelSerializer):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # Image is required only on creation (no instance)
-        self.fields['image'].required = self.instance is None
+        if 'image' in self.fields:
+            self.fields['image'].required = self.instance is None
 
     image = serializers.ImageField(required=False, allow_null=True)
+    image_srcset = ImageSrcsetField()
+    image_key = UploadedObjectKeyField('course_image')
     location = serializers.CharField(required=False, allow_null=True, allow_blank=True)
     youtube_video_url = serializers.URLField(required=False, allow_null=True, allow_blank=True)
 
@@ -59,12 +70,30 @@ class CourseSerializer(serializers.ModelSerializer):
     class Meta:
         model = Course
         fields = ['id', 'slug', 'title', 'subtitle', 'description', 'bonified_course_link', 'youtube_video_url',
-                  'image', 'price', 'location', 'start_date', 'end_date', 'start_time', 'end_time',
+                  'image', 'image_srcset', 'image_key', 'price', 'location', 'start_date', 'end_date', 'start_time', 'end_time',
                   'periodicity', 'timezone', 'weekdays', 'week_of_month', 'interval',
                   'exclude_dates', 'max_attendants', 'enrolled_count',
                   'duration_hours', 'formatted_schedule', 'schedule_description',
                   'next_occurrences', 'weekday_display', 'draft', 'created_at', 'updated_at'
                   ]
+        # Named ?fields= presets; None means every field
+        field_presets = {
+            'card': ['id', 'slug', 'title', 'image', 'image_srcset', 'price', 'start_date', 'end_date'],
+            'detail': None,
+        }
+        # Columns needed by fields that are not plain model fields (see api.fieldsets)
+        field_dependencies = {
+            'enrolled_count': [],
+            'image_srcset': ['image', 'image_variants'],
+            'image_key': [],
+            'duration_hours': ['start_time', 'end_time'],
+            'formatted_schedule': SCHEDULE_FIELDS,
+            'schedule_description': SCHEDULE_FIELDS,
+            'next_occurrences': SCHEDULE_FIELDS,
+            'weekday_display': ['weekdays'],
+        }
+        # Keys of direct uploads accepted in place of a file (see api.uploads)
+        direct_upload_fields = {'image_key': 'image'}
 
     def to_internal_value(self, data):
         # Make data mutable (QueryDict is immutable)
@@ -106,7 +135,9 @@ class CourseSerializer(serializers.ModelSerializer):
         return value
 
     def get_enrolled_count(self, obj):
-        return obj.enrollments.count()
+        # CourseViewSet annotates the count; other callers fall back to a query
+        count = getattr(obj, 'enrolled_total', None)
+        return obj.enrollments.count() if count is None else count
 
     def get_next_occurrences(self, obj):
         try:
@@ -14,7 +14,8 @@ from courses.views import CourseViewSet, EnrollmentViewSet
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient, APIRequestFactory, force_authenticate
 from users.models import CustomUser
-from .models import Course, Enrollment
+from .models import Course, CourseRecommendation, Enrollment
+from .recommendations import build_course_recommendations, cooccurrence_matrix, recommend_courses_for_user
 from .serializers import CourseSerializer, EnrollmentSerializer
 from courses.admin import CourseAdmin
 from django.contrib import admin as django_admin
@@ -24,15 +25,16 @@ from unittest.mock import MagicMock, patch
 from decimal import Decimal as PyDecimal
 import stripe as _stripe_module
 from rest_framework.exceptions import NotFound
+from api.testing import QueryBudgetMixin
 
 
 TEST_PASSWORD = os.environ.get("ORDINALY_TEST_PASSWORD") or "test-password"
 
 
 # Helper function to create a test image
-def get_test_image_file():
+def get_test_image_file(color=(0, 0, 0)):
     file = BytesIO()
-    image = Image.new('RGB', (100, 100))
+    image = Image.new('RGB', (100, 100), color)
     image.save(file, 'png')
     file.name = 'test.png'
     file.seek(0)
@@ -435,8 +437,8 @@ class CourseSerializerTest(CourseImageCleanupTestMixin, TestCase):
     def test_contains_expected_fields(self):
         data = self.serializer.data
         expected_fields = [
-            'id', 'slug', 'title', 'subtitle', 'description', 'bonified_course_link', 'youtube_video_url', 'image', 'price',
-            'location', 'start_date', 'end_date', 'start_time', 'end_time',
+            'id', 'slug', 'title', 'subtitle', 'description', 'bonified_course_link', 'youtube_video_url', 'image',
+            'image_srcset', 'price', 'location', 'start_date', 'end_date', 'start_time', 'end_time',
             'periodicity', 'timezone', 'weekdays', 'week_of_month', 'interval',
             'exclude_dates', 'max_attendants', 'enrolled_count',
             'duration_hours', 'formatted_schedule', 'schedule_description',
@@ -1615,7 +1617,8 @@ class CourseModelsExtraTest(CourseImageCleanupTestMixin, TestCase):
         c2 = Course.objects.create(
             title=long_title,
             description='d',
-            image=get_test_image_file(),
+            # Distinct content: identical uploads share one stored file
+            image=get_test_image_file(color=(10, 20, 30)),
             price=10.0,
             location='loc',
             start_date=self.today,
@@ -1629,7 +1632,7 @@ class CourseModelsExtraTest(CourseImageCleanupTestMixin, TestCase):
 
         # Test image replacement deletes old file
         old_path = c2.image.path
-        new_image = get_test_image_file()
+        new_image = get_test_image_file(color=(40, 50, 60))
         c2.image = new_image
         c2.save()
         self.assertFalse(os.path.exists(old_path))
@@ -2485,3 +2488,121 @@ class EnrollmentAdminFormTest(CourseImageCleanupTestMixin, TestCase):
         self.assertIsNone(instance.pk)
         self.assertEqual(instance.user, self.user)
         self.assertEqual(instance.course, self.course)
+
+
+class CourseRecommendationTests(APITestCase):
+    def setUp(self):
+        def course(title, **kwargs):
+            return Course.objects.create(
+                title=title, description='Curso', image='course_images/x.png', max_attendants=50, **kwargs
+            )
+
+        self.python = course('Python')
+        self.django = course('Django')
+        self.sql = course('SQL')
+        self.excel = course('Excel')
+        self.finished = course('Finished', start_date=date.today() - timedelta(days=30),
+                               end_date=date.today() - timedelta(days=20))
+        self.users = [
+            make_user(email=f'rec{index}@example.com', username=f'rec{index}') for index in range(6)
+        ]
+        histories = [
+            [self.python, self.django, self.finished],
+            [self.python, self.django, self.sql, self.finished],
+            [self.python, self.sql],
+            [self.excel],
+            [self.python],
+            [self.sql],
+        ]
+        for user, courses in zip(self.users, histories):
+            for enrolled in courses:
+                Enrollment.objects.create(user=user, course=enrolled)
+
+    def test_cooccurrence_blocks_match_a_single_pass(self):
+        pairs = [(1, 0), (1, 1), (2, 0), (2, 2), (3, 1), (3, 2), (4, 0)]
+        expected = cooccurrence_matrix(pairs, 3, users_per_block=100)
+        self.assertEqual(expected.tolist(), [[3, 1, 1], [1, 2, 1], [1, 1, 2]])
+        self.assertEqual(cooccurrence_matrix(pairs, 3, users_per_block=1).tolist(), expected.tolist())
+
+    def test_build_stores_top_neighbours_with_min_co_enrollments(self):
+        rows = build_course_recommendations(top_k=2, min_co_enrollments=2)
+
+        self.assertEqual(rows, CourseRecommendation.objects.count())
+        first = CourseRecommendation.objects.filter(course=self.python).first()
+        self.assertEqual(first.recommended, self.django)
+        self.assertEqual(first.co_enrollments, 2)
+        self.assertFalse(CourseRecommendation.objects.filter(course=self.excel).exists())
+
+    def test_recommended_endpoint_ranks_unseen_courses(self):
+        build_course_recommendations(top_k=5, min_co_enrollments=1)
+        self.client.force_authenticate(self.users[4])
+
+        # Enrolled ids, summed scores, course rows: independent of table size
+        with self.assertNumQueries(3):
+            recommendations = recommend_courses_for_user(self.users[4])
+        self.assertEqual([course for course, _score in recommendations][:2], [self.django, self.sql])
+
+        response = self.client.get('/api/courses/courses/recommended/', {'fields': 'card'})
+        self.assertEqual(response.status_code, 200)
+        slugs = [item['slug'] for item in response.data]
+        self.assertEqual(slugs, [self.django.slug, self.sql.slug])
+        self.assertNotIn(self.finished.slug, slugs)
+        self.assertGreater(response.data[0]['recommendation_score'], response.data[1]['recommendation_score'])
+
+    def test_recommended_requires_authentication_and_handles_cold_start(self):
+        self.assertIn(self.client.get('/api/courses/courses/recommended/').status_code, (401, 403))
+
+        self.client.force_authenticate(make_user(email='new@example.com', username='newbie'))
+        response = self.client.get('/api/courses/courses/recommended/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+
+
+class CourseQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_user(
+            email='budget-admin@example.com', username='budget_admin', password=TEST_PASSWORD, is_staff=True,
+        )
+        self.course = Course.objects.create(
+            title='Budget anchor', description='Anchor course', image='course_images/anchor.png', price=10,
+            start_date=date(2030, 1, 6), end_date=date(2030, 1, 6), start_time=time(10), end_time=time(12),
+            periodicity='once', max_attendants=2000,
+        )
+
+    def _users(self, start, stop):
+        return CustomUser.objects.bulk_create([
+            CustomUser(email=f'budget{index}@example.com', username=f'budget{index}', name=f'Budget {index}')
+            for index in range(start, stop)
+        ])
+
+    def _courses(self, start, stop):
+        courses = Course.objects.bulk_create([
+            Course(
+                title=f'Course {index}', slug=f'course-{index}', description='Generated', price=10,
+                image=f'course_images/course-{index}.png', start_date=date(2030, 1, 6), end_date=date(2030, 3, 31),
+                start_time=time(10), end_time=time(12), periodicity='weekly', weekdays=[0, 2],
+                max_attendants=30,
+            )
+            for index in range(start, stop)
+        ])
+        # Every course has attendees, so per-course enrollment lookups show up
+        users = self._users(start, stop)
+        Enrollment.objects.bulk_create([Enrollment(user=user, course=course) for user, course in zip(users, courses)])
+
+    def _enrollments(self, start, stop):
+        Enrollment.objects.bulk_create([Enrollment(user=user, course=self.course) for user in self._users(start, stop)])
+
+    # Course lists: the ETag/Last-Modified aggregate plus the page itself
+    def test_course_list(self):
+        self.assertQueryBudget('/api/courses/courses/', budget=2, populate=self._courses)
+
+    def test_course_card_list(self):
+        self.assertQueryBudget('/api/courses/courses/', {'fields': 'card'}, budget=2, populate=self._courses)
+
+    def test_staff_course_list(self):
+        self.client.force_authenticate(self.admin)
+        self.assertQueryBudget('/api/courses/courses/', budget=2, populate=self._courses)
+
+    def test_enrollment_list(self):
+        self.client.force_authenticate(self.admin)
+        self.assertQueryBudget('/api/courses/enrollments/', budget=1, populate=self._enrollments)
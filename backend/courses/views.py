@@ -2,13 +2,23 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.exceptions import APIException, NotFound
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.conf import settings
 from django.http import HttpResponse
+from api import metrics
+from api.conditional import ConditionalGetMixin
+from api.fieldsets import SparseFieldsetsViewMixin
+from api.search import FullTextSearchFilter
+from api.response_cache import CachedResponseMixin
+from api.storage import share_file
 from .models import Course, Enrollment
+from .recommendations import recommend_courses_for_user
 from .serializers import CourseSerializer, EnrollmentSerializer
 from django.utils import timezone
 from datetime import datetime, time, timedelta
 from zoneinfo import ZoneInfo
 from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 
 # Stripe webhook endpoint to handle payment events
 from rest_framework.views import APIView
@@ -27,13 +37,12 @@ from users.services.notification_service import (
 )
 
 logger = logging.getLogger(__name__)
-from django.core.files.base import ContentFile
-from uuid import uuid4
 
 # Set Stripe API key from environment at import time
 stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
 
 COURSE_FULL_DETAIL = "This course is already full."
+RECOMMENDED_MAX_LIMIT = 20
 ALREADY_ENROLLED_DETAIL = "You are already enrolled in this course."
 ENROLLMENT_EMAIL_FAILURE_LOG = "Failed to send enrollment confirmation email for user %s"
 UNENROLLMENT_EMAIL_FAILURE_LOG = "Failed to send unenrollment confirmation email for user %s"
@@ -50,9 +59,28 @@ class IsAdminUserOrReadOnly(permissions.BasePermission):
         return request.user and request.user.is_authenticated and request.user.is_staff
 
 
-class CourseViewSet(viewsets.ModelViewSet):
+class CourseViewSet(CachedResponseMixin, ConditionalGetMixin, SparseFieldsetsViewMixin,
+                    viewsets.ModelViewSet):
     queryset = Course.objects.all()
     lookup_field = 'slug'
+    # enrolled_count is part of the payload, so enrollments invalidate too
+    response_cache_models = (Course, Enrollment)
+    # Unenrolling changes enrolled_count without touching updated_at
+    trust_if_modified_since = False
+
+    def get_validator_aggregates(self):
+        return {
+            'enrollment_count': Count('enrollments', distinct=True),
+            'last_enrolled': Max('enrollments__enrolled_at'),
+        }
+
+    def get_object_validator_parts(self, instance):
+        enrollments = instance.enrollments.aggregate(count=Count('pk'), last=Max('enrolled_at'))
+        return (enrollments['count'], enrollments['last'])
+
+    def get_validator_salt(self):
+        # next_occurrences is computed relative to today
+        return timezone.localdate().isoformat()
 
     def get_object(self):
         """Resolve object by slug first, then fall back to numeric PK if needed.
@@ -83,7 +111,13 @@ class CourseViewSet(viewsets.ModelViewSet):
             raise NotFound(detail="Course not found")
 
     def get_queryset(self):
-        qs = Course.objects.all()
+        # search_vector is only read by the database; don't ship it to Python.
+        # enrolled_count is annotated so lists don't count each course's enrollments.
+        enrolled = (
+            Enrollment.objects.filter(course=OuterRef('pk')).order_by()
+            .values('course').annotate(total=Count('pk')).values('total')
+        )
+        qs = Course.objects.defer('search_vector').annotate(enrolled_total=Coalesce(Subquery(enrolled), 0))
         user = self.request.user
         # Only show draft courses to admin users
         if not (user and user.is_authenticated and user.is_staff):
@@ -91,6 +125,8 @@ class CourseViewSet(viewsets.ModelViewSet):
         return qs
     serializer_class = CourseSerializer
     permission_classes = [IsAdminUserOrReadOnly]
+    filter_backends = [FullTextSearchFilter]
+    search_fields = ['title', 'subtitle', 'description']
 
     def perform_create(self, serializer):
         course = serializer.save()
@@ -151,6 +187,25 @@ class CourseViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def recommended(self, request, *args, **kwargs):
+        """Courses taken by people who took the same courses as the user, best first.
+
+        Served from the precomputed table built by `build_course_recommendations`.
+        """
+        try:
+            limit = int(request.query_params.get('limit', settings.COURSE_RECOMMENDATIONS_LIMIT))
+        except ValueError:
+            limit = settings.COURSE_RECOMMENDATIONS_LIMIT
+        limit = max(1, min(limit, RECOMMENDED_MAX_LIMIT))
+
+        recommendations = recommend_courses_for_user(request.user, limit=limit)
+        serializer = self.get_serializer([course for course, _score in recommendations], many=True)
+        data = serializer.data
+        for item, (_course, score) in zip(data, recommendations):
+            item['recommendation_score'] = round(score, 6)
+        return Response(data)
+
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def enroll(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
@@ -224,11 +279,8 @@ class CourseViewSet(viewsets.ModelViewSet):
         copy.slug = ""
         if course.image:
             try:
-                course.image.open('rb')
-                content = course.image.read()
-                ext = os.path.splitext(course.image.name)[1] or ".jpg"
-                filename = f"{uuid4().hex}{ext}"
-                copy.image.save(filename, ContentFile(content), save=False)
+                # Shares the stored file (a reference, not a copy)
+                copy.image = share_file(course.image)
             except Exception:
                 pass
         copy.save()
@@ -585,6 +637,11 @@ class StripeWebhookView(APIView):
         except Exception as e:
             return Response({'detail': f'Webhook error: {str(e)}'}, status=400)
 
+        if event.get('created'):
+            metrics.stripe_webhook_lag.observe(
+                max(timezone.now().timestamp() - event['created'], 0), event_type=event['type'],
+            )
+
         # Handle successful payment
         if event['type'] == 'checkout.session.completed':
             return self._apply_checkout_session_payment(event['data']['object'])
@@ -601,8 +658,10 @@ class EnrollmentViewSet(viewsets.ReadOnlyModelViewSet):
         if not self.request.user.is_authenticated:
             return Enrollment.objects.none()
 
+        # user_details reads each enrollment's user
+        queryset = Enrollment.objects.select_related('user')
         # Regular users can only see their own enrollments
         if not self.request.user.is_staff:
-            return Enrollment.objects.filter(user=self.request.user)
+            return queryset.filter(user=self.request.user)
         # Admin users can see all enrollments
-        return Enrollment.objects.all()
+        return queryset
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from services.recommendations import refresh_related_services
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the TF-IDF related-services table for every service. "
+        "Service saves refresh it automatically; run this after bulk imports "
+        "or when changing RELATED_SERVICES_TOP_K."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top-k", type=int, default=None)
+        parser.add_argument("--min-score", type=float, default=None)
+
+    def handle(self, *args, **options):
+        rows = refresh_related_services(top_k=options["top_k"], min_score=options["min_score"])
+        self.stdout.write(self.style.SUCCESS(f"related_services_build rows={rows}"))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from services.models import Service
+
+
+class Command(BaseCommand):
+    help = (
+        "Store rendered HTML and plain text for service descriptions and "
+        "requisites whose rendering is missing or stale."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true")
+        parser.add_argument("--batch-size", type=int, default=200)
+
+    def handle(self, *args, **options):
+        batch_size = max(options["batch_size"], 1)
+        rendered = 0
+        skipped = 0
+        pending = []
+
+        queryset = Service.objects.only(
+            "id", "description", "requisites", *Service.RENDERED_MARKDOWN_FIELDS
+        ).order_by("pk")
+        for service in queryset.iterator(chunk_size=batch_size):
+            if not service.render_markdown(force=options["force"]):
+                skipped += 1
+                continue
+            pending.append(service)
+            if len(pending) >= batch_size:
+                rendered += self._flush(pending)
+                pending = []
+
+        if pending:
+            rendered += self._flush(pending)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"service_markdown_render rendered={rendered} skipped={skipped}"
+            )
+        )
+
+    def _flush(self, services):
+        # bulk_update leaves `updated_at` alone: only the derived columns change.
+        Service.objects.bulk_update(services, Service.RENDERED_MARKDOWN_FIELDS)
+        return len(services)
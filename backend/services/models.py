@@ -1,12 +1,47 @@
 from django.db import models
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
 from decimal import Decimal
 from urllib.parse import urlparse
 from django.utils.text import slugify
+from api.images import delete_variants, schedule_image_variants
+import hashlib
+import re
 import markdown
 
+# Bump when the Markdown extensions or their configuration change so that
+# `Service.save` and `render_service_markdown` regenerate the stored HTML.
+MARKDOWN_RENDERER_VERSION = 1
+
+MARKDOWN_EXTENSIONS = ['codehilite', 'tables', 'fenced_code', 'nl2br']
+MARKDOWN_EXTENSION_CONFIGS = {
+    'codehilite': {
+        'css_class': 'highlight',
+        'use_pygments': True
+    }
+}
+
+# Service fields that feed `services.recommendations`; saving any other field
+# leaves the related-services table alone.
+RELATED_SOURCE_FIELDS = ('title', 'subtitle', 'description', 'requisites', 'draft')
+
+
+def render_markdown_html(text):
+    """Render Markdown to HTML with the extensions used across the site"""
+    return markdown.markdown(
+        text,
+        extensions=MARKDOWN_EXTENSIONS,
+        extension_configs=MARKDOWN_EXTENSION_CONFIGS
+    )
+
+
+def render_markdown_text(text):
+    """Render Markdown and strip the resulting tags, leaving plain text"""
+    html_content = markdown.markdown(text)
+    return re.sub('<[^<]+?>', '', html_content).strip()
+
 
 class Service(models.Model):
     # Color choices for service theming
@@ -178,6 +213,8 @@ class Service(models.Model):
         help_text="Markdown content that will be converted to HTML for display"
     )
     image = models.ImageField(upload_to='service_images/', null=True, blank=True)
+    # Resized copies of `image` (see api.images); empty until generated
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     youtube_video_url = models.URLField(
         max_length=255,
         null=True,
@@ -224,6 +261,21 @@ class Service(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Rendered copies of `description` and `requisites`, kept in sync on save.
+    # `rendered_digest` identifies the source text and renderer version they
+    # were built from.
+    description_html = models.TextField(blank=True, default="", editable=False)
+    description_text = models.TextField(blank=True, default="", editable=False)
+    rendered_requisites_html = models.TextField(blank=True, default="", editable=False)
+    rendered_digest = models.CharField(max_length=64, blank=True, default="", editable=False)
+
+    # Maintained by a database trigger on PostgreSQL (see api.search)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    RENDERED_MARKDOWN_FIELDS = (
+        'description_text', 'description_html', 'rendered_requisites_html', 'rendered_digest'
+    )
+
     def __str__(self):
         return self.title
 
@@ -249,8 +301,8 @@ class Service(models.Model):
             i += 1
         self.slug = slug_candidate
 
-    def _delete_replaced_image(self, old_image):
-        """Remove the previous image file when it gets replaced/cleared."""
+    def _delete_replaced_image(self, old_image, old_variants=None):
+        """Remove the previous image file (and its variants) when it gets replaced/cleared."""
         if not (old_image and (not self.image or self.image.name != old_image)):
             return
         try:
@@ -259,19 +311,26 @@ class Service(models.Model):
             storage = storage or self._meta.get_field('image').storage
             if storage.exists(old_image):
                 storage.delete(old_image)
+            delete_variants(storage, old_variants)
         except Exception:
             # File cleanup should never block saving the model
             pass
 
     def save(self, *args, **kwargs):
         old_image = None
+        old_variants = None
+        old_sources = None
         if self.pk:
-            old_image = (
+            old = (
                 Service.objects.filter(pk=self.pk)
-                .only('image')
-                .values_list('image', flat=True)
+                .values_list('image', 'image_variants', *RELATED_SOURCE_FIELDS)
                 .first()
             )
+            if old is not None:
+                old_image, old_variants, *old_sources = old
+        image_changed = (self.image.name if self.image else '') != (old_image or '')
+        if image_changed:
+            self.image_variants = {}
 
         self._truncate_title_to_max_length()
 
@@ -283,12 +342,24 @@ class Service(models.Model):
         if self.draft is None:
             self.draft = False
 
+        rendered_fields = self.render_markdown()
+        if image_changed:
+            rendered_fields.append('image_variants')
+        update_fields = kwargs.get('update_fields')
+        if rendered_fields and update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | set(rendered_fields)
+
         super().save(*args, **kwargs)
-        self._delete_replaced_image(old_image)
+        self._delete_replaced_image(old_image, old_variants)
+        if image_changed:
+            schedule_image_variants(self)
+        if self._related_sources_changed(old_sources, kwargs.get('update_fields')):
+            self._schedule_related_refresh()
 
     def delete(self, *args, **kwargs):
         image_name = self.image.name if self.image else None
         storage = self.image.storage if self.image else self._meta.get_field('image').storage
+        image_variants = self.image_variants
         super().delete(*args, **kwargs)
         if image_name:
             try:
@@ -296,6 +367,23 @@ class Service(models.Model):
                     storage.delete(image_name)
             except Exception:
                 pass
+        delete_variants(storage, image_variants)
+        self._schedule_related_refresh()
+
+    def _related_sources_changed(self, old_sources, update_fields):
+        """Whether this save can move recommendations (always for new rows)."""
+        if old_sources is None:
+            return True
+        return any(
+            getattr(self, field) != old
+            for field, old in zip(RELATED_SOURCE_FIELDS, old_sources)
+            if update_fields is None or field in update_fields
+        )
+
+    def _schedule_related_refresh(self):
+        if settings.RELATED_SERVICES_REFRESH_ON_SAVE:
+            from .recommendations import schedule_related_services_refresh
+            schedule_related_services_refresh()
 
     def clean(self):
         max_size = 1024 * 1024  # 1MB
@@ -317,42 +405,49 @@ class Service(models.Model):
                 })
         super().clean()
 
+    def markdown_digest(self):
+        """Fingerprint of the Markdown sources and the renderer version"""
+        source = f"{MARKDOWN_RENDERER_VERSION}\0{self.description or ''}\0{self.requisites or ''}"
+        return hashlib.sha256(source.encode()).hexdigest()
+
+    def has_current_rendering(self):
+        return bool(self.rendered_digest) and self.rendered_digest == self.markdown_digest()
+
+    def render_markdown(self, force=False):
+        """Refresh the stored HTML/plain text if the sources changed.
+
+        Returns the names of the fields that were updated (empty when the
+        stored rendering is already current).
+        """
+        if not force and self.has_current_rendering():
+            return []
+        self.description_text = render_markdown_text(self.description or "")
+        self.description_html = render_markdown_html(self.description or "")
+        self.rendered_requisites_html = (
+            render_markdown_html(self.requisites) if self.requisites else ""
+        )
+        self.rendered_digest = self.markdown_digest()
+        return list(self.RENDERED_MARKDOWN_FIELDS)
+
     def get_clean_description(self):
         """Return description with Markdown formatting removed for plain text display"""
-        # Convert markdown to HTML first, then strip HTML tags
-        html_content = markdown.markdown(self.description)
-        # Remove HTML tags using regex as strip_tags is not available
-        import re
-        clean_text = re.sub('<[^<]+?>', '', html_content)
-        return clean_text.strip()
+        if self.has_current_rendering():
+            return self.description_text
+        return render_markdown_text(self.description)
 
     def get_html_description(self):
         """Convert Markdown description to HTML for display"""
-        return markdown.markdown(
-            self.description,
-            extensions=['codehilite', 'tables', 'fenced_code', 'nl2br'],
-            extension_configs={
-                'codehilite': {
-                    'css_class': 'highlight',
-                    'use_pygments': True
-                }
-            }
-        )
+        if self.has_current_rendering():
+            return self.description_html
+        return render_markdown_html(self.description)
 
     def get_html_requisites(self):
         """Convert Markdown requisites to HTML for display"""
         if not self.requisites:
             return ""
-        return markdown.markdown(
-            self.requisites,
-            extensions=['codehilite', 'tables', 'fenced_code', 'nl2br'],
-            extension_configs={
-                'codehilite': {
-                    'css_class': 'highlight',
-                    'use_pygments': True
-                }
-            }
-        )
+        if self.has_current_rendering():
+            return self.rendered_requisites_html
+        return render_markdown_html(self.requisites)
 
     def get_color_display(self):
         """Return the color value prefixed with # for CSS usage"""
@@ -367,3 +462,26 @@ class Service(models.Model):
         return self.description[:100] + "..."
     description_preview.short_description = "Description Preview"
 
+
+class RelatedService(models.Model):
+    """Precomputed "related services" for a service, best match first.
+
+    Rows are rebuilt wholesale by `services.recommendations`; never edit them
+    by hand.
+    """
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['service', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['service', 'related'], name='unique_related_service'),
+        ]
+        indexes = [
+            models.Index(fields=['service', 'rank'], name='related_service_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.service_id} -> {self.related_id} ({self.score:.3f})"
@@ -0,0 +1,174 @@
+"""Content-based "related services" computed with TF-IDF.
+
+Every service becomes a TF-IDF vector over the words of its title, subtitle,
+description and requisites (title and subtitle words count extra). Rows are
+L2-normalized, so one matrix product gives the cosine similarity of every
+pair. The best ``RELATED_SERVICES_TOP_K`` published neighbours of each
+service are written to ``RelatedService``, which detail responses read with
+a single indexed query.
+
+The whole table is recomputed because any change to the catalogue moves the
+IDF weights of every vector, but it is only rewritten (and cached detail
+responses only invalidated) when the result differs. Saves schedule a refresh
+only when one of ``RELATED_SOURCE_FIELDS`` changes (see ``Service.save``). With
+``RELATED_SERVICES_REFRESH_ASYNC`` the refresh runs after commit on a single
+background thread, and saves arriving while one is pending share it.
+"""
+
+import logging
+import math
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.db import connections, transaction
+
+from api.response_cache import bump_generation
+from api.similarity import top_neighbours
+from api.text import normalize
+
+from .models import RelatedService, Service
+
+logger = logging.getLogger(__name__)
+
+FIELD_WEIGHTS = {"title": 3, "subtitle": 2, "description": 1, "requisites": 1}
+MIN_TOKEN_LENGTH = 3
+STOPWORDS = frozenset(
+    """
+    para por con los las del una uno unos unas que como sus mas pero este esta estos estas
+    ese esa sin sobre entre hasta desde cada todo toda todos todas muy tambien son ser
+    and the for with from that this are you your our into more can will
+    """.split()
+)
+
+
+def tokenize(text):
+    return [
+        word for word in normalize(text).split()
+        if len(word) >= MIN_TOKEN_LENGTH and not word.isdigit() and word not in STOPWORDS
+    ]
+
+
+def _document(service):
+    counts = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        for token in tokenize(getattr(service, field, "") or ""):
+            counts[token] += weight
+    return counts
+
+
+def tfidf_matrix(documents):
+    """Return the L2-normalized TF-IDF matrix (one row per document)."""
+    vocabulary = {}
+    for counts in documents:
+        for token in counts:
+            vocabulary.setdefault(token, len(vocabulary))
+
+    matrix = np.zeros((len(documents), len(vocabulary)), dtype=np.float64)
+    for row, counts in enumerate(documents):
+        for token, count in counts.items():
+            # Sublinear TF so a word repeated in a long description doesn't dominate.
+            matrix[row, vocabulary[token]] = 1.0 + math.log(count)
+
+    document_frequency = np.count_nonzero(matrix, axis=0)
+    idf = np.log((1.0 + len(documents)) / (1.0 + document_frequency)) + 1.0
+    matrix *= idf
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def compute_related_services(services, *, top_k=None, min_score=None):
+    """Return unsaved ``RelatedService`` rows for ``services``."""
+    top_k = settings.RELATED_SERVICES_TOP_K if top_k is None else top_k
+    min_score = settings.RELATED_SERVICES_MIN_SCORE if min_score is None else min_score
+    services = list(services)
+    if len(services) < 2 or top_k <= 0:
+        return []
+
+    matrix = tfidf_matrix([_document(service) for service in services])
+    similarity = matrix @ matrix.T
+    published = np.array([not service.draft for service in services])
+
+    rows = []
+    for row, neighbours in top_neighbours(similarity, published, top_k, min_score):
+        for rank, (column, score) in enumerate(neighbours, start=1):
+            rows.append(RelatedService(
+                service_id=services[row].pk,
+                related_id=services[column].pk,
+                rank=rank,
+                score=round(score, 6),
+            ))
+    return rows
+
+
+def refresh_related_services(*, top_k=None, min_score=None):
+    """Recompute the whole ``RelatedService`` table. Returns the number of rows."""
+    services = Service.objects.only(
+        "id", "draft", "title", "subtitle", "description", "requisites"
+    ).order_by("pk")
+    rows = compute_related_services(services, top_k=top_k, min_score=min_score)
+    fresh = {(row.service_id, row.related_id, row.rank, row.score) for row in rows}
+    with transaction.atomic():
+        current = set(
+            RelatedService.objects.order_by().values_list("service_id", "related_id", "rank", "score")
+        )
+        if current == fresh:
+            return len(rows)
+        RelatedService.objects.all().delete()
+        RelatedService.objects.bulk_create(rows)
+    # bulk_create sends no signals; orphan cached detail responses explicitly.
+    bump_generation(RelatedService._meta.label_lower)
+    return len(rows)
+
+
+def _refresh_safely():
+    try:
+        refresh_related_services()
+    except Exception:
+        # Recommendations are best effort; never fail the write that triggered them.
+        logger.exception("Could not refresh related services")
+
+
+_executor = None
+_queued = False
+_queued_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # One worker, so refreshes never run concurrently.
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="related-services")
+    return _executor
+
+
+def _refresh_in_background():
+    global _queued
+    with _queued_lock:
+        # Saves committed from here on queue another run.
+        _queued = False
+    try:
+        _refresh_safely()
+    finally:
+        connections.close_all()
+
+
+def _queue_refresh():
+    global _queued
+    with _queued_lock:
+        if _queued:
+            return
+        _queued = True
+    _get_executor().submit(_refresh_in_background)
+
+
+def schedule_related_services_refresh():
+    """Refresh recommendations once the surrounding transaction commits."""
+    if settings.RELATED_SERVICES_REFRESH_ASYNC:
+        transaction.on_commit(_queue_refresh)
+    else:
+        transaction.on_commit(_refresh_safely)
@@ -1,30 +1,66 @@
 from urllib.parse import urlparse
 from rest_framework import serializers
-from .models import Service
+from api.fieldsets import SparseFieldsetsSerializerMixin
+from api.images import ImageSrcsetField
+from api.uploads import DirectUploadSerializerMixin, UploadedObjectKeyField
+from .models import RelatedService, Service
 
 
-class ServiceSerializer(serializers.ModelSerializer):
+class ServiceSerializer(DirectUploadSerializerMixin, SparseFieldsetsSerializerMixin, serializers.ModelSerializer):
     created_by_username = serializers.ReadOnlyField(source='created_by.username')
     clean_description = serializers.SerializerMethodField()
     html_description = serializers.SerializerMethodField()
     requisites_html = serializers.SerializerMethodField()
     color_hex = serializers.SerializerMethodField()
     image = serializers.ImageField(required=False, allow_null=True)
+    image_srcset = ImageSrcsetField()
+    image_key = UploadedObjectKeyField('service_image')
     youtube_video_url = serializers.URLField(required=False, allow_null=True, allow_blank=True)
     remove_image = serializers.BooleanField(write_only=True, required=False, default=False)
+    related_services = serializers.SerializerMethodField()
 
     class Meta:
         model = Service
         fields = [
             'id', 'type', 'title', 'slug', 'subtitle', 'description', 'clean_description',
             'html_description', 'requisites_html', 'color', 'color_hex', 'icon', 'duration', 'image',
-            'remove_image', 'youtube_video_url', 'requisites', 'price', 'is_featured', 'draft', 'created_by',
-            'created_by_username', 'created_at', 'updated_at', 'contactButtonText', 'contactButtonUrl'
+            'image_srcset', 'image_key', 'remove_image', 'youtube_video_url', 'requisites', 'price', 'is_featured', 'draft',
+            'created_by', 'created_by_username', 'created_at', 'updated_at', 'contactButtonText', 'contactButtonUrl',
+            'related_services'
         ]
         read_only_fields = [
             'created_by', 'created_at', 'updated_at',
-            'clean_description', 'html_description', 'requisites_html', 'color_hex'
+            'clean_description', 'html_description', 'requisites_html', 'color_hex', 'related_services'
         ]
+        # Named ?fields= presets; None means every field
+        field_presets = {
+            'card': [
+                'id', 'type', 'slug', 'title', 'subtitle', 'clean_description', 'color', 'color_hex',
+                'icon', 'image', 'image_srcset', 'price', 'duration', 'is_featured'
+            ],
+            'detail': None,
+        }
+        # Columns needed by fields that are not plain model fields (see api.fieldsets)
+        field_dependencies = {
+            'created_by_username': ['created_by'],
+            'clean_description': ['description', 'requisites', 'description_text', 'rendered_digest'],
+            'html_description': ['description', 'requisites', 'description_html', 'rendered_digest'],
+            'requisites_html': ['description', 'requisites', 'rendered_requisites_html', 'rendered_digest'],
+            'color_hex': ['color'],
+            'image_srcset': ['image', 'image_variants'],
+            'image_key': [],
+            'remove_image': [],
+            'related_services': [],
+        }
+        # Keys of direct uploads accepted in place of a file (see api.uploads)
+        direct_upload_fields = {'image_key': 'image'}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Recommendations are a detail-page feature; keep list payloads lean
+        view = self.context.get('view')
+        if getattr(view, 'action', None) != 'retrieve':
+            self.fields.pop('related_services', None)
 
     def to_internal_value(self, data):
         # Work on a mutable copy because incoming `data` can be a QueryDict
@@ -61,6 +97,31 @@ class ServiceSerializer(serializers.ModelSerializer):
         """Return the color value prefixed with # for CSS usage"""
         return obj.get_color_display()
 
+    def get_related_services(self, obj):
+        """Return the precomputed related services (see services.recommendations)"""
+        links = (
+            RelatedService.objects.filter(service=obj, related__draft=False)
+            .select_related('related')
+            .only(
+                'score', 'related', 'related__id', 'related__type', 'related__slug', 'related__title',
+                'related__subtitle', 'related__color', 'related__icon',
+            )
+            .order_by('rank')
+        )
+        return [
+            {
+                'id': link.related.id,
+                'type': link.related.type,
+                'slug': link.related.slug,
+                'title': link.related.title,
+                'subtitle': link.related.subtitle,
+                'color_hex': link.related.get_color_display(),
+                'icon': link.related.icon,
+                'score': link.score,
+            }
+            for link in links
+        ]
+
     def validate(self, data):
         # Support clearing the image via an explicit flag
         if data.pop('remove_image', False):
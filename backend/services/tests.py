@@ -9,7 +9,8 @@ from django.urls import reverse
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status, serializers as drf_serializers
-from services.models import Service
+from services.models import RelatedService, Service, render_markdown_html
+from services.recommendations import refresh_related_services, tfidf_matrix, tokenize
 from services.serializers import ServiceSerializer
 from unittest.mock import MagicMock, patch
 from django.contrib import admin as django_admin
@@ -24,6 +25,7 @@ import tempfile
 from io import BytesIO
 from rest_framework.exceptions import NotFound
 from types import SimpleNamespace
+from api.testing import QueryBudgetMixin
 
 TEST_PASSWORD = os.environ.get("ORDINALY_TEST_PASSWORD") or "test-password"
 
@@ -168,6 +170,60 @@ class ServiceModelTests(TestCase):
         service.requisites = ''
         self.assertEqual(service.get_html_requisites(), '')
 
+    def test_save_stores_rendered_markdown(self):
+        service = self._create_service(description='**bold**', requisites='* one')
+        service.refresh_from_db()
+
+        self.assertIn('<strong>bold</strong>', service.description_html)
+        self.assertEqual(service.description_text, 'bold')
+        self.assertIn('<li>one</li>', service.rendered_requisites_html)
+        with patch('services.models.markdown.markdown') as mock_markdown:
+            self.assertEqual(service.get_html_description(), service.description_html)
+            self.assertEqual(service.get_clean_description(), 'bold')
+            self.assertEqual(service.get_html_requisites(), service.rendered_requisites_html)
+        mock_markdown.assert_not_called()
+
+    def test_save_rerenders_only_when_source_or_version_changes(self):
+        service = self._create_service(description='first')
+        with patch('services.models.render_markdown_html', wraps=render_markdown_html) as mock_render:
+            service.title = 'Renamed'
+            service.save()
+            mock_render.assert_not_called()
+
+            service.description = 'second'
+            service.save(update_fields=['description'])
+            mock_render.assert_called()
+        service.refresh_from_db()
+        self.assertIn('second', service.description_html)
+
+        with patch('services.models.MARKDOWN_RENDERER_VERSION', 999):
+            self.assertFalse(service.has_current_rendering())
+            self.assertEqual(service.render_markdown(), list(Service.RENDERED_MARKDOWN_FIELDS))
+
+    def test_stale_rendering_falls_back_to_live_markdown(self):
+        service = self._create_service(description='old')
+        Service.objects.filter(pk=service.pk).update(description='*new*')
+        service.refresh_from_db()
+
+        self.assertIn('<em>new</em>', service.get_html_description())
+
+    def test_render_service_markdown_command_backfills_rows(self):
+        from io import StringIO
+        from django.core.management import call_command
+        stale = self._create_service(description='**stale**')
+        current = self._create_service(title='Current', description='ok')
+        Service.objects.filter(pk=stale.pk).update(description_html='', rendered_digest='')
+
+        out = StringIO()
+        call_command('render_service_markdown', stdout=out)
+
+        self.assertIn('rendered=1 skipped=1', out.getvalue())
+        stale.refresh_from_db()
+        self.assertIn('<strong>stale</strong>', stale.description_html)
+        self.assertTrue(stale.has_current_rendering())
+        current.refresh_from_db()
+        self.assertTrue(current.has_current_rendering())
+
     def test_color_display_and_description_preview(self):
         long_description = 'x' * 150
         service = self._create_service(
@@ -757,3 +813,142 @@ def cleanup_service_test_images():
         except Exception:
             # File cleanup is best-effort for test isolation.
             pass
+
+
+@override_settings(RELATED_SERVICES_REFRESH_ASYNC=False)
+class RelatedServicesTests(APITestCase):
+    def _service(self, title, description, **kwargs):
+        kwargs.setdefault('subtitle', 'Servicio')
+        return Service.objects.create(
+            title=title, description=description, color='141413', icon='Bot', **kwargs
+        )
+
+    def setUp(self):
+        self.chatbot = self._service('Chatbot de atención', 'Chatbot con inteligencia artificial para atención al cliente')
+        self.assistant = self._service('Asistente de chatbot', 'Asistente conversacional e inteligencia artificial')
+        self.invoices = self._service('Facturación automática', 'Automatiza facturas y contabilidad')
+        self.draft = self._service('Chatbot interno', 'Chatbot de inteligencia artificial', draft=True)
+
+    def test_tokenize_folds_accents_and_drops_stopwords(self):
+        self.assertEqual(tokenize('La Atención para los Clientes, 2024'), ['atencion', 'clientes'])
+
+    def test_tfidf_rows_are_unit_length(self):
+        matrix = tfidf_matrix([{'chatbot': 2, 'ia': 1}, {'facturas': 1}, {}])
+        self.assertAlmostEqual(float((matrix[0] ** 2).sum()), 1.0)
+        self.assertEqual(float(matrix[2].sum()), 0.0)
+        self.assertEqual(float(matrix[0] @ matrix[1]), 0.0)
+
+    def test_refresh_stores_ranked_published_neighbours(self):
+        refresh_related_services(top_k=2, min_score=0.01)
+
+        related = list(
+            RelatedService.objects.filter(service=self.chatbot).values_list('related__slug', flat=True)
+        )
+        self.assertEqual(related[0], self.assistant.slug)
+        self.assertNotIn(self.draft.slug, related)
+        self.assertNotIn(self.chatbot.slug, related)
+        # Drafts still get recommendations for the staff preview
+        self.assertTrue(RelatedService.objects.filter(service=self.draft).exists())
+
+    def test_save_refreshes_recommendations_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._service('Chatbot para ventas', 'Chatbot de inteligencia artificial para ventas')
+
+        self.assertTrue(RelatedService.objects.filter(service__slug='chatbot-para-ventas').exists())
+
+    def test_only_source_field_changes_schedule_a_refresh(self):
+        with patch('services.recommendations.schedule_related_services_refresh') as schedule:
+            self.chatbot.save(update_fields=['image_variants'])
+            self.chatbot.color = '000000'
+            self.chatbot.save()
+            schedule.assert_not_called()
+
+            self.chatbot.draft = True
+            self.chatbot.save(update_fields=['draft'])
+            schedule.assert_called_once()
+
+    def test_unchanged_result_is_not_rewritten(self):
+        from api.response_cache import get_generations
+        refresh_related_services(top_k=2, min_score=0.01)
+        before = get_generations(['services.relatedservice'])
+        with self.assertNumQueries(4):
+            refresh_related_services(top_k=2, min_score=0.01)
+        self.assertEqual(get_generations(['services.relatedservice']), before)
+
+    @override_settings(RELATED_SERVICES_REFRESH_ASYNC=True)
+    def test_pending_background_refresh_absorbs_later_saves(self):
+        from services import recommendations
+        executor = MagicMock()
+        with patch.object(recommendations, '_get_executor', return_value=executor), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.chatbot.title = 'Chatbot renovado'
+            self.chatbot.save()
+            self.assistant.title = 'Asistente renovado'
+            self.assistant.save()
+        executor.submit.assert_called_once_with(recommendations._refresh_in_background)
+        recommendations._queued = False
+
+    def test_detail_embeds_related_services_and_list_does_not(self):
+        refresh_related_services(top_k=2, min_score=0.01)
+
+        detail = self.client.get(f'/api/services/{self.chatbot.slug}/')
+        listing = self.client.get('/api/services/')
+
+        self.assertEqual(detail.status_code, 200)
+        self.assertEqual(detail.data['related_services'][0]['slug'], self.assistant.slug)
+        self.assertEqual(
+            set(detail.data['related_services'][0]),
+            {'id', 'type', 'slug', 'title', 'subtitle', 'color_hex', 'icon', 'score'},
+        )
+        self.assertNotIn('related_services', listing.data[0])
+
+    def test_refresh_invalidates_cached_detail(self):
+        url = f'/api/services/{self.chatbot.slug}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url).json()['related_services'], [])
+
+        refresh_related_services(top_k=2, min_score=0.01)
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(url).json()['related_services'][0]['slug'], self.assistant.slug)
+
+
+class ServiceQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        self.admin = get_user_model().objects.create_user(
+            email='budget-admin@example.com', username='budget_admin', password=TEST_PASSWORD, is_staff=True,
+        )
+        self.anchor = Service.objects.create(
+            type=Service.SERVICE, title='Budget anchor', subtitle='Anchor', description='Anchor', color='141413',
+            icon='Bot', created_by=self.admin,
+        )
+
+    def _services(self, start, stop):
+        return Service.objects.bulk_create([
+            Service(
+                type=Service.SERVICE, title=f'Service {index}', slug=f'service-{index}', subtitle='Generated',
+                description='Generated **service**', color='141413', icon='Bot', created_by=self.admin,
+            )
+            for index in range(start, stop)
+        ])
+
+    def _related(self, start, stop):
+        RelatedService.objects.bulk_create([
+            RelatedService(service=self.anchor, related=service, rank=index, score=1.0)
+            for index, service in zip(range(start, stop), self._services(start, stop))
+        ])
+
+    # Lists: the ETag/Last-Modified aggregate plus the page itself
+    def test_service_list(self):
+        self.assertQueryBudget('/api/services/', budget=2, populate=self._services)
+
+    def test_service_card_list(self):
+        self.assertQueryBudget('/api/services/', {'fields': 'card'}, budget=2, populate=self._services)
+
+    def test_staff_service_list(self):
+        self.client.force_authenticate(self.admin)
+        self.assertQueryBudget('/api/services/', budget=2, populate=self._services)
+
+    # Detail: the service with its author, then its related services
+    def test_service_detail_with_related_services(self):
+        self.assertQueryBudget(f'/api/services/{self.anchor.slug}/', budget=2, populate=self._related)
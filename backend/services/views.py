@@ -3,11 +3,13 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.exceptions import NotFound
-from django.core.files.base import ContentFile
-from uuid import uuid4
-import os
 import json
-from .models import Service
+from api.conditional import ConditionalGetMixin
+from api.fieldsets import SparseFieldsetsViewMixin
+from api.search import FullTextSearchFilter
+from api.response_cache import CachedResponseMixin, get_generations
+from api.storage import share_file
+from .models import RelatedService, Service
 from .serializers import ServiceSerializer
 
 
@@ -16,9 +18,11 @@ class IsAdmin(IsAuthenticated):
         return super().has_permission(request, view) and request.user.is_staff
 
 
-class ServiceViewSet(viewsets.ModelViewSet):
+class ServiceViewSet(CachedResponseMixin, ConditionalGetMixin, SparseFieldsetsViewMixin,
+                     viewsets.ModelViewSet):
     queryset = Service.objects.all()
     lookup_field = 'slug'
+    response_cache_models = (Service, RelatedService)
 
     def get_object(self):
         """Resolve object by slug first, then fall back to numeric PK if needed."""
@@ -40,8 +44,16 @@ class ServiceViewSet(viewsets.ModelViewSet):
                     pass
             raise NotFound(detail="Service not found")
 
+    # Detail payloads embed related services, which change without updated_at moving
+    trust_if_modified_since = False
+
+    def get_object_validator_parts(self, instance):
+        return get_generations([RelatedService._meta.label_lower])
+
     def get_queryset(self):
-        qs = Service.objects.all()
+        # search_vector is only read by the database; don't ship it to Python.
+        # created_by is joined for created_by_username.
+        qs = Service.objects.defer('search_vector').select_related('created_by')
         # Be robust when tests set a plain WSGIRequest or don't attach user
         user = getattr(self.request, 'user', None)
         if not user:
@@ -60,7 +72,7 @@ class ServiceViewSet(viewsets.ModelViewSet):
             qs = qs.filter(draft=False)
         return qs
     serializer_class = ServiceSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [FullTextSearchFilter, filters.OrderingFilter]
     search_fields = ['title', 'subtitle', 'description', 'slug']
     ordering_fields = ['title', 'created_at', 'price', 'duration', 'color']
     ordering = ['-is_featured', 'title']
@@ -185,11 +197,8 @@ class ServiceViewSet(viewsets.ModelViewSet):
         # Duplicate image file if present
         if instance.image:
             try:
-                instance.image.open('rb')
-                content = instance.image.read()
-                ext = os.path.splitext(instance.image.name)[1] or ".jpg"
-                filename = f"{uuid4().hex}{ext}"
-                copy.image.save(filename, ContentFile(content), save=False)
+                # Shares the stored file (a reference, not a copy)
+                copy.image = share_file(instance.image)
             except Exception:
                 pass
         copy.save()
@@ -1,8 +1,9 @@
 from django.db import models
 from django.core.validators import FileExtensionValidator
-import os
 from django.core.exceptions import ValidationError
 from django.conf import settings
+from api.sendfile import VERSION_LENGTH, file_digest
+from api.storage import content_digest
 
 
 class Terms(models.Model):
@@ -28,6 +29,8 @@ class Terms(models.Model):
         null=True,
         blank=True
     )
+    # SHA-256 of pdf_content, kept in step by save() for versioned download URLs
+    pdf_digest = models.CharField(max_length=64, blank=True, editable=False)
     version = models.CharField(max_length=20)
     tag = models.CharField(max_length=20, choices=TAG_CHOICES, default='terms')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -57,7 +60,9 @@ class Terms(models.Model):
         if self.pdf_content:
             if not self.pdf_content.name.endswith('.pdf'):
                 raise ValidationError("The PDF content file must be a .pdf file.")
-            if (hasattr(self.pdf_content.file, 'content_type') and
+            # Stored files (e.g. direct uploads) are not reopened just to check this
+            if (not self.pdf_content._committed and
+               hasattr(self.pdf_content.file, 'content_type') and
                self.pdf_content.file.content_type != "application/pdf"):
                 raise ValidationError("The uploaded PDF file must have a valid PDF content type.")
             if self.pdf_content.size > max_size:
@@ -65,25 +70,55 @@ class Terms(models.Model):
 
         super().clean()
 
+    def _refresh_pdf_digest(self, old_name):
+        if not self.pdf_content:
+            self.pdf_digest = ''
+        elif not self.pdf_content._committed:
+            # A new upload: hash it from memory before it is written
+            self.pdf_digest, _size = content_digest(self.pdf_content.file)
+        elif self.pdf_content.name != old_name or not self.pdf_digest:
+            # A stored file (e.g. a direct upload) the row did not point at yet
+            try:
+                self.pdf_digest = file_digest(self.pdf_content)
+            except OSError:
+                self.pdf_digest = ''
+
+    def pdf_version(self):
+        """Short content hash of the PDF, for versioned download URLs."""
+        if not self.pdf_content:
+            return None
+        if not self.pdf_digest:
+            # Saved before digests were stored: hash once and remember it
+            self.pdf_digest = file_digest(self.pdf_content)
+            Terms.objects.filter(pk=self.pk).update(pdf_digest=self.pdf_digest)
+        return self.pdf_digest[:VERSION_LENGTH]
+
     def save(self, *args, **kwargs):
+        old_name = None
         # Handle file replacement on update
         if self.pk:  # This is an update
             try:
                 old_instance = Terms.objects.get(pk=self.pk)
+                old_name = old_instance.pdf_content.name or None
                 # Delete old files if they're being replaced
                 if old_instance.pdf_content and old_instance.pdf_content != self.pdf_content:
-                    if os.path.isfile(old_instance.pdf_content.path):
-                        os.remove(old_instance.pdf_content.path)
+                    storage = old_instance.pdf_content.storage
+                    if storage.exists(old_instance.pdf_content.name):
+                        storage.delete(old_instance.pdf_content.name)
             except Terms.DoesNotExist:
                 pass  # This shouldn't happen, but handle gracefully
 
         self.clean()
+        self._refresh_pdf_digest(old_name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'pdf_content' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'pdf_digest'}
         super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
-        # Delete the files from filesystem when model is deleted
-        if self.pdf_content and os.path.isfile(self.pdf_content.path):
-            os.remove(self.pdf_content.path)
+        # Delete the file from storage when model is deleted
+        if self.pdf_content and self.pdf_content.storage.exists(self.pdf_content.name):
+            self.pdf_content.storage.delete(self.pdf_content.name)
         super().delete(*args, **kwargs)
 
     class Meta:
@@ -1,12 +1,16 @@
+from django.urls import reverse
 from rest_framework import serializers
+from api.uploads import DirectUploadSerializerMixin, UploadedObjectKeyField
 from .models import Terms
 
 
-class TermsSerializer(serializers.ModelSerializer):
+class TermsSerializer(DirectUploadSerializerMixin, serializers.ModelSerializer):
     tag_display = serializers.CharField(source='get_tag_display', read_only=True)
     name = serializers.CharField(required=False)
     pdf_content = serializers.FileField(required=False, allow_null=True)
+    pdf_key = UploadedObjectKeyField('terms_pdf')
     version = serializers.CharField(required=True)
+    download_url = serializers.SerializerMethodField()
 
     def validate_pdf_content(self, value):
         # Only require PDF on create, not on update
@@ -20,11 +24,25 @@ class TermsSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError("PDF file must be 1MB or less.")
         return value
 
+    def get_download_url(self, obj):
+        """Versioned, immutable download URL; changes whenever the PDF does"""
+        if not obj.pdf_content:
+            return None
+        try:
+            version = obj.pdf_version()
+        except OSError:  # missing from storage; the download would 404 anyway
+            return None
+        url = f"{reverse('terms-download', kwargs={'pk': obj.pk})}?v={version}"
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
     class Meta:
         model = Terms
-        fields = ['id', 'name', 'tag', 'tag_display', 'pdf_content',
+        fields = ['id', 'name', 'tag', 'tag_display', 'pdf_content', 'pdf_key', 'download_url',
                   'version', 'author', 'created_at', 'updated_at']
-        read_only_fields = ['created_at', 'updated_at', 'author']
+        read_only_fields = ['created_at', 'updated_at', 'author', 'download_url']
+        # Keys of direct uploads accepted in place of a file (see api.uploads)
+        direct_upload_fields = {'pdf_key': 'pdf_content'}
 
     def validate(self, data):
         # Require pdf_content on creation
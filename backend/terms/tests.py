@@ -4,8 +4,11 @@ from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
+import hashlib
 import os
+import shutil
 import tempfile
+from api.sendfile import parse_byte_range
 from .models import Terms
 from .serializers import TermsSerializer
 from django.urls import reverse
@@ -692,3 +695,95 @@ class TermsViewSetExtraTests(APITestCase):
                 self.assertEqual(response.status_code, 500)
                 self.assertIn('detail', response.data)
                 mock_logger.exception.assert_called()
+
+
+PDF_BYTES = b"%PDF-1.5\n%Cacheable PDF content"
+
+
+class TermsDownloadTests(APITestCase):
+    """Public, cacheable and range-aware PDF downloads"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.terms = Terms.objects.create(
+            name='Privacy',
+            pdf_content=SimpleUploadedFile("privacy.pdf", PDF_BYTES, content_type="application/pdf"),
+            version='3',
+            tag='privacy',
+        )
+        self.download_url = reverse('terms-download', kwargs={'pk': self.terms.pk})
+        self.digest = hashlib.sha256(PDF_BYTES).hexdigest()
+
+    def _body(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_versioned_url_is_immutable(self):
+        listed = self.client.get(reverse('terms-list')).data[0]['download_url']
+        self.assertTrue(listed.endswith(f"{self.download_url}?v={self.digest[:16]}"))
+
+        response = self.client.get(listed)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['ETag'], f'"{self.digest}"')
+        self.assertEqual(response['Content-Length'], str(len(PDF_BYTES)))
+        self.assertIn('Privacy_v3.pdf', response['Content-Disposition'])
+        self.assertEqual(self._body(response), PDF_BYTES)
+
+    def test_digest_is_stored_on_save_and_listing_reads_no_files(self):
+        self.assertEqual(self.terms.pdf_digest, self.digest)
+        with patch('api.sendfile.file_digest') as hashed, patch('terms.models.file_digest') as stored_hashed:
+            self.assertEqual(self.client.get(reverse('terms-list')).status_code, 200)
+        hashed.assert_not_called()
+        stored_hashed.assert_not_called()
+
+    def test_rows_without_a_digest_are_backfilled_once(self):
+        Terms.objects.filter(pk=self.terms.pk).update(pdf_digest='')
+        listed = self.client.get(reverse('terms-list')).data[0]['download_url']
+        self.assertTrue(listed.endswith(f"?v={self.digest[:16]}"))
+        self.assertEqual(Terms.objects.get(pk=self.terms.pk).pdf_digest, self.digest)
+
+    def test_unversioned_url_revalidates_with_the_etag(self):
+        response = self.client.get(self.download_url)
+        self.assertEqual(response['Cache-Control'], 'public, no-cache')
+
+        revalidated = self.client.get(self.download_url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated['ETag'], response['ETag'])
+
+    def test_range_requests_return_partial_content(self):
+        response = self.client.get(self.download_url, HTTP_RANGE='bytes=5-9')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 5-9/{len(PDF_BYTES)}')
+        self.assertEqual(self._body(response), PDF_BYTES[5:10])
+
+        suffix = self.client.get(self.download_url, HTTP_RANGE='bytes=-7')
+        self.assertEqual(self._body(suffix), PDF_BYTES[-7:])
+
+        beyond = self.client.get(self.download_url, HTTP_RANGE='bytes=999-')
+        self.assertEqual(beyond.status_code, 416)
+        self.assertEqual(beyond['Content-Range'], f'bytes */{len(PDF_BYTES)}')
+
+    def test_stale_if_range_sends_the_whole_file(self):
+        response = self.client.get(self.download_url, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE='"old"')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._body(response), PDF_BYTES)
+
+    def test_multiple_ranges_fall_back_to_the_whole_file(self):
+        self.assertIsNone(parse_byte_range('bytes=0-1,4-5', 10))
+        self.assertEqual(parse_byte_range('bytes=4-100', 10), (4, 9))
+
+    @override_settings(SENDFILE_BACKEND='x-accel-redirect', SENDFILE_URL_PREFIX='/protected-media/')
+    def test_front_proxy_serves_the_bytes(self):
+        response = self.client.get(self.download_url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.terms.pdf_content.name}')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], f'"{self.digest}"')
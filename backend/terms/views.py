@@ -3,8 +3,10 @@ from rest_framework.permissions import AllowAny, BasePermission
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from django.core.exceptions import ValidationError
-from django.http import FileResponse
-import os
+from django.http import HttpResponseRedirect
+from api.conditional import ConditionalGetMixin
+from api.response_cache import CachedResponseMixin
+from api.sendfile import serve_file
 from .models import Terms
 from .serializers import TermsSerializer
 import logging
@@ -21,14 +23,16 @@ class IsAdmin(BasePermission):
         return bool(request.user and request.user.is_authenticated and request.user.is_staff)
 
 
-class TermsViewSet(viewsets.ModelViewSet):
+class TermsViewSet(CachedResponseMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Terms.objects.all().order_by('-updated_at')
+    response_cache_models = (Terms,)
     serializer_class = TermsSerializer
     filter_backends = [filters.SearchFilter]
     search_fields = ['tag', 'name']
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        # Terms PDFs are public documents; downloads are cacheable by CDNs
+        if self.action in ['list', 'retrieve', 'download']:
             permission_classes = [AllowAny]
         else:
             permission_classes = [IsAdmin]
@@ -119,7 +123,11 @@ class TermsViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['get'])
     def download(self, request, pk=None):
-        """Download the PDF file associated with a term."""
+        """Download the PDF file associated with a term.
+
+        ``?v=`` set to the ``download_url`` version makes the response
+        immutable, so each uploaded PDF can be cached for good.
+        """
         try:
             term = self.get_object()
             if not term.pdf_content:
@@ -128,24 +136,25 @@ class TermsViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_404_NOT_FOUND
                 )
 
+            filename = f"{term.name}_v{term.version}.pdf"
+            storage = term.pdf_content.storage
+            if hasattr(storage, 'presigned_download_url'):
+                # Object storage serves the bytes; the worker only signs a URL
+                return HttpResponseRedirect(storage.presigned_download_url(
+                    term.pdf_content.name, filename=filename, content_type='application/pdf',
+                ))
+
             # Check if file exists
-            if not os.path.exists(term.pdf_content.path):
+            if not storage.exists(term.pdf_content.name):
                 return Response(
                     {"detail": "PDF file not found on server."},
                     status=status.HTTP_404_NOT_FOUND
                 )
 
-            # Open the file in binary mode
-            file_handle = open(term.pdf_content.path, 'rb')
-
-            # Create a FileResponse with the appropriate content type
-            response = FileResponse(file_handle, content_type='application/pdf')
-
-            # Set the Content-Disposition header to make the browser download the file
-            filename = f"{term.name}_v{term.version}.pdf"
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-
-            return response
+            return serve_file(
+                request, term.pdf_content, filename=filename, content_type='application/pdf',
+                version=request.query_params.get('v'), digest=term.pdf_digest or None,
+            )
 
         except Terms.DoesNotExist:
             return Response(
@@ -1,6 +1,17 @@
+import time
+
 from django.contrib.auth.backends import BaseBackend
 from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
 from django.db.models import Q
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from authentication.models import TokenLease
+from authentication.utils import token_is_expired, touch_token
+from .services.token_cache import get_token_cache
 
 User = get_user_model()
 
@@ -43,3 +54,82 @@ class EmailOrUsernameModelBackend(BaseBackend):
             return User.objects.get(pk=user_id)
         except User.DoesNotExist:
             return None
+
+
+def _model_snapshot(instance, exclude=()):
+    return {
+        field.attname: getattr(instance, field.attname)
+        for field in instance._meta.concrete_fields
+        if field.attname not in exclude
+    }
+
+
+def _restore_instance(model, values):
+    field_names = list(values)
+    return model.from_db(DEFAULT_DB_ALIAS, field_names, [values[name] for name in field_names])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that serves token -> user lookups from a short-lived cache.
+
+    Each request gets fresh model instances rebuilt from the cached field values,
+    so nothing is shared between requests. Deleting the token or saving/deleting
+    the user revokes cached entries in every worker (see users.signals and
+    users.services.token_cache).
+
+    Tokens expire according to their TokenLease; last use is written back at most
+    once per AUTH_TOKEN_TOUCH_INTERVAL_SECONDS, which also slides the expiry.
+    """
+
+    def _load_snapshot(self, key):
+        model = self.get_model()
+        try:
+            token = model.objects.select_related("user", "lease").get(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_("Invalid token."))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_("User inactive or deleted."))
+
+        try:
+            lease = token.lease
+        except TokenLease.DoesNotExist:
+            lease = None
+        return {
+            # The password hash stays out of caches; it is deferred on the restored user
+            "user": _model_snapshot(token.user, exclude=("password",)),
+            "token": _model_snapshot(token),
+            "lease": (
+                {"expires_at": lease.expires_at, "last_used_at": lease.last_used_at}
+                if lease is not None else None
+            ),
+        }
+
+    def authenticate_credentials(self, key):
+        cache = get_token_cache()
+        read_at = time.time()
+        snapshot = cache.get(key)
+        cached = snapshot is not None
+        if not cached:
+            snapshot = self._load_snapshot(key)
+
+        user = _restore_instance(User, snapshot["user"])
+        token = _restore_instance(self.get_model(), snapshot["token"])
+        token.user = user
+        lease = None
+        if snapshot["lease"] is not None:
+            lease = TokenLease(token_id=token.pk, **snapshot["lease"])
+
+        now = timezone.now()
+        if token_is_expired(token, lease, now=now):
+            cache.invalidate(key)
+            raise exceptions.AuthenticationFailed(_("Token has expired."))
+
+        expires_at, last_used_at = touch_token(token, lease, now=now)
+        if snapshot["lease"] != {"expires_at": expires_at, "last_used_at": last_used_at}:
+            snapshot["lease"] = {"expires_at": expires_at, "last_used_at": last_used_at}
+            cached = False
+        if not cached:
+            cache.set(key, snapshot, read_at=read_at)
+        return user, token
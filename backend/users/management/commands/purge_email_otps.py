@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from users.services.otp_service import purge_expired_otps
+
+
+class Command(BaseCommand):
+    help = "Delete expired or already used email verification codes."
+
+    def handle(self, *args, **options):
+        purged = purge_expired_otps()
+        self.stdout.write(
+            self.style.SUCCESS(f"email_otp_purge purged={purged}")
+        )
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 
+from api import metrics
 from users.services.notification_service import (
     enqueue_due_course_notifications,
     process_pending_email_jobs,
@@ -29,6 +30,9 @@ class Command(BaseCommand):
         if not options["skip_send"]:
             result = process_pending_email_jobs(limit=options["limit"])
 
+        # The worker exits after one pass; leave its counters for /metrics to merge
+        metrics.flush(final=True)
+
         self.stdout.write(
             self.style.SUCCESS(
                 "email_notification_queue reminders_enqueued={reminders} "
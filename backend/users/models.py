@@ -184,6 +184,15 @@ class EmailVerificationOTP(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "invalidated_at", "-created_at"],
+                name="email_otp_user_active_idx",
+            ),
+            models.Index(fields=["expires_at"], name="email_otp_expires_idx"),
+        ]
+
     def is_expired(self):
         return timezone.now() > self.expires_at
 
@@ -204,6 +213,9 @@ class EmailNotificationJob(models.Model):
         (STATUS_FAILED, "Failed"),
     ]
 
+    PRIORITY_HIGH = 0
+    PRIORITY_NORMAL = 50
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.SET_NULL,
@@ -221,6 +233,10 @@ class EmailNotificationJob(models.Model):
         db_index=True,
     )
     scheduled_for = models.DateTimeField(default=timezone.now, db_index=True)
+    priority = models.PositiveSmallIntegerField(
+        default=PRIORITY_NORMAL,
+        help_text="Lower values are sent first by the queue worker.",
+    )
     attempts = models.PositiveIntegerField(default=0)
     max_attempts = models.PositiveIntegerField(default=3)
     unique_key = models.CharField(
@@ -237,6 +253,12 @@ class EmailNotificationJob(models.Model):
 
     class Meta:
         ordering = ["scheduled_for", "id"]
+        indexes = [
+            models.Index(
+                fields=["status", "priority", "scheduled_for"],
+                name="email_job_queue_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.notification_type} -> {self.recipient_email} ({self.status})"
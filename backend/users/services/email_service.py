@@ -4,7 +4,10 @@ from datetime import datetime
 import requests
 from django.conf import settings
 
+from api.images import variant_url
+
 DEFAULT_FRONTEND_BASE_URL = "http://localhost:3000"
+EMAIL_HERO_IMAGE_WIDTH = 640
 
 
 class EmailServiceError(Exception):
@@ -746,7 +749,9 @@ def send_enrollment_confirmation_email(email: str, user_name: str, course):
         # Build cover image tag if the course has an image
         hero_html = ""
         if course.image:
-            image_url = f"{backend_url}{course.image.url}"
+            # A 640px JPEG variant when available: mail clients lack WebP/AVIF support
+            image_path = variant_url(course.image, getattr(course, "image_variants", None), EMAIL_HERO_IMAGE_WIDTH)
+            image_url = f"{backend_url}{image_path}"
             hero_html = f'<tr><td><img src="{image_url}" alt="{course.title}" width="640" style="width:100%;height:auto;" /></td></tr>'
 
         # Format dates and times
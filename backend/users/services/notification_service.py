@@ -1,17 +1,22 @@
+import hashlib
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
 from datetime import datetime, time, timedelta, timezone as dt_timezone
 from typing import Optional
 from zoneinfo import ZoneInfo
 
 from django.conf import settings
-from django.db import IntegrityError
+from django.db import IntegrityError, connections, transaction
 from django.utils import timezone
 
+from api import metrics
 from users.models import CustomUser, EmailNotificationJob
 
 
 logger = logging.getLogger(__name__)
 
+NOTIFICATION_EMAIL_VERIFICATION = "email_verification"
 NOTIFICATION_ACCOUNT_CREATED = "account_created"
 NOTIFICATION_EMAIL_UPDATED = "email_updated"
 NOTIFICATION_PASSWORD_RESET_COMPLETED = "password_reset_completed"
@@ -22,6 +27,7 @@ NOTIFICATION_COURSE_STARTS_SOON = "course_starts_soon"
 NOTIFICATION_COURSE_REMINDER_24H = "course_reminder_24h"
 
 COMPULSORY_NOTIFICATION_TYPES = {
+    NOTIFICATION_EMAIL_VERIFICATION,
     NOTIFICATION_ACCOUNT_CREATED,
     NOTIFICATION_EMAIL_UPDATED,
     NOTIFICATION_PASSWORD_RESET_COMPLETED,
@@ -58,6 +64,7 @@ def queue_email_notification(
     scheduled_for=None,
     unique_key: Optional[str] = None,
     force: bool = False,
+    priority: int = EmailNotificationJob.PRIORITY_NORMAL,
     **payload,
 ):
     if not force and not user_allows_notification(user, notification_type):
@@ -73,6 +80,7 @@ def queue_email_notification(
         "recipient_email": recipient_email,
         "payload": payload,
         "scheduled_for": scheduled_for or timezone.now(),
+        "priority": priority,
     }
 
     if unique_key:
@@ -85,6 +93,62 @@ def queue_email_notification(
     return EmailNotificationJob.objects.create(**job_data)
 
 
+def _verification_unique_key(user, recipient_email, now, previous_job=None):
+    cooldown = max(int(settings.EMAIL_OTP_RESEND_COOLDOWN_SECONDS), 1)
+    window = int(now.timestamp()) // cooldown
+    email_digest = hashlib.sha256(recipient_email.strip().lower().encode()).hexdigest()[:16]
+    previous = previous_job.pk if previous_job else 0
+    return f"email-verification:{user.pk}:{email_digest}:{window}:{previous}"
+
+
+def queue_verification_email(user, email: Optional[str] = None, *, now=None):
+    """Queue a verification code email for ``user``.
+
+    The code itself is generated when the job is sent, so nothing secret is
+    stored in the job payload. A request inside the resend cooldown reuses
+    the user's latest verification job when it targets the same address and
+    has not failed. Any other job in between (e.g. for an address the user
+    switched to and back from) replaces the code, so a new job is queued;
+    its idempotency key names that predecessor, which still coalesces
+    concurrent requests.
+    """
+    recipient_email = (email or getattr(user, "email", None) or "").strip()
+    if not recipient_email:
+        return None
+
+    now = now or timezone.now()
+    cooldown_start = now - timedelta(seconds=settings.EMAIL_OTP_RESEND_COOLDOWN_SECONDS)
+    latest_job = (
+        EmailNotificationJob.objects.filter(
+            user=user,
+            notification_type=NOTIFICATION_EMAIL_VERIFICATION,
+            created_at__gte=cooldown_start,
+        )
+        .order_by("-created_at", "-pk")
+        .first()
+    )
+    if (
+        latest_job
+        and latest_job.status != EmailNotificationJob.STATUS_FAILED
+        and latest_job.recipient_email.lower() == recipient_email.lower()
+    ):
+        return latest_job
+
+    return queue_email_notification(
+        user,
+        NOTIFICATION_EMAIL_VERIFICATION,
+        unique_key=_verification_unique_key(user, recipient_email, now, latest_job),
+        priority=EmailNotificationJob.PRIORITY_HIGH,
+        recipient_email=recipient_email,
+    )
+
+
+def queue_and_dispatch_verification_email(user, email: Optional[str] = None):
+    job = queue_verification_email(user, email)
+    dispatch_email_job_on_commit(job)
+    return job
+
+
 def queue_account_created_notification(user):
     return queue_email_notification(
         user,
@@ -279,6 +343,24 @@ def enqueue_due_course_reminders(*, now=None, lookahead_minutes: int = 1):
     )
 
 
+def _send_verification_job(job: EmailNotificationJob):
+    from users.services.email_service import send_verification_email
+    from users.services.otp_service import create_otp_for_user
+
+    user = job.user
+    if not user:
+        return
+
+    recipient = job.recipient_email.strip().lower()
+    is_pending_email = bool(user.pending_email and user.pending_email.strip().lower() == recipient)
+    if user.email_verified_at and not is_pending_email:
+        # Nothing left to verify for this address.
+        return
+
+    code, _ = create_otp_for_user(user)
+    send_verification_email(job.recipient_email, code)
+
+
 def _send_job(job: EmailNotificationJob):
     from courses.models import Course
     from users.services.email_service import (
@@ -294,6 +376,10 @@ def _send_job(job: EmailNotificationJob):
 
     payload = job.payload or {}
 
+    if job.notification_type == NOTIFICATION_EMAIL_VERIFICATION:
+        _send_verification_job(job)
+        return
+
     if job.notification_type == NOTIFICATION_ACCOUNT_CREATED:
         send_welcome_email(job.recipient_email, payload.get("user_name", ""))
         return
@@ -354,6 +440,27 @@ def _send_job(job: EmailNotificationJob):
     raise ValueError(f"Unsupported notification type: {job.notification_type}")
 
 
+def _send_job_timed(job: EmailNotificationJob):
+    metrics.email_job_age.observe(
+        (timezone.now() - job.created_at).total_seconds(), notification_type=job.notification_type,
+    )
+    started = perf_counter()
+    try:
+        _send_job(job)
+    except Exception:
+        outcome = "retried" if job.attempts + 1 < job.max_attempts else "failed"
+        _record_send(job, outcome, started)
+        raise
+    _record_send(job, "sent", started)
+
+
+def _record_send(job: EmailNotificationJob, outcome: str, started: float):
+    metrics.email_send_duration.observe(
+        perf_counter() - started, notification_type=job.notification_type, outcome=outcome,
+    )
+    metrics.email_jobs.inc(notification_type=job.notification_type, outcome=outcome)
+
+
 def dispatch_email_job_now(job: Optional[EmailNotificationJob]) -> bool:
     if not job:
         return False
@@ -372,7 +479,7 @@ def dispatch_email_job_now(job: Optional[EmailNotificationJob]) -> bool:
     job.refresh_from_db()
 
     try:
-        _send_job(job)
+        _send_job_timed(job)
     except Exception as exc:
         attempts = job.attempts + 1
         update_fields = {
@@ -397,6 +504,53 @@ def dispatch_email_job_now(job: Optional[EmailNotificationJob]) -> bool:
     return True
 
 
+_dispatch_executor = None
+
+
+def _get_dispatch_executor():
+    global _dispatch_executor
+    if _dispatch_executor is None:
+        _dispatch_executor = ThreadPoolExecutor(
+            max_workers=settings.EMAIL_DISPATCH_WORKERS,
+            thread_name_prefix="email-dispatch",
+        )
+    return _dispatch_executor
+
+
+def _dispatch_job_by_pk(job_pk):
+    try:
+        job = EmailNotificationJob.objects.filter(pk=job_pk).first()
+        dispatch_email_job_now(job)
+    except Exception:
+        # Failed jobs stay pending and are retried by run_email_notification_queue.
+        logger.exception("Failed to dispatch email notification job %s", job_pk)
+
+
+def _dispatch_job_in_background(job_pk):
+    try:
+        _dispatch_job_by_pk(job_pk)
+    finally:
+        connections.close_all()
+
+
+def dispatch_email_job_on_commit(job: Optional[EmailNotificationJob]):
+    """Send ``job`` once the surrounding transaction commits.
+
+    With EMAIL_DISPATCH_ASYNC enabled the send runs on a small thread pool so
+    the request does not wait on the email provider.
+    """
+    if not job:
+        return
+
+    job_pk = job.pk
+    if settings.EMAIL_DISPATCH_ASYNC:
+        transaction.on_commit(
+            lambda: _get_dispatch_executor().submit(_dispatch_job_in_background, job_pk)
+        )
+    else:
+        transaction.on_commit(lambda: _dispatch_job_by_pk(job_pk))
+
+
 def process_pending_email_jobs(*, limit: int = 100, now=None):
     now = now or timezone.now()
     processed = 0
@@ -406,7 +560,7 @@ def process_pending_email_jobs(*, limit: int = 100, now=None):
     candidates = EmailNotificationJob.objects.filter(
         status=EmailNotificationJob.STATUS_PENDING,
         scheduled_for__lte=now,
-    ).order_by("scheduled_for", "id")[:limit]
+    ).order_by("priority", "scheduled_for", "id")[:limit]
 
     for job in candidates:
         claimed = EmailNotificationJob.objects.filter(
@@ -419,7 +573,7 @@ def process_pending_email_jobs(*, limit: int = 100, now=None):
         job.refresh_from_db()
         processed += 1
         try:
-            _send_job(job)
+            _send_job_timed(job)
             job.attempts += 1
             job.status = EmailNotificationJob.STATUS_SENT
             job.sent_at = timezone.now()
@@ -1,10 +1,20 @@
 import hashlib
+import hmac
 import secrets
-from django.utils import timezone
-from datetime import timedelta
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
 from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
 from ..models import EmailVerificationOTP
 
+DEFAULT_OTP_BACKEND = "users.services.otp_service.DatabaseOTPBackend"
+
 
 def generate_otp_code():
     return f"{secrets.randbelow(1_000_000):06d}"
@@ -14,47 +24,248 @@ def hash_code(code: str):
     return hashlib.sha256(code.encode()).hexdigest()
 
 
-def create_otp_for_user(user):
-    # invalidate previous
-    EmailVerificationOTP.objects.filter(user=user, invalidated_at__isnull=True).update(
-        invalidated_at=timezone.now()
-    )
+def _otp_ttl():
+    return timedelta(minutes=settings.EMAIL_OTP_TTL_MINUTES)
 
-    code = generate_otp_code()
-    code_hash = hash_code(code)
 
-    otp = EmailVerificationOTP.objects.create(
-        user=user,
-        code_hash=code_hash,
-        expires_at=timezone.now() + timedelta(minutes=settings.EMAIL_OTP_TTL_MINUTES),
-        resend_count=0,
-        attempts=0,
-        last_sent_at=timezone.now()
-    )
+class BaseOTPBackend:
+    """Storage interface for email verification codes.
+
+    Backends return ``(success, reason)`` from ``validate`` using the reasons
+    the verification serializer understands: ``OK``, ``NO_OTP``, ``EXPIRED``,
+    ``TOO_MANY_ATTEMPTS`` and ``INVALID``.
+    """
+
+    def create(self, user, code_hash):
+        raise NotImplementedError
+
+    def validate(self, user, code):
+        raise NotImplementedError
+
+    def get_active(self, user):
+        """Return the current code for ``user`` (exposing ``last_sent_at``) or None."""
+        raise NotImplementedError
+
+    def invalidate(self, user):
+        raise NotImplementedError
+
+    def purge_expired(self):
+        """Delete stored codes that can no longer be used. Returns the number removed."""
+        return 0
+
+
+class DatabaseOTPBackend(BaseOTPBackend):
+    """Keeps codes in the ``EmailVerificationOTP`` table."""
+
+    def _active_queryset(self, user):
+        return EmailVerificationOTP.objects.filter(user=user, invalidated_at__isnull=True)
+
+    def create(self, user, code_hash):
+        self.invalidate(user)
+        now = timezone.now()
+        return EmailVerificationOTP.objects.create(
+            user=user,
+            code_hash=code_hash,
+            expires_at=now + _otp_ttl(),
+            resend_count=0,
+            attempts=0,
+            last_sent_at=now,
+        )
+
+    def get_active(self, user):
+        return self._active_queryset(user).order_by("-created_at").first()
+
+    def invalidate(self, user):
+        self._active_queryset(user).update(invalidated_at=timezone.now())
+
+    def validate(self, user, code):
+        otp = self.get_active(user)
+
+        if not otp:
+            return False, "NO_OTP"
+
+        if otp.is_expired():
+            return False, "EXPIRED"
+
+        if otp.attempts >= settings.EMAIL_OTP_MAX_ATTEMPTS:
+            return False, "TOO_MANY_ATTEMPTS"
+
+        if not hmac.compare_digest(hash_code(code), otp.code_hash):
+            # Conditional UPDATE, so parallel wrong guesses cannot overshoot the limit
+            counted = EmailVerificationOTP.objects.filter(
+                pk=otp.pk, attempts__lt=settings.EMAIL_OTP_MAX_ATTEMPTS,
+            ).update(attempts=F("attempts") + 1)
+            return False, "INVALID" if counted else "TOO_MANY_ATTEMPTS"
+
+        otp.invalidated_at = timezone.now()
+        otp.save(update_fields=["invalidated_at"])
+        return True, "OK"
+
+    def purge_expired(self):
+        deleted, _ = EmailVerificationOTP.objects.filter(
+            expires_at__lt=timezone.now()
+        ).delete()
+        invalidated, _ = EmailVerificationOTP.objects.filter(
+            invalidated_at__isnull=False
+        ).delete()
+        return deleted + invalidated
+
+
+@dataclass
+class CachedOTP:
+    """In-cache counterpart of ``EmailVerificationOTP``."""
+
+    user_id: int
+    code_hash: str
+    expires_at: datetime
+    last_sent_at: datetime
+    attempts: int = 0
+    invalidated_at: Optional[datetime] = None
+
+    def is_expired(self):
+        return timezone.now() > self.expires_at
 
+    def is_invalidated(self):
+        return self.invalidated_at is not None
+
+
+class CacheOTPBackend(BaseOTPBackend):
+    """Keeps codes in a Django cache so verification traffic never touches the DB.
+
+    Each user has one code entry and one attempt counter. Both expire with the
+    code TTL, plus a short grace period so late submissions still get
+    ``EXPIRED`` rather than ``NO_OTP``. Every submission is counted with
+    ``cache.incr``, which is atomic on Redis and memcached, before the code is
+    compared, so parallel guesses cannot exceed ``EMAIL_OTP_MAX_ATTEMPTS``.
+    """
+
+    key_prefix = "email-otp"
+    expired_grace_seconds = 300
+
+    def __init__(self, alias=None):
+        self.alias = alias or getattr(settings, "EMAIL_OTP_CACHE_ALIAS", "shared")
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _code_key(self, user):
+        return f"{self.key_prefix}:{user.pk}"
+
+    def _attempts_key(self, user):
+        return f"{self.key_prefix}:{user.pk}:attempts"
+
+    def _timeout(self):
+        return int(_otp_ttl().total_seconds()) + self.expired_grace_seconds
+
+    def create(self, user, code_hash):
+        now = timezone.now()
+        otp = CachedOTP(
+            user_id=user.pk,
+            code_hash=code_hash,
+            expires_at=now + _otp_ttl(),
+            last_sent_at=now,
+        )
+        timeout = self._timeout()
+        self.cache.set_many(
+            {
+                self._code_key(user): {
+                    "code_hash": otp.code_hash,
+                    "expires_at": otp.expires_at,
+                    "last_sent_at": otp.last_sent_at,
+                },
+                self._attempts_key(user): 0,
+            },
+            timeout=timeout,
+        )
+        return otp
+
+    def _load(self, user):
+        code_key = self._code_key(user)
+        attempts_key = self._attempts_key(user)
+        values = self.cache.get_many([code_key, attempts_key])
+        entry = values.get(code_key)
+        if not entry:
+            return None
+        return CachedOTP(
+            user_id=user.pk,
+            code_hash=entry["code_hash"],
+            expires_at=entry["expires_at"],
+            last_sent_at=entry["last_sent_at"],
+            attempts=int(values.get(attempts_key) or 0),
+        )
+
+    def get_active(self, user):
+        return self._load(user)
+
+    def invalidate(self, user):
+        self.cache.delete_many([self._code_key(user), self._attempts_key(user)])
+
+    def _count_attempt(self, user):
+        """Count one submission and return the new total."""
+        key = self._attempts_key(user)
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # Counter evicted independently of the code entry; restart it,
+            # unless a parallel submission just did.
+            if self.cache.add(key, 1, timeout=self._timeout()):
+                return 1
+            return self.cache.incr(key)
+
+    def validate(self, user, code):
+        otp = self._load(user)
+
+        if not otp:
+            return False, "NO_OTP"
+
+        if otp.is_expired():
+            return False, "EXPIRED"
+
+        if self._count_attempt(user) > settings.EMAIL_OTP_MAX_ATTEMPTS:
+            return False, "TOO_MANY_ATTEMPTS"
+
+        if not hmac.compare_digest(hash_code(code), otp.code_hash):
+            return False, "INVALID"
+
+        self.invalidate(user)
+        return True, "OK"
+
+    def purge_expired(self):
+        # Cached codes expire on their own; this clears rows left in the table
+        # from before the switch to this backend.
+        return DatabaseOTPBackend().purge_expired()
+
+
+_backend_cache = {}
+
+
+def get_otp_backend():
+    path = getattr(settings, "EMAIL_OTP_BACKEND", DEFAULT_OTP_BACKEND)
+    backend = _backend_cache.get(path)
+    if backend is None:
+        backend = import_string(path)()
+        _backend_cache[path] = backend
+    return backend
+
+
+def create_otp_for_user(user):
+    code = generate_otp_code()
+    otp = get_otp_backend().create(user, hash_code(code))
     return code, otp
 
 
 def validate_otp(user, code):
-    otp = EmailVerificationOTP.objects.filter(
-        user=user,
-        invalidated_at__isnull=True
-    ).order_by("-created_at").first()
+    return get_otp_backend().validate(user, code)
+
 
-    if not otp:
-        return False, "NO_OTP"
+def get_active_otp(user):
+    return get_otp_backend().get_active(user)
 
-    if otp.is_expired():
-        return False, "EXPIRED"
 
-    if otp.attempts >= settings.EMAIL_OTP_MAX_ATTEMPTS:
-        return False, "TOO_MANY_ATTEMPTS"
+def invalidate_otps_for_user(user):
+    get_otp_backend().invalidate(user)
 
-    if hash_code(code) != otp.code_hash:
-        otp.attempts += 1
-        otp.save()
-        return False, "INVALID"
 
-    otp.invalidated_at = timezone.now()
-    otp.save()
-    return True, "OK"
+def purge_expired_otps():
+    return get_otp_backend().purge_expired()
@@ -0,0 +1,192 @@
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from api.cache import LocalLRUCache
+
+logger = logging.getLogger(__name__)
+
+SHARED_KEY_PREFIX = "auth-token:v2"
+REVOKED_KEY_PREFIX = "auth-token:revoked"
+
+
+class TokenSnapshotCache:
+    """Caches token -> user snapshots for ``CachedTokenAuthentication``.
+
+    Entries live in a per-process LRU and, when AUTH_TOKEN_SHARED_CACHE_ALIAS is
+    set, in a shared Django cache as well. Each entry records when it was
+    cached.
+
+    Invalidating a token or a user writes a tombstone with the current time to
+    AUTH_TOKEN_INVALIDATION_CACHE_ALIAS, which every worker reads. A hit is
+    only served if neither its token nor its user has a tombstone newer than
+    the entry, so signing out, deleting or deactivating takes effect in every
+    process at once. Checking costs one ``get_many`` per hit, still far cheaper
+    than the token/user/lease query it saves.
+    """
+
+    def __init__(self):
+        self.local = LocalLRUCache(
+            maxsize=settings.AUTH_TOKEN_CACHE_SIZE,
+            ttl=settings.AUTH_TOKEN_CACHE_TTL_SECONDS,
+        )
+        self._stats_lock = threading.Lock()
+        self._stats = {"local_hits": 0, "shared_hits": 0, "misses": 0, "invalidations": 0}
+
+    @staticmethod
+    def _digest(token_key):
+        return hashlib.sha256(token_key.encode()).hexdigest()
+
+    @property
+    def shared(self):
+        alias = settings.AUTH_TOKEN_SHARED_CACHE_ALIAS
+        return caches[alias] if alias else None
+
+    @property
+    def tombstones(self):
+        return caches[settings.AUTH_TOKEN_INVALIDATION_CACHE_ALIAS]
+
+    def _shared_key(self, digest):
+        return f"{SHARED_KEY_PREFIX}:{digest}"
+
+    @staticmethod
+    def _token_tombstone_key(digest):
+        return f"{REVOKED_KEY_PREFIX}:token:{digest}"
+
+    @staticmethod
+    def _user_tombstone_key(user_id):
+        return f"{REVOKED_KEY_PREFIX}:user:{user_id}"
+
+    def _tombstone_timeout(self):
+        # Outlive every copy that could still be served
+        ttl = settings.AUTH_TOKEN_CACHE_TTL_SECONDS
+        if self.shared is not None:
+            ttl = max(ttl, settings.AUTH_TOKEN_SHARED_CACHE_TTL_SECONDS)
+        return ttl + 1
+
+    def _is_current(self, digest, entry):
+        if not isinstance(entry, dict) or "cached_at" not in entry:
+            return False
+        keys = [self._token_tombstone_key(digest), self._user_tombstone_key(entry["snapshot"]["user"]["id"])]
+        try:
+            revoked = self.tombstones.get_many(keys)
+        except Exception:
+            logger.warning("Token invalidation lookup failed", exc_info=True)
+            return False
+        return all(revoked_at < entry["cached_at"] for revoked_at in revoked.values())
+
+    def _revoke(self, key):
+        try:
+            self.tombstones.set(key, time.time(), timeout=self._tombstone_timeout())
+        except Exception:
+            logger.warning("Token invalidation write failed", exc_info=True)
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def get(self, token_key):
+        digest = self._digest(token_key)
+        entry = self.local.get(digest)
+        if entry is not None:
+            if self._is_current(digest, entry):
+                self._count("local_hits")
+                return entry["snapshot"]
+            self.local.delete(digest)
+
+        shared = self.shared
+        if shared is not None:
+            try:
+                entry = shared.get(self._shared_key(digest))
+            except Exception:
+                logger.warning("Shared token cache lookup failed", exc_info=True)
+                entry = None
+            if entry is not None and self._is_current(digest, entry):
+                self.local.set(digest, entry)
+                self._count("shared_hits")
+                return entry["snapshot"]
+
+        self._count("misses")
+        return None
+
+    def set(self, token_key, snapshot, read_at=None):
+        """Cache ``snapshot``; ``read_at`` is when its data was read, so a
+        revocation that lands while the caller is still working wins."""
+        digest = self._digest(token_key)
+        entry = {"cached_at": time.time() if read_at is None else read_at, "snapshot": snapshot}
+        self.local.set(digest, entry)
+        shared = self.shared
+        if shared is not None:
+            try:
+                shared.set(
+                    self._shared_key(digest),
+                    entry,
+                    timeout=settings.AUTH_TOKEN_SHARED_CACHE_TTL_SECONDS,
+                )
+            except Exception:
+                logger.warning("Shared token cache write failed", exc_info=True)
+
+    def invalidate(self, token_key):
+        digest = self._digest(token_key)
+        self.local.delete(digest)
+        shared = self.shared
+        if shared is not None:
+            try:
+                shared.delete(self._shared_key(digest))
+            except Exception:
+                logger.warning("Shared token cache delete failed", exc_info=True)
+        self._revoke(self._token_tombstone_key(digest))
+        self._count("invalidations")
+
+    def invalidate_user(self, user_id):
+        """Stop serving any cached token of ``user_id``, in every process."""
+        self._revoke(self._user_tombstone_key(user_id))
+        self._count("invalidations")
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["local_hits"] + stats["shared_hits"] + stats["misses"]
+        stats["size"] = len(self.local)
+        stats["hit_ratio"] = (
+            (stats["local_hits"] + stats["shared_hits"]) / lookups if lookups else 0.0
+        )
+        return stats
+
+    def reset_stats(self):
+        with self._stats_lock:
+            for name in self._stats:
+                self._stats[name] = 0
+
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache():
+    global _token_cache
+    if _token_cache is None:
+        with _token_cache_lock:
+            if _token_cache is None:
+                _token_cache = TokenSnapshotCache()
+    return _token_cache
+
+
+def invalidate_token(token_key):
+    if token_key:
+        get_token_cache().invalidate(token_key)
+
+
+def invalidate_user_tokens(user_id):
+    get_token_cache().invalidate_user(user_id)
+
+
+def token_cache_stats():
+    return get_token_cache().stats()
@@ -1,9 +1,11 @@
 import requests
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
 from .models import CustomUser
 from .models import CustomUser, NewsletterSubscriber
+from .services.token_cache import invalidate_token, invalidate_user_tokens
 
 BILLIONMAIL_API_KEY = settings.BILLIONMAIL_API_KEY
 BILLIONMAIL_GROUP_ID_NEWSLETTER = settings.BILLIONMAIL_GROUP_ID_NEWSLETTER 
@@ -40,3 +42,14 @@ def sync_billionmail_subscription(sender, instance, **kwargs):
             pass
 
 
+@receiver(post_save, sender=CustomUser)
+def invalidate_cached_user_tokens(sender, instance, created, **kwargs):
+    # Password, is_active and profile changes must not be served from a stale snapshot
+    if not created:
+        invalidate_user_tokens(instance.pk)
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    invalidate_token(instance.key)
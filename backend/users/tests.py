@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.test import TestCase, override_settings
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError
@@ -9,6 +10,7 @@ from rest_framework import status
 from rest_framework.authtoken.models import Token
 from .models import CustomUser
 from .authentication import EmailOrUsernameModelBackend
+from api.testing import QueryBudgetMixin, reset_caches
 import os
 
 
@@ -443,6 +445,7 @@ class UserViewSetTests(APITestCase):
     """Tests for the UserViewSet"""
 
     def setUp(self):
+        reset_caches()
         self.client = APIClient()
         self.signup_url = '/api/users/signup/'
         self.signin_url = '/api/users/signin/'
@@ -743,9 +746,8 @@ class UserViewSetTests(APITestCase):
         self.assertEqual(response.data['name'], 'Updated')
         self.assertEqual(response.data['surname'], 'User')
 
-    @patch('users.views.send_verification_email')
-    @patch('users.views.create_otp_for_user', return_value=('123456', Mock()))
-    def test_update_profile_verified_email_requires_confirmation(self, mock_otp, mock_email):
+    @patch('users.views.queue_and_dispatch_verification_email')
+    def test_update_profile_verified_email_requires_confirmation(self, mock_queue):
         """Verified users must confirm a new email before the change is applied."""
         self.user.email_verified_at = timezone.now()
         self.user.status = 'active'
@@ -767,7 +769,7 @@ class UserViewSetTests(APITestCase):
         self.assertEqual(self.user.email, 'existing@example.com')
         self.assertEqual(self.user.pending_email, 'verified-change@example.com')
         self.assertEqual(self.user.name, 'Verified')
-        mock_email.assert_called_once_with('verified-change@example.com', '123456')
+        mock_queue.assert_called_once_with(self.user, 'verified-change@example.com')
 
     def test_update_profile_invalid(self):
         """Test updating profile with invalid data"""
@@ -897,6 +899,111 @@ class OTPServiceTests(TestCase):
         otp.refresh_from_db()
         self.assertIsNotNone(otp.invalidated_at)
 
+    def test_purge_expired_otps_removes_used_and_expired_rows(self):
+        from users.services.otp_service import create_otp_for_user, purge_expired_otps
+        from users.models import EmailVerificationOTP
+        from datetime import timedelta
+        _, expired = create_otp_for_user(self.user)
+        expired.expires_at = timezone.now() - timedelta(minutes=1)
+        expired.save()
+        create_otp_for_user(self.user)
+        _, active = create_otp_for_user(self.user)
+        active.expires_at = timezone.now() + timedelta(minutes=5)
+        active.save()
+        self.assertEqual(purge_expired_otps(), 2)
+        self.assertEqual(list(EmailVerificationOTP.objects.all()), [active])
+
+
+@override_settings(EMAIL_OTP_BACKEND="users.services.otp_service.CacheOTPBackend")
+class CacheOTPBackendTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.user = CustomUser.objects.create_user(
+            email='cache-otp@example.com',
+            username='cache_otp_user',
+            password=TEST_PASSWORD,
+            name='Cache',
+            surname='OTP',
+            company='Test',
+        )
+
+    def test_create_does_not_write_rows(self):
+        from users.services.otp_service import create_otp_for_user, get_active_otp
+        from users.models import EmailVerificationOTP
+        code, otp = create_otp_for_user(self.user)
+        self.assertEqual(len(code), 6)
+        self.assertIsNotNone(otp.last_sent_at)
+        self.assertEqual(get_active_otp(self.user).code_hash, otp.code_hash)
+        self.assertFalse(EmailVerificationOTP.objects.exists())
+
+    def test_validate_success_consumes_code(self):
+        from users.services.otp_service import create_otp_for_user, validate_otp
+        code, _ = create_otp_for_user(self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(validate_otp(self.user, code), (True, "OK"))
+        self.assertEqual(validate_otp(self.user, code), (False, "NO_OTP"))
+
+    def test_new_code_replaces_previous(self):
+        from users.services.otp_service import create_otp_for_user, validate_otp
+        first, _ = create_otp_for_user(self.user)
+        second, _ = create_otp_for_user(self.user)
+        if first != second:
+            self.assertEqual(validate_otp(self.user, first), (False, "INVALID"))
+        self.assertEqual(validate_otp(self.user, second), (True, "OK"))
+
+    @override_settings(EMAIL_OTP_MAX_ATTEMPTS=2)
+    def test_failed_attempts_are_counted(self):
+        from users.services.otp_service import create_otp_for_user, get_active_otp, validate_otp
+        code, _ = create_otp_for_user(self.user)
+        wrong = "000000" if code != "000000" else "111111"
+        self.assertEqual(validate_otp(self.user, wrong), (False, "INVALID"))
+        self.assertEqual(validate_otp(self.user, wrong), (False, "INVALID"))
+        self.assertEqual(get_active_otp(self.user).attempts, 2)
+        self.assertEqual(validate_otp(self.user, code), (False, "TOO_MANY_ATTEMPTS"))
+
+    @override_settings(EMAIL_OTP_MAX_ATTEMPTS=2)
+    def test_attempt_limit_holds_for_parallel_guesses(self):
+        from users.services.otp_service import CacheOTPBackend, create_otp_for_user, validate_otp
+        code, otp = create_otp_for_user(self.user)
+        wrong = "000000" if code != "000000" else "111111"
+        # Every request read the code before any of them counted its guess
+        with patch.object(CacheOTPBackend, '_load', return_value=otp):
+            results = [validate_otp(self.user, wrong) for _ in range(3)]
+            self.assertEqual(validate_otp(self.user, code), (False, "TOO_MANY_ATTEMPTS"))
+        self.assertEqual(results, [(False, "INVALID"), (False, "INVALID"), (False, "TOO_MANY_ATTEMPTS")])
+
+    def test_purge_removes_rows_left_by_the_database_backend(self):
+        from users.services.otp_service import purge_expired_otps
+        from users.models import EmailVerificationOTP
+        from datetime import timedelta
+        EmailVerificationOTP.objects.create(
+            user=self.user, code_hash='x', expires_at=timezone.now() - timedelta(minutes=1),
+            last_sent_at=timezone.now(),
+        )
+        self.assertEqual(purge_expired_otps(), 1)
+        self.assertFalse(EmailVerificationOTP.objects.exists())
+
+    def test_expired_code_reports_expired(self):
+        from users.services.otp_service import create_otp_for_user, validate_otp
+        from datetime import timedelta
+        code, _ = create_otp_for_user(self.user)
+        with patch(
+            'users.services.otp_service.timezone.now',
+            return_value=timezone.now() + timedelta(minutes=16),
+        ):
+            self.assertEqual(validate_otp(self.user, code), (False, "EXPIRED"))
+
+    def test_invalidate_removes_code(self):
+        from users.services.otp_service import (
+            create_otp_for_user,
+            get_active_otp,
+            invalidate_otps_for_user,
+        )
+        create_otp_for_user(self.user)
+        invalidate_otps_for_user(self.user)
+        self.assertIsNone(get_active_otp(self.user))
+
+
 class EmailServiceTests(TestCase):
     @patch('users.services.email_service.requests.post')
     def test_send_email_success(self, mock_post):
@@ -993,6 +1100,7 @@ class EmailServiceTests(TestCase):
 
 class UserViewSetExtraCoverageTests(APITestCase):
     def setUp(self):
+        reset_caches()
         self.client = APIClient()
         self.signup_url = '/api/users/signup/'
         self.user = CustomUser.objects.create_user(
@@ -1005,9 +1113,8 @@ class UserViewSetExtraCoverageTests(APITestCase):
         )
         self.token = Token.objects.create(user=self.user)
 
-    @patch('users.views.send_verification_email', side_effect=Exception("SMTP fail"))
-    @patch('users.views.create_otp_for_user', return_value=("123456", Mock()))
-    def test_signup_email_failure_still_creates_user(self, mock_otp, mock_email):
+    @patch('users.views.queue_and_dispatch_verification_email', side_effect=Exception("queue fail"))
+    def test_signup_email_failure_still_creates_user(self, mock_queue):
         response = self.client.post(self.signup_url, {
             'email': 'emailfail@example.com',
             'username': 'emailfail_user',
@@ -1221,6 +1328,28 @@ class EmailNotificationPreferenceTests(TestCase):
         self.assertEqual(result["sent"], 1)
         self.assertEqual(mock_send.call_count, 1)
 
+    @patch("users.services.email_service._send_email")
+    def test_queue_records_send_metrics(self, mock_send):
+        from api import metrics
+        from users.services.notification_service import (
+            process_pending_email_jobs,
+            queue_account_created_notification,
+            queue_password_reset_completed_notification,
+        )
+
+        metrics.reset()
+        queue_account_created_notification(self.user)
+        queue_password_reset_completed_notification(self.user)
+        mock_send.side_effect = [None, RuntimeError("provider down")]
+
+        process_pending_email_jobs()
+
+        samples = {(name, tuple(labels.values())): value for name, labels, value in metrics.email_jobs.samples()}
+        self.assertEqual(samples[("ordinaly_email_jobs_total", ("account_created", "sent"))], 1)
+        self.assertEqual(samples[("ordinaly_email_jobs_total", ("password_reset_completed", "retried"))], 1)
+        ages = [value for name, _labels, value in metrics.email_job_age.samples() if name.endswith("_count")]
+        self.assertEqual(sum(ages), 2)
+
     @patch("users.services.email_service._send_email")
     def test_course_enrollment_and_cancellation_notifications_are_compulsory(self, mock_send):
         from datetime import timedelta
@@ -1363,3 +1492,297 @@ class EmailNotificationPreferenceTests(TestCase):
             EmailNotificationJob.objects.filter(notification_type="course_reminder_24h").count(),
             1,
         )
+
+
+@override_settings(EMAIL_DISPATCH_ASYNC=False, EMAIL_OTP_RESEND_COOLDOWN_SECONDS=60)
+class VerificationEmailQueueTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="queued-otp@example.com",
+            username="queued_otp_user",
+            password=TEST_PASSWORD,
+            name="Queued",
+            surname="OTP",
+            company="Ordinaly",
+        )
+
+    @patch("users.services.email_service.send_verification_email")
+    def test_job_is_sent_after_commit_with_fresh_code(self, mock_send):
+        from users.models import EmailNotificationJob, EmailVerificationOTP
+        from users.services.notification_service import queue_and_dispatch_verification_email
+        from users.services.otp_service import hash_code
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            job = queue_and_dispatch_verification_email(self.user)
+        self.assertEqual(job.priority, EmailNotificationJob.PRIORITY_HIGH)
+        self.assertNotIn("code", job.payload)
+        mock_send.assert_not_called()
+
+        for callback in callbacks:
+            callback()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, EmailNotificationJob.STATUS_SENT)
+        email, code = mock_send.call_args[0]
+        self.assertEqual(email, self.user.email)
+        self.assertEqual(
+            EmailVerificationOTP.objects.get(user=self.user, invalidated_at__isnull=True).code_hash,
+            hash_code(code),
+        )
+
+    @patch("users.services.email_service.send_verification_email")
+    def test_repeated_signins_within_cooldown_send_once(self, mock_send):
+        from users.models import EmailNotificationJob
+
+        for _ in range(3):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    '/api/users/signin/',
+                    {'emailOrUsername': self.user.email, 'password': TEST_PASSWORD},
+                    format='json',
+                )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.client.credentials()
+
+        self.assertEqual(mock_send.call_count, 1)
+        self.assertEqual(
+            EmailNotificationJob.objects.filter(notification_type="email_verification").count(),
+            1,
+        )
+
+    @patch("users.services.email_service.send_verification_email")
+    def test_new_address_is_not_coalesced(self, mock_send):
+        from users.services.notification_service import queue_verification_email
+
+        first = queue_verification_email(self.user)
+        second = queue_verification_email(self.user, "other-address@example.com")
+        self.assertNotEqual(first.pk, second.pk)
+        self.assertEqual(queue_verification_email(self.user, "other-address@example.com").pk, second.pk)
+
+    @patch("users.services.email_service.send_verification_email")
+    def test_switching_back_to_an_address_sends_a_fresh_code(self, mock_send):
+        from users.models import EmailNotificationJob
+        from users.services.notification_service import dispatch_email_job_now, queue_verification_email
+
+        first = queue_verification_email(self.user)
+        self.assertTrue(dispatch_email_job_now(first))
+        self.assertTrue(dispatch_email_job_now(queue_verification_email(self.user, "other-address@example.com")))
+
+        again = queue_verification_email(self.user)
+
+        self.assertNotEqual(again.pk, first.pk)
+        self.assertEqual(again.status, EmailNotificationJob.STATUS_PENDING)
+        self.assertEqual(queue_verification_email(self.user).pk, again.pk)
+
+    @patch("users.services.email_service.send_verification_email")
+    def test_verified_user_is_skipped_at_send_time(self, mock_send):
+        from users.services.notification_service import dispatch_email_job_now, queue_verification_email
+
+        job = queue_verification_email(self.user)
+        self.user.email_verified_at = timezone.now()
+        self.user.save(update_fields=["email_verified_at"])
+        self.assertTrue(dispatch_email_job_now(job))
+        mock_send.assert_not_called()
+
+
+class CachedTokenAuthenticationTests(APITestCase):
+    def setUp(self):
+        from users.services.token_cache import get_token_cache
+        self.token_cache = get_token_cache()
+        self.token_cache.clear()
+        self.token_cache.reset_stats()
+        self.user = CustomUser.objects.create_user(
+            email="cached-token@example.com",
+            username="cached_token_user",
+            password=TEST_PASSWORD,
+            name="Cached",
+            surname="Token",
+            company="Ordinaly",
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_second_request_needs_no_auth_queries(self):
+        self.assertEqual(self.client.get('/api/users/check_role/').status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/users/check_role/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        stats = self.token_cache.stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["local_hits"], 1)
+
+    def test_signout_invalidates_cached_token(self):
+        self.client.get('/api/users/profile/')
+        self.assertEqual(self.client.post('/api/users/signout/').status_code, status.HTTP_200_OK)
+        response = self.client.get('/api/users/profile/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_delete_profile_invalidates_cached_token(self):
+        self.client.get('/api/users/profile/')
+        self.client.delete('/api/users/delete_profile/')
+        response = self.client.get('/api/users/profile/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivation_invalidates_cached_token(self):
+        self.client.get('/api/users/profile/')
+        self.user.is_active = False
+        self.user.save(update_fields=['is_active'])
+        response = self.client.get('/api/users/profile/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_refreshes_snapshot(self):
+        self.client.get('/api/users/profile/')
+        self.user.set_password("another-strong-pass-123")
+        self.user.save(update_fields=['password'])
+        response = self.client.get('/api/users/profile/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.token_cache.stats()["misses"], 2)
+
+    def test_profile_update_is_visible_immediately(self):
+        self.client.get('/api/users/profile/')
+        self.client.patch('/api/users/update_profile/', {'name': 'Renamed'}, format='json')
+        response = self.client.get('/api/users/profile/')
+        self.assertEqual(response.data['name'], 'Renamed')
+
+    def test_invalidation_reaches_other_workers(self):
+        from users.services.token_cache import TokenSnapshotCache
+
+        other_worker = TokenSnapshotCache()
+        self.client.get('/api/users/profile/')
+        other_worker.set(self.token.key, self.token_cache.get(self.token.key))
+        self.assertIsNotNone(other_worker.get(self.token.key))
+
+        self.token_cache.invalidate(self.token.key)
+        self.assertIsNone(other_worker.get(self.token.key))
+
+    def test_user_save_revokes_without_token_query(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from users.services.token_cache import TokenSnapshotCache
+
+        other_worker = TokenSnapshotCache()
+        self.client.get('/api/users/profile/')
+        other_worker.set(self.token.key, self.token_cache.get(self.token.key))
+        with CaptureQueriesContext(connection) as queries:
+            self.user.save(update_fields=['is_active'])
+        self.assertFalse([q for q in queries if "authtoken_token" in q["sql"]])
+        self.assertIsNone(other_worker.get(self.token.key))
+
+    def test_snapshot_leaves_out_password_hash(self):
+        self.client.get('/api/users/profile/')
+        snapshot = self.token_cache.get(self.token.key)
+        self.assertNotIn("password", snapshot["user"])
+
+
+@override_settings(
+    AUTH_THROTTLE_ENABLED=True,
+    AUTH_THROTTLE_RATES={"signin": {"ip": "5/min", "identifier": "2/min"}},
+)
+class AuthThrottleTests(APITestCase):
+    def setUp(self):
+        from .throttling import reset_auth_throttle_stats
+        reset_caches()
+        reset_auth_throttle_stats()
+        self.url = '/api/users/signin/'
+
+    def _signin(self, identifier, remote_addr='10.0.0.1', **extra):
+        return self.client.post(
+            self.url,
+            {'emailOrUsername': identifier, 'password': 'wrong-password'},
+            format='json',
+            REMOTE_ADDR=remote_addr,
+            **extra
+        )
+
+    def test_identifier_bucket_limits_attempts_per_account(self):
+        from .throttling import auth_throttle_stats
+        self.assertEqual(self._signin('victim@example.com').status_code, 401)
+        self.assertEqual(self._signin('victim@example.com', '10.0.0.2').status_code, 401)
+
+        response = self._signin('VICTIM@example.com', '10.0.0.3')
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(auth_throttle_stats()['throttled'], {'signin.identifier': 1})
+
+    def test_ip_bucket_limits_attempts_across_accounts(self):
+        for i in range(5):
+            self.assertEqual(self._signin(f'user{i}@example.com').status_code, 401)
+
+        self.assertEqual(self._signin('other@example.com').status_code, 429)
+        self.assertEqual(self._signin('other@example.com', '10.0.0.9').status_code, 401)
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1})
+    def test_ip_bucket_ignores_forged_forwarded_for_entries(self):
+        for i in range(5):
+            forwarded = f'198.51.100.{i}, 203.0.113.7'
+            self.assertEqual(self._signin(f'user{i}@example.com', HTTP_X_FORWARDED_FOR=forwarded).status_code, 401)
+
+        response = self._signin('other@example.com', HTTP_X_FORWARDED_FOR='198.51.100.99, 203.0.113.7')
+        self.assertEqual(response.status_code, 429)
+        response = self._signin('other@example.com', HTTP_X_FORWARDED_FOR='198.51.100.99, 203.0.113.8')
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(AUTH_THROTTLE_LOCK_WAIT_SECONDS=0)
+    def test_busy_bucket_lock_throttles_the_request(self):
+        from django.core.cache import caches
+        from .throttling import AuthIPThrottle
+        key = AuthIPThrottle().get_cache_key('signin', '10.0.0.1')
+        cache = caches[settings.AUTH_THROTTLE_CACHE_ALIAS]
+        cache.add(f'{key}:lock', 1, timeout=5)
+        self.addCleanup(cache.delete, f'{key}:lock')
+
+        response = self._signin('victim@example.com')
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '1')
+
+    @override_settings(AUTH_THROTTLE_ENABLED=False)
+    def test_disabled_throttle_allows_requests(self):
+        for _ in range(4):
+            self.assertEqual(self._signin('victim@example.com').status_code, 401)
+
+
+class PasswordCheckSheddingTests(APITestCase):
+    def setUp(self):
+        from .throttling import reset_auth_throttle_stats
+        reset_caches()
+        reset_auth_throttle_stats()
+
+    @override_settings(AUTH_PASSWORD_CHECK_WAIT_SECONDS=0, AUTH_LOAD_SHED_RETRY_AFTER_SECONDS=3)
+    def test_signin_is_shed_when_all_slots_are_busy(self):
+        from .throttling import _get_password_check_slots, auth_throttle_stats
+        slots = _get_password_check_slots()
+        acquired = 0
+        while slots.acquire(blocking=False):
+            acquired += 1
+        try:
+            response = self.client.post(
+                '/api/users/signin/',
+                {'emailOrUsername': 'someone@example.com', 'password': 'irrelevant'},
+                format='json',
+            )
+        finally:
+            for _ in range(acquired):
+                slots.release()
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '3')
+        self.assertEqual(auth_throttle_stats()['shed'], 1)
+
+
+class UserQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_user(
+            username='budget_admin', email='budget-admin@example.com', password=TEST_PASSWORD, is_staff=True,
+        )
+
+    def _users(self, start, stop):
+        CustomUser.objects.bulk_create([
+            CustomUser(username=f'user{index}', email=f'user{index}@example.com', name='Generated', surname='User')
+            for index in range(start, stop)
+        ])
+
+    def test_user_list(self):
+        self.client.force_authenticate(self.admin)
+        self.assertQueryBudget('/api/users/', budget=1, populate=self._users)
@@ -0,0 +1,241 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_KEY_PREFIX = "auth-throttle"
+LOCK_POLL_SECONDS = 0.005
+IDENTIFIER_FIELDS = ("emailOrUsername", "email", "username")
+
+_PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate):
+    """Turn ``"10/min"`` into ``(capacity, refill_per_second)``."""
+    if not rate:
+        return None
+    count, period = rate.split("/")
+    capacity = int(count)
+    return capacity, capacity / _PERIODS[period[0]]
+
+
+class AuthThrottleStats:
+    """Process-local counters for throttled and shed authentication requests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._allowed = {}
+        self._throttled = {}
+        self._shed = 0
+
+    def allowed(self, scope):
+        with self._lock:
+            self._allowed[scope] = self._allowed.get(scope, 0) + 1
+
+    def throttled(self, scope, kind):
+        name = f"{scope}.{kind}"
+        with self._lock:
+            self._throttled[name] = self._throttled.get(name, 0) + 1
+
+    def shed(self):
+        with self._lock:
+            self._shed += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "allowed": dict(self._allowed),
+                "throttled": dict(self._throttled),
+                "shed": self._shed,
+            }
+
+    def reset(self):
+        with self._lock:
+            self._allowed.clear()
+            self._throttled.clear()
+            self._shed = 0
+
+
+_stats = AuthThrottleStats()
+
+
+def auth_throttle_stats():
+    return _stats.snapshot()
+
+
+def reset_auth_throttle_stats():
+    _stats.reset()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Cache-backed token bucket keyed per view scope.
+
+    Each bucket holds up to ``capacity`` requests and refills continuously, so
+    short bursts are allowed while the sustained rate stays bounded. Buckets
+    live in the shared cache so every worker draws from the same one, and
+    each read-modify-write holds a short ``add``-based lock on the bucket so
+    concurrent requests cannot spend the same token. A request that cannot
+    get the lock within ``AUTH_THROTTLE_LOCK_WAIT_SECONDS`` is throttled.
+    Views pick their bucket with ``throttle_scope``; rates come from
+    ``AUTH_THROTTLE_RATES[scope][kind]``.
+    """
+
+    kind = None
+
+    def __init__(self):
+        self._wait = None
+
+    @property
+    def cache(self):
+        return caches[settings.AUTH_THROTTLE_CACHE_ALIAS]
+
+    def get_rate(self, scope):
+        return parse_rate(settings.AUTH_THROTTLE_RATES.get(scope, {}).get(self.kind))
+
+    def get_ident_value(self, request, view):
+        raise NotImplementedError
+
+    def get_cache_key(self, scope, ident):
+        digest = hashlib.sha256(ident.encode()).hexdigest()[:32]
+        return f"{THROTTLE_KEY_PREFIX}:{scope}:{self.kind}:{digest}"
+
+    @contextmanager
+    def bucket_lock(self, key):
+        """Yield True while holding the bucket's lock, False if it stayed busy."""
+        lock_key = f"{key}:lock"
+        timeout = math.ceil(settings.AUTH_THROTTLE_LOCK_TIMEOUT_SECONDS)
+        deadline = time.monotonic() + settings.AUTH_THROTTLE_LOCK_WAIT_SECONDS
+        acquired = self.cache.add(lock_key, 1, timeout=timeout)
+        while not acquired and time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_SECONDS)
+            acquired = self.cache.add(lock_key, 1, timeout=timeout)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.cache.delete(lock_key)
+
+    def allow_request(self, request, view):
+        if not settings.AUTH_THROTTLE_ENABLED:
+            return True
+
+        scope = getattr(view, "throttle_scope", None)
+        rate = self.get_rate(scope) if scope else None
+        if rate is None:
+            return True
+
+        ident = self.get_ident_value(request, view)
+        if not ident:
+            return True
+
+        capacity, refill = rate
+        key = self.get_cache_key(scope, ident)
+        with self.bucket_lock(key) as locked:
+            if not locked:
+                self._wait = settings.AUTH_THROTTLE_LOCK_TIMEOUT_SECONDS
+                _stats.throttled(scope, self.kind)
+                return False
+            allowed = self._take(key, capacity, refill)
+
+        if allowed:
+            _stats.allowed(scope)
+        else:
+            _stats.throttled(scope, self.kind)
+        return allowed
+
+    def _take(self, key, capacity, refill):
+        now = time.time()
+        state = self.cache.get(key)
+        if state is None:
+            tokens = float(capacity)
+        else:
+            tokens, updated_at = state
+            tokens = min(capacity, tokens + (now - updated_at) * refill)
+
+        timeout = math.ceil(capacity / refill) if refill else None
+        if tokens < 1:
+            self._wait = (1 - tokens) / refill if refill else None
+            self.cache.set(key, (tokens, now), timeout=timeout)
+            return False
+
+        self.cache.set(key, (tokens - 1, now), timeout=timeout)
+        return True
+
+    def wait(self):
+        if self._wait is None:
+            return None
+        return max(1, math.ceil(self._wait))
+
+
+class AuthIPThrottle(TokenBucketThrottle):
+    """Limits how often a single client address can hit an auth endpoint.
+
+    The address comes from DRF's ``get_ident``: with ``NUM_PROXIES`` set it
+    is the ``X-Forwarded-For`` entry added by our own proxy, which clients
+    cannot forge, otherwise ``REMOTE_ADDR``.
+    """
+
+    kind = "ip"
+
+    def get_ident_value(self, request, view):
+        return self.get_ident(request)
+
+
+class AuthIdentifierThrottle(TokenBucketThrottle):
+    """Limits attempts against one account, whichever address they come from."""
+
+    kind = "identifier"
+
+    def get_ident_value(self, request, view):
+        data = getattr(request, "data", None) or {}
+        for field in IDENTIFIER_FIELDS:
+            value = data.get(field) if hasattr(data, "get") else None
+            if isinstance(value, str) and value.strip():
+                return value.strip().lower()
+        return None
+
+
+AUTH_THROTTLE_CLASSES = [AuthIPThrottle, AuthIdentifierThrottle]
+
+
+_password_check_slots = None
+_password_check_slots_lock = threading.Lock()
+
+
+def _get_password_check_slots():
+    global _password_check_slots
+    if _password_check_slots is None:
+        with _password_check_slots_lock:
+            if _password_check_slots is None:
+                _password_check_slots = threading.BoundedSemaphore(
+                    settings.AUTH_PASSWORD_CHECK_CONCURRENCY
+                )
+    return _password_check_slots
+
+
+@contextmanager
+def password_check_slot():
+    """Bound the number of concurrent password hashes in this process.
+
+    Requests that cannot get a slot within AUTH_PASSWORD_CHECK_WAIT_SECONDS
+    are rejected with 429 and Retry-After instead of queueing behind the
+    hasher and tying up the worker.
+    """
+    slots = _get_password_check_slots()
+    if not slots.acquire(timeout=settings.AUTH_PASSWORD_CHECK_WAIT_SECONDS):
+        _stats.shed()
+        logger.warning("Shedding password check: all %s slots busy", settings.AUTH_PASSWORD_CHECK_CONCURRENCY)
+        raise Throttled(wait=settings.AUTH_LOAD_SHED_RETRY_AFTER_SECONDS)
+    try:
+        yield
+    finally:
+        slots.release()
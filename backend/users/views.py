@@ -4,22 +4,25 @@ from rest_framework import viewsets, status
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework.authentication import TokenAuthentication
-from rest_framework.authtoken.models import Token
 from rest_framework.decorators import action
+from django.conf import settings
 from django.contrib.auth import authenticate
 from django.db import IntegrityError
 from django.db.models import Q
 from django.core.exceptions import ValidationError as DjangoValidationError
 from django.utils import timezone
+from authentication.utils import issue_token
+from .authentication import CachedTokenAuthentication
+from .throttling import AUTH_THROTTLE_CLASSES, password_check_slot
 from .models import CustomUser
 from .serializers import CustomUserSerializer
 from rest_framework.views import APIView 
 from rest_framework.response import Response 
 from .models import NewsletterSubscriber
-from .services.otp_service import create_otp_for_user
-from .services.email_service import send_verification_email
-from .services.notification_service import queue_and_dispatch_email_updated_notification
+from .services.notification_service import (
+    queue_and_dispatch_email_updated_notification,
+    queue_and_dispatch_verification_email,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -28,7 +31,9 @@ logger = logging.getLogger(__name__)
 class UserViewSet(viewsets.ModelViewSet):
     queryset = CustomUser.objects.all()
     serializer_class = CustomUserSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
+    # Set per action for the auth endpoints; see users.throttling.
+    throttle_scope = None
 
     def _validated_verified_email_change(self, user, raw_email):
         requested_email = (raw_email or "").strip()
@@ -55,8 +60,7 @@ class UserViewSet(viewsets.ModelViewSet):
         user.save(update_fields=["pending_email"])
 
         try:
-            code, _ = create_otp_for_user(user)
-            send_verification_email(requested_email, code)
+            queue_and_dispatch_verification_email(user, requested_email)
         except Exception:
             user.pending_email = previous_pending_email
             user.save(update_fields=["pending_email"])
@@ -81,7 +85,8 @@ class UserViewSet(viewsets.ModelViewSet):
             permission_classes = [IsAuthenticated]
         return [permission() for permission in permission_classes]
 
-    @action(detail=False, methods=['post'], permission_classes=[AllowAny])
+    @action(detail=False, methods=['post'], permission_classes=[AllowAny],
+            throttle_classes=AUTH_THROTTLE_CLASSES, throttle_scope='signup')
     def signup(self, request, *args, **kwargs):
         if request.user.is_authenticated:
             return Response({'detail': 'You are already signed in.'}, status=status.HTTP_400_BAD_REQUEST)
@@ -101,14 +106,13 @@ class UserViewSet(viewsets.ModelViewSet):
             return Response({'detail': 'An unexpected error occurred. Please try again.'},
                         status=status.HTTP_400_BAD_REQUEST)
 
-        # Create OTP and send verification email
+        # Queue the verification code email; it is sent after the response commits
         try:
-            code, _ = create_otp_for_user(user)
-            send_verification_email(user.email, code)
+            queue_and_dispatch_verification_email(user)
         except Exception:
-            logger.exception("Failed to send verification email for user %s", user.email)
+            logger.exception("Failed to queue verification email for user %s", user.email)
 
-        token, _ = Token.objects.get_or_create(user=user)
+        token = issue_token(user)
         headers = self.get_success_headers(serializer.data)
         response_data = serializer.data
         response_data['token'] = token.key
@@ -214,7 +218,8 @@ class UserViewSet(viewsets.ModelViewSet):
         self.perform_destroy(user)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-    @action(detail=False, methods=['post'], permission_classes=[AllowAny])
+    @action(detail=False, methods=['post'], permission_classes=[AllowAny],
+            throttle_classes=AUTH_THROTTLE_CLASSES, throttle_scope='signin')
     def signin(self, request):
         if request.user.is_authenticated:
             return Response({'detail': 'You are already signed in.'}, status=status.HTTP_400_BAD_REQUEST)
@@ -225,20 +230,21 @@ class UserViewSet(viewsets.ModelViewSet):
         if not email_or_username or not password:
             return Response({'detail': 'Email/Username and password are required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        user = authenticate(request, username=email_or_username, password=password)
+        with password_check_slot():
+            user = authenticate(request, username=email_or_username, password=password)
 
         if user is not None:
             user.last_login = timezone.now()
             user.save(update_fields=['last_login'])
-            token, _ = Token.objects.get_or_create(user=user)
+            token = issue_token(user, rotate=settings.AUTH_TOKEN_ROTATE_ON_LOGIN)
 
-            # Auto-send verification OTP for unverified users (including legacy users)
+            # Auto-send verification OTP for unverified users (including legacy users).
+            # Repeated signins inside the resend cooldown reuse the same queued email.
             if not user.email_verified_at:
                 try:
-                    code, _ = create_otp_for_user(user)
-                    send_verification_email(user.email, code)
+                    queue_and_dispatch_verification_email(user)
                 except Exception:
-                    logger.exception("Failed to send verification email on signin for user %s", user.email)
+                    logger.exception("Failed to queue verification email on signin for user %s", user.email)
 
             serializer = self.get_serializer(user)
             response_data = serializer.data